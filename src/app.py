@@ -1,71 +1,19 @@
-import os
-import json
+import ssl
+import asyncio
 import requests
-import hashlib
 import webbrowser
 import urllib.parse
-from uuid import UUID
+from bootstrap import bootstrap
 from environment import env
-from bot import Bot
-from flask import Flask, Response, make_response
-from flask import request as flask_request
-from database import engine, Base
-from sqlalchemy import insert, update
-from models import Subscriptions, ChannelPointRewards
+from events import EventDispatcher
+from eventsub import EventSubServer, Response, HOST, PORT, EVENT_PATH, check_secret
+from subscriptions import reconciler, desired
+from write_behind import WriteBehindQueue
+from event_bus import BusClient
 
-SUB_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
 CALLBACK = env.callback_address
-HOST = "localhost"
-PORT = "5000"
 LOCAL_ADDRESS = f"https://{HOST}:{PORT}"
-SECRET = "abc1234def"
-
-Base.metadata.create_all(bind=engine)
-app = Flask(__name__)
-
-# chat bot for sending messages
-bot = Bot(
-    env.irc_server,
-    env.irc_port,
-    env.oauth,
-    env.bot_name,
-    env.channel,
-    env.user_id,
-    env.client_id
-)
-bot.connect_to_channel()
-
-
-# TODO: values aren't matching expected
-# get sha256 value from headers
-def get_secret(headers:list) -> str:
-    message_id = headers["Twitch-Eventsub-Message-Id"]
-    timestamp = headers["Twitch-Eventsub-Message-Timestamp"]
-    body = flask_request.data
-
-    # concatenate different headers to pass into sha256 per Twitch documentation
-    hmac_message = message_id + timestamp + body.decode("utf-8")
-    result = hmac_message.encode(encoding="UTF-8", errors="strict")
-
-    # get output of sha256
-    signature = hashlib.sha256(result)
-
-    # twitch demands this concatenation for validation
-    return "sha256=" + signature.hexdigest()
-
-
-# check if header is valid
-def validate_headers(headers:dict) -> bool:
-    signature = get_secret(headers)
-    expected = headers["Twitch-Eventsub-Message-Signature"]
-
-    # check for matching sha256 values
-    print("SIGNATURE CHECK")
-    if signature == expected:
-        print("signature is valid")
-    else:
-        print("signature is invalid")
-    return signature == expected
+SECRET = env.eventsub_secret
 
 
 # TODO: re-establish user access with correct scopes
@@ -86,125 +34,18 @@ def request_user_auth(env=env):
     webbrowser.open(get_url)
 
 
-# write subscription parameters to the db
-def store_sub_info(sub_name:str, sub_id:str, sub_type:str) -> None:
-    entry = {
-        "sub_name": sub_name,
-        "sub_id": sub_id,
-        "sub_type": sub_type
-    }
-    engine.execute(
-        insert(Subscriptions)
-        .values(entry)
-    )
-
-
-# create a new eventsub subscription
-def create_subscription(callback:str, type_:str, env=env, content_type="application/json", 
-                        url=SUB_URL, secret=SECRET) -> dict:
-    headers = {
-        "Client-ID": env.client_id,
-        "Authorization": f"Bearer {env.get_app_access()}",
-        "Content-Type": content_type
-    }
-    data = {
-        "type": type_,
-        "version": "1",
-        "condition": {"broadcaster_user_id": str(env.user_id)},
-        "transport": {
-            "method": "webhook",
-            "callback": callback,
-            "secret": secret
-        }
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    print("SUBSCRIPTION REQUEST RESULT")
-    print(response.json())
-    return response.json()
-
-
-# delete an active subscription by id
-def delete_subscription(sub_id:str, env=env, url=SUB_URL) -> None:
-    headers = {
-        "Client-ID": env.client_id,
-        "Authorization": f"Bearer {env.get_app_access()}"
-    }
-    params = {"id": sub_id}
-    requests.delete(url=url, headers=headers, params=params) 
-
-
-# list active subscriptions
-def get_subscriptions(env=env, url=SUB_URL) -> dict:
-    headers = {
-        "Client-ID": env.client_id,
-        "Authorization": f"Bearer {env.get_app_access()}"
-    }
-    response = requests.get(url=url, headers=headers)
-    data = response.json()
-    subs = data["data"]
-
-    # key-values pair of sub types -> sub id
-    result = {}
-    for s in subs:
-        result[s["type"]] = s["id"]
-    return result
-
-
-def refresh_user_access(env=env) -> None:
-    base_url = "https://id.twitch.tv/oauth2/token"
-    params = {
-        "client_id": env.client_id,
-        "client_secret": env.client_secret,
-        "grant_type": "refresh_token",
-        "refresh_token": env.get_refresh_token()
-    }
-    if scopes:
-        params["scopes"] = " ".join(env.scopes)
-    url = base_url + "?" + urllib.parse.urlencode(params)
-    result = requests.post(url)
-
-
-# reply to Twitch's challenge when creating subscription
-def challenge_reply(payload):
-    challenge = payload["challenge"]
-    response = make_response(challenge, 200)
-    response.mimetype = "text/plain"
-    return response
-
-
-# default route
-@app.route("/")
-def hello_chat():
-    request_user_auth()
-    subs = get_subscriptions()
-    print(subs)
-    desired_subs = {
-        "channel.follow": CALLBACK+"/event/new_follower",
-        "channel.update": CALLBACK+"/event/stream_info_update",
-        "stream.online": CALLBACK+"/event/stream_online",
-        "stream.offline": CALLBACK+"/event/stream_offline",
-        "channel.channel_points_custom_reward_redemption.add": CALLBACK+"/event/cp_redemption"
-    }
-    
-    # for sub in subs:
-    #     delete_subscription(subs[sub])
+def refresh_user_access(env=env) -> str:
+    return env.refresh_user_access()
 
-    # create subs that are missing
-    for sub in desired_subs:
-        if sub not in subs:
-            create_subscription(desired_subs[sub], sub)
 
-    subs = get_subscriptions()
-    print("LIST OF CURRENT SUBSCRIPTIONS")
-    print([k for k,v in subs.items()])
-    return Response(status=200)
+# default route: ask for a reconcile pass; requests are merged, so hitting it repeatedly costs one pass
+async def hello_chat(request) -> Response:
+    reconciler.request()
+    return Response(200)
 
 
-# desperate attempt at authorizing
-@app.route("/authorize", methods=["GET", "POST"])
-def authorize():
-    # get code from Twitch's POST request
-    code = flask_request.args["code"]
+# exchange the code Twitch redirects back with for a user access token
+def store_user_access(code: str) -> None:
     print("AUTH CODE:\n" + code)
     
     # get user access token using the above code
@@ -224,141 +65,73 @@ def authorize():
     refresh_token = data["refresh_token"]
 
     # write user access token to DB
-    env.set_user_access(user_access)
+    env.set_user_access(user_access, data.get("expires_in"))
     print("USER ACCESS TOKEN WRITTEN")
 
     # write refresh token
     env.set_refresh_token(refresh_token)     
     print("REFRESH TOKEN WRITTEN")
 
-    return Response(status=200)
-
-
-# in the event of channel point redemption
-@app.route("/event/cp_redemption", methods=["POST"])
-def handle_cp():
-    print("CHANNEL POINT URL CALLED")
-    headers = flask_request.headers
-    message_type = headers["Twitch-Eventsub-Message-Type"]
-    payload = flask_request.json
-
-    # if callback is being used for validating a new subscription
-    if message_type == "webhook_callback_verification":
-        return challenge_reply(payload)
-
-    elif message_type == "notification":
-        # handle new channel point redemption
-        event = payload["event"]
-        reward = event["reward"]
-
-        # write cp data to db
-        entry = {
-            "event_id": UUID(event["id"]),
-            "reward_id": UUID(reward["id"]),
-            "title": reward["title"],
-            "cost": reward["cost"],
-            "user": event["user_name"]
-        }
-
-        engine.execute(
-            insert(ChannelPointRewards)
-            .values(entry)
-        )
-
-    else: 
-        print(flask_request.json)
-
-    return Response(status=200)
-
-
-# new follower function
-@app.route("/event/new_follower", methods=["POST"])
-def handle_follower():
-    print("FOLLOWER URL USED")
-    headers = flask_request.headers
-    message_type = headers["Twitch-Eventsub-Message-Type"]
-    payload = flask_request.json
-
-    # if callback is being used for validating a new subscription
-    if message_type == "webhook_callback_verification":
-        return challenge_reply(payload)
-
-    # if message is a follower notification 
-    elif message_type == "notification":
-        event = payload["event"]
-        user = event["user_name"]
-        bot.send_message(f"Welcome aboard, {user}!")
-
-    else:
-        print(flask_request.json)
-
-    return Response(status=200)
-
-
-# stream info changes
-@app.route("/event/stream_info_update", methods=["POST"])
-def handle_stream_info_update():
-    print("STREAM UPDATE LINK USED")
-    headers = flask_request.headers
-    message_type = headers["Twitch-Eventsub-Message-Type"]
-    payload = flask_request.json
-
-    if message_type == "webhook_callback_verification":
-        # validate with challenge from Twitch
-        return challenge_reply(payload)
 
-    elif message_type == "notification":
-        event = payload["event"]
-        title = event["title"]
-
-        print(f"The new title of the stream is:\n{title}")
-
-    else:
-        print(flask_request.json)
-
-    return Response(status=200)
-
-
-# stream goes online
-@app.route("/event/stream_online", methods=["POST"])
-def handle_stream_online():
-    headers = flask_request.headers
-    message_type = headers["Twitch-Eventsub-Message-Type"]
-    payload = flask_request.json
-
-    if message_type == "webhook_callback_verification":
-        return challenge_reply(payload)
-
-    elif message_type == "notification":
-        event = payload["event"]
-        engine.execute(insert(StreamUptime))
-
-    else:
-        print(flask_request.json)
-
-    return Response(status=200)
-
-
-# stream goes offline
-@app.route("/event/stream_offline", methods=["POST"])
-def handle_stream_offline():
-    headers = flask_request.headers
-    message_type = headers["Twitch-Eventsub-Message-Type"]
-    payload = flask_request.json
-
-    if message_type == "webhook_callback_verification":
-        return challenge_reply(payload)
-
-    elif message_type == "notification":
-        pass
-
-    else:
-        print(flask_request.json)
-
-    return Response(status=200)
+# desperate attempt at authorizing
+# without a code this starts re-authorization; Twitch redirects back here with one
+async def authorize(request) -> Response:
+    code = request.query.get("code")
+    if code is None:
+        await asyncio.to_thread(request_user_auth)
+        return Response(200)
+
+    # get code from Twitch's redirect
+    await asyncio.to_thread(store_user_access, code)
+    return Response(200)
+
+
+# notifications are stored by the events.EventHandler registered for their type, then published on bus
+def create_server(bus, db_writer: WriteBehindQueue, host:str = HOST, port:int = PORT) -> EventSubServer:
+    context = None
+    if env.ssl_cert:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(env.ssl_cert, env.ssl_key)
+
+    server = EventSubServer(SECRET, EventDispatcher(bus, db_writer), host, port, ssl=context,
+                            on_revocation=reconciler.request)
+    server.route("GET", "/", hello_chat)
+    server.route("GET", "/authorize", authorize)
+    server.route("POST", "/authorize", authorize)
+    return server
+
+
+# receive events and keep the subscriptions in place until cancelled
+# chat_bot.py --eventsub runs this next to the bots, publishing on their bus
+async def serve(bus, db_writer: WriteBehindQueue) -> None:
+    # before anything is declared, so a bad secret stops startup rather than the first pass
+    check_secret(SECRET)
+    server = create_server(bus, db_writer)
+
+    # a subscription for every type there's a handler for, for each channel served; the server has to be
+    # listening before they're created, since Twitch verifies the callback straight away
+    channel_ids = await asyncio.to_thread(lambda: env.channel_ids)
+    specs = [
+        spec
+        for user_id in channel_ids.values()
+        for spec in desired(list(server.dispatcher.handlers), CALLBACK + EVENT_PATH, user_id)
+    ]
+    await asyncio.to_thread(reconciler.declare, specs)
+    await server.start()
+    await asyncio.gather(server.run(), reconciler.run())
+
+
+# on its own, events go to chat_bot.py over the event bus socket; it holds the only IRC connection
+async def run() -> None:
+    await bootstrap()
+    bus = BusClient(env.event_bus_socket)
+    db_writer = WriteBehindQueue()
+    try:
+        await asyncio.gather(serve(bus, db_writer), bus.run(), db_writer.run(), env.tokens.run())
+    finally:
+        await db_writer.close()
 
 
 # run app
 if __name__ == "__main__":
-    app.run(debug=False, ssl_context="adhoc", host=HOST, port=PORT)
-
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+# rebuild timestamps for rows that got their process's start time instead of their own
+# the old datetime.now() default was evaluated once at import, so each run of the bot wrote every
+# row with the same value. that value is when the run started; the next row written after the
+# run (by id) bounds when it ended. rows in between are spread evenly across that span in id order.
+# only values from before migration 6 moved the defaults into the database are looked at: a stuck default
+# is its process's start time, so every one of them predates the fix, and later repeats are real
+# run from src/: python backfill_timestamps.py [--dry-run] [--min-group N] [table ...]
+import sys
+from sqlalchemy import text
+from database import engine
+
+# a timestamp from before the fix shared by at least this many rows is taken to be a stuck default
+MIN_GROUP = 3
+
+# the migration that replaced the import-time defaults with now()
+FIX_VERSION = 6
+
+# tables whose rows were written continuously by a long-running process, and their time column
+TABLES = {
+    "chat_messages": "time",
+    "command_use": "time",
+    "false_commands": "time",
+    "cp_rewards": "redeemed_at",
+}
+
+
+# when the fix was applied; now() if it hasn't been yet, since every process is still on the old defaults
+def fixed_at(conn):
+    return conn.execute(text(
+        "SELECT COALESCE((SELECT applied_at FROM schema_migrations WHERE version = :version), now())"
+    ), {"version": FIX_VERSION}).scalar()
+
+
+# one row per stuck timestamp: the value, its id range, row count and the upper bound
+def find_groups(conn, table: str, column: str, min_group:int = MIN_GROUP) -> list:
+    return conn.execute(text(f"""
+        WITH stuck AS (
+            SELECT {column} AS start, min(id) AS first_id, max(id) AS last_id, count(*) AS rows
+            FROM {table}
+            WHERE {column} < :fixed_at
+            GROUP BY {column}
+            HAVING count(*) >= :min_group
+        )
+        SELECT s.start, s.first_id, s.last_id, s.rows,
+               COALESCE(
+                   (SELECT min(t.{column}) FROM {table} t WHERE t.id > s.last_id AND t.{column} > s.start),
+                   now()
+               ) AS finish
+        FROM stuck s
+        ORDER BY s.start
+    """), {"min_group": min_group, "fixed_at": fixed_at(conn)}).fetchall()
+
+
+# spread each stuck group's rows from its start towards the next real timestamp
+def backfill(conn, table: str, column: str, min_group:int = MIN_GROUP) -> int:
+    result = conn.execute(text(f"""
+        WITH stuck AS (
+            SELECT {column} AS start, max(id) AS last_id, count(*) AS rows
+            FROM {table}
+            WHERE {column} < :fixed_at
+            GROUP BY {column}
+            HAVING count(*) >= :min_group
+        ),
+        bounds AS (
+            SELECT s.start, s.rows,
+                   COALESCE(
+                       (SELECT min(t.{column}) FROM {table} t WHERE t.id > s.last_id AND t.{column} > s.start),
+                       now()
+                   ) AS finish
+            FROM stuck s
+        ),
+        ranked AS (
+            SELECT t.id, b.start, b.finish, b.rows,
+                   row_number() OVER (PARTITION BY t.{column} ORDER BY t.id) - 1 AS position
+            FROM {table} t
+            JOIN bounds b ON t.{column} = b.start
+        )
+        UPDATE {table} t
+        SET {column} = r.start + (r.finish - r.start) * (r.position::float / r.rows)
+        FROM ranked r
+        WHERE t.id = r.id AND r.position > 0
+    """), {"min_group": min_group, "fixed_at": fixed_at(conn)})
+    return result.rowcount
+
+
+def main(tables: list = None, dry_run: bool = False, min_group:int = MIN_GROUP):
+    for table in tables or TABLES:
+        column = TABLES[table]
+        with engine.begin() as conn:
+            groups = find_groups(conn, table, column, min_group)
+            stuck_rows = sum(g.rows for g in groups)
+            print(f"{table}: {len(groups)} stuck timestamps covering {stuck_rows} rows")
+            for g in groups:
+                print(f"  {g.start} -> {g.finish}  ids {g.first_id}-{g.last_id}  ({g.rows} rows)")
+
+            if not dry_run and groups:
+                print(f"  updated {backfill(conn, table, column, min_group)} rows")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    min_group = MIN_GROUP
+    if "--min-group" in args:
+        i = args.index("--min-group")
+        min_group = int(args[i + 1])
+        del args[i:i + 2]
+    tables = [a for a in args if not a.startswith("--")]
+    main(tables, dry_run="--dry-run" in args, min_group=min_group)
@@ -0,0 +1,139 @@
+# post a burst of signed EventSub notifications at a local eventsub.EventSubServer
+# measures how fast notifications are acknowledged, and how long the handlers take to catch up
+# run from src/: python -m benchmarks.eventsub_load [notifications] [connections] [handler_ms] [window_ms]
+import sys
+import time
+import json
+import uuid
+import random
+import asyncio
+from datetime import datetime, timezone
+from eventsub import EventSubServer, EVENT_PATH, signature
+from events import EventDispatcher, EventHandler
+from benchmarks.replay_bench import percentile
+
+SECRET = "load-test-secret"
+NOTIFICATIONS = 5000
+CONNECTIONS = 50
+
+# share of notifications delivered twice, as Twitch does when an ack goes missing
+REDELIVERED = 0.1
+
+
+def follow_notification(i: int) -> dict:
+    return {
+        "subscription": {"id": "load-sub", "type": "channel.follow", "version": "1", "status": "enabled"},
+        "event": {
+            "user_id": str(100000 + i),
+            "user_login": f"user{i}",
+            "user_name": f"User{i}",
+            "broadcaster_user_login": "mitchsworkshop",
+            "followed_at": datetime.now(timezone.utc).isoformat()
+        }
+    }
+
+
+# stands in for a db write and chat message per batch of follows
+class SleepingFollowHandler(EventHandler):
+    def __init__(self, delay: float, batch_window: float):
+        super().__init__(None)
+        self.delay = delay
+        self.batch_window = batch_window
+
+
+    @property
+    def event_type(self):
+        return "channel.follow"
+
+
+    async def handle(self, events: list):
+        await asyncio.sleep(self.delay)
+
+
+# a request as Twitch sends it, signed with HMAC-SHA256 over id, timestamp and body
+def signed_request(payload: dict, secret: str = SECRET, path: str = EVENT_PATH,
+                   message_id: str = None) -> bytes:
+    body = json.dumps(payload).encode()
+    message_id = message_id or str(uuid.uuid4())
+    timestamp = datetime.now(timezone.utc).isoformat()
+    head = (
+        f"POST {path} HTTP/1.1\r\n"
+        f"Host: localhost\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Twitch-Eventsub-Message-Id: {message_id}\r\n"
+        f"Twitch-Eventsub-Message-Timestamp: {timestamp}\r\n"
+        f"Twitch-Eventsub-Message-Signature: {signature(secret, message_id, timestamp, body)}\r\n"
+        f"Twitch-Eventsub-Message-Type: notification\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+# read one response, returning its status
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    status = int(head.split(" ", 2)[1])
+    for line in head.split("\r\n"):
+        if line.lower().startswith("content-length:"):
+            await reader.readexactly(int(line.split(":")[1]))
+    return status
+
+
+# one keep-alive connection sending its share of the requests in turn, like Twitch's deliveries
+async def client(port: int, requests: list, latencies: list, statuses: dict) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for request in requests:
+        start = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        status = await read_response(reader)
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+    writer.close()
+    await writer.wait_closed()
+
+
+async def main(n: int = NOTIFICATIONS, connections: int = CONNECTIONS, handler_ms: float = 5,
+               window_ms: float = 50):
+    handler = SleepingFollowHandler(handler_ms / 1000, window_ms / 1000)
+    dispatcher = EventDispatcher(None, handlers=[handler])
+    server = EventSubServer(SECRET, dispatcher, "127.0.0.1", 0)
+    await server.start()
+    serving = asyncio.create_task(server.run())
+
+    # redeliveries reuse the message id, and should be acknowledged without being processed again
+    rng = random.Random(1)
+    ids = [str(uuid.uuid4()) for _ in range(n)]
+    requests = [signed_request(follow_notification(i), message_id=ids[i]) for i in range(n)]
+    requests += [signed_request(follow_notification(i), message_id=ids[i])
+                 for i in rng.sample(range(n), int(n * REDELIVERED))]
+
+    # and a few forgeries, which should be refused
+    requests += [signed_request(follow_notification(i), secret="wrong") for i in range(10)]
+    rng.shuffle(requests)
+    latencies = []
+    statuses = {}
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(server.port, requests[i::connections], latencies, statuses) for i in range(connections)
+    ))
+    acked = time.perf_counter() - start
+    await server.drain()
+    processed = time.perf_counter() - start
+
+    print(f"{len(requests)} requests ({n} notifications) over {connections} connections, "
+          f"{handler_ms:g} ms per batch, {window_ms:g} ms batch window")
+    print(f"  answered in {acked:.2f}s: {len(requests) / acked:.0f} req/s, statuses {statuses}")
+    print(f"  ack latency p50 {percentile(latencies, 0.5) * 1000:.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms  max {max(latencies) * 1000:.2f} ms")
+    print(f"  processed {dispatcher.processed} ({dispatcher.failed} failed) in {dispatcher.batches} "
+          f"batches in {processed:.2f}s, {server.duplicates} redeliveries skipped, {server.forged} forgeries refused")
+
+    serving.cancel()
+    await asyncio.gather(serving, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(*(int(a) for a in args[:2]), *(float(a) for a in args[2:4])))
@@ -0,0 +1,84 @@
+# exercise helix.HelixClient against the local helix stand-in
+# run from src/: python -m benchmarks.helix_bench [latency_ms]
+import sys
+import time
+import asyncio
+from helix import HelixClient
+from http_client import HTTPClient
+from benchmarks.stub_server import start_stub_server, FOLLOWERS
+
+
+# tokens for the stand-in, which doesn't check them
+class StubTokens():
+    refreshers = {}
+
+    def get(self, name: str) -> str:
+        return "stub"
+
+
+    async def get_async(self, name: str) -> str:
+        return "stub"
+
+
+def client_for(server) -> HelixClient:
+    return HelixClient(
+        client_id="stub", tokens=StubTokens(), base_url=server.api_urls()["HELIX_URL"],
+        http=HTTPClient(backoff_factor=0)
+    )
+
+
+# simulated work per page, standing in for copying it into the database
+async def process(page: list, delay: float) -> None:
+    await asyncio.sleep(delay)
+
+
+async def sequential(client: HelixClient, delay: float) -> int:
+    count = 0
+    params = {"to_id": "1", "first": 100}
+    while True:
+        body = await client.get("users/follows", params)
+        await process(body["data"], delay)
+        count += len(body["data"])
+        cursor = body["pagination"].get("cursor")
+        if not cursor:
+            return count
+        params["after"] = cursor
+
+
+async def pipelined(client: HelixClient, delay: float) -> int:
+    count = 0
+    async for page in client.pages("users/follows", {"to_id": "1"}):
+        await process(page, delay)
+        count += len(page)
+    return count
+
+
+async def main(latency_ms: float = 20):
+    latency = latency_ms / 1000
+
+    # pages take as long to fetch as to process, so overlapping them should halve the time
+    server = start_stub_server(delay=latency)
+    for name, walk in [("sequential", sequential), ("pipelined", pipelined)]:
+        client = client_for(server)
+        start = time.perf_counter()
+        count = await walk(client, latency)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {count}/{len(FOLLOWERS)} followers in {client.requests} requests, "
+              f"{elapsed * 1000:.1f} ms")
+        client.close()
+    server.shutdown()
+
+    # a bucket smaller than the walk: the client should wait for the reset instead of taking 429s
+    server = start_stub_server(rate_limit=4, rate_window=1.0)
+    client = client_for(server)
+    start = time.perf_counter()
+    count = len(await client.collect("users/follows", {"to_id": "1"}))
+    elapsed = time.perf_counter() - start
+    print(f"rate limited: {count} followers in {elapsed:.2f}s, waited {client.waited:.2f}s, "
+          f"{server.stats.get('429', 0)} 429 response(s)")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(float(a) for a in sys.argv[1:2])))
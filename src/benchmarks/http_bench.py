@@ -0,0 +1,38 @@
+# exercise http_client.HTTPClient against the local stub server
+# run from src/: python -m benchmarks.http_bench [requests]
+import sys
+import time
+import asyncio
+from http_client import HTTPClient
+from benchmarks.stub_server import start_stub_server
+
+
+async def main(n: int = 200):
+    server = start_stub_server()
+    urls = server.api_urls()
+    client = HTTPClient(backoff_factor=0)
+
+    # concurrent uncached requests, limited per host
+    start = time.perf_counter()
+    await asyncio.gather(*(client.get_json(urls["JOKE_URL"]) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    print(f"{n} pooled joke requests: {elapsed * 1000:.1f} ms ({n / elapsed:.0f} req/s)")
+
+    # cached corpus: concurrent misses share one request, later calls never leave the process
+    start = time.perf_counter()
+    await asyncio.gather(*(client.get_json(urls["POEM_URL"], ttl=60) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    print(f"{n} cached poem lookups: {elapsed * 1000:.1f} ms, server saw {server.stats['/poems']} request(s)")
+
+    # the flaky endpoint fails every other call; retries should hide that
+    # one at a time, since concurrent calls could each land on a failing turn
+    results = [await client.get_json(f"{server.base_url}/flaky") for _ in range(10)]
+    print(f"flaky endpoint: {sum(r['ok'] for r in results)}/10 succeeded after "
+          f"{server.stats['/flaky']} server hits")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(a) for a in sys.argv[1:2])))
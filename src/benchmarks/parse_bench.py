@@ -0,0 +1,68 @@
+# compare the old per-message regex parser with message.parse_privmsg
+# run from src/: python -m benchmarks.parse_bench
+import os
+import re
+import sys
+import timeit
+from message import parse_privmsg
+
+CORPUS = os.path.join(os.path.dirname(__file__), "twitch_corpus.txt")
+
+
+def load_corpus(path: str = CORPUS) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\r\n") for line in f if line.strip()]
+
+
+# the parser Bot.parse_message used before message.py, minus printing and storage
+def regex_parse(message: str):
+    try:
+        if not message.startswith("PING :"):
+            pat_message = re.compile(
+                fr"badges=(?P<badges>[^;]*).*color=(?P<color>[^;]*).*display-name=(?P<display_name>[^;]*).*emotes=(?P<emotes>[^;]*);.+user-id=(?P<user_id>[\d]+).+:(?P<username>[\d\w]+)![^:]+:(?P<text>.*)",
+                flags=re.IGNORECASE
+            )
+            message_data = pat_message.search(message).groupdict()
+            badges = re.sub(r"/\d+,?", " ", message_data["badges"]).split()
+            user_color = message_data["color"].lstrip("#")
+            if not user_color:
+                rgb = (56, 146, 66)
+            else:
+                rgb = tuple(int(user_color[i:i+2], 16) for i in (0,2,4))
+            return (message_data["username"], message_data["user_id"], message_data["text"], badges, rgb)
+    except AttributeError:
+        return None
+
+
+def slots_parse(message: str):
+    parsed = parse_privmsg(message)
+    if parsed is None:
+        return None
+    return (parsed.nick, parsed.tag("user-id"), parsed.text, parsed.badges, parsed.color)
+
+
+def bench(func, lines: list, repeat: int, number: int) -> float:
+    def run():
+        for line in lines:
+            func(line)
+    best = min(timeit.repeat(run, repeat=repeat, number=number))
+    return best / (number * len(lines))
+
+
+def main(repeat: int = 5, number: int = 200):
+    lines = load_corpus()
+    privmsgs = [l for l in lines if " PRIVMSG " in l]
+
+    # both parsers must agree on every chat message before timing means anything
+    for line in privmsgs:
+        assert regex_parse(line) == slots_parse(line), line
+
+    print(f"corpus: {len(lines)} lines, {len(privmsgs)} PRIVMSG")
+    for name, subset in (("all lines", lines), ("PRIVMSG only", privmsgs)):
+        old = bench(regex_parse, subset, repeat, number)
+        new = bench(slots_parse, subset, repeat, number)
+        print(f"{name:>13}: regex {old * 1e6:7.2f} us/line | message.py {new * 1e6:7.2f} us/line | {old / new:5.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,127 @@
+# time the bot's command queries as chat history grows, on a synthetic dataset
+# builds the tables with migrations.py in a scratch "bench" schema of the configured database
+# run from src/: python -m benchmarks.query_bench [rows,rows,...] [--partition] [--explain]
+import sys
+import time
+import statistics
+from sqlalchemy import create_engine, text
+from database import DB_FINAL_URL
+import migrations
+
+SCHEMA = "bench"
+SIZES = [100_000, 1_000_000, 3_000_000]
+CHANNELS = 20
+USERS = 50_000
+COMMANDS = 30
+RUNS = 20
+
+# name -> (sql, params); the ones the bot runs while answering chat commands
+QUERIES = {
+    "!uptime": (
+        "SELECT uptime FROM stream_uptime WHERE channel = :channel ORDER BY uptime DESC LIMIT 1",
+        {"channel": "channel7"}
+    ),
+    "!bottime": (
+        "SELECT uptime FROM bot_time ORDER BY uptime DESC LIMIT 1",
+        {}
+    ),
+    "messages by one user": (
+        "SELECT count(*) FROM chat_messages WHERE channel = :channel AND username = :user",
+        {"channel": "channel7", "user": "user1207"}
+    ),
+    "users of one command": (
+        'SELECT "user", count(*) FROM command_use WHERE channel = :channel AND command = :command '
+        'GROUP BY "user"',
+        {"channel": "channel7", "command": "!cmd7"}
+    ),
+    # scans every row of one channel by nature; RankIndex keeps it off the chat path
+    "leaderboard recount": (
+        "SELECT username, count(*) FROM chat_messages WHERE channel = :channel GROUP BY username",
+        {"channel": "channel7"}
+    ),
+}
+
+
+def fill(conn, start: int, end: int) -> None:
+    conn.execute(text("""
+        INSERT INTO chat_messages (time, username, user_id, message, channel)
+        SELECT now() - i * interval '1 second', 'user' || (i % :users), (i % :users)::text,
+               'message ' || i, 'channel' || (i % :channels)
+        FROM generate_series(:start, :end - 1) i
+    """), {"start": start, "end": end, "users": USERS, "channels": CHANNELS})
+
+    conn.execute(text("""
+        INSERT INTO command_use (time, "user", command, is_custom, channel)
+        SELECT now() - i * interval '10 seconds', 'user' || (i % :users), '!cmd' || (i % :commands),
+               0, 'channel' || (i % :channels)
+        FROM generate_series(:start / 10, :end / 10 - 1) i
+    """), {"start": start, "end": end, "users": USERS, "commands": COMMANDS, "channels": CHANNELS})
+
+    conn.execute(text("""
+        INSERT INTO stream_uptime (uptime, channel)
+        SELECT now() - i * interval '1 hour', 'channel' || (i % :channels)
+        FROM generate_series(:start / 1000, :end / 1000 - 1) i
+    """), {"start": start, "end": end, "channels": CHANNELS})
+
+    conn.execute(text("""
+        INSERT INTO bot_time (uptime)
+        SELECT now() - i * interval '1 hour' FROM generate_series(:start / 1000, :end / 1000 - 1) i
+    """), {"start": start, "end": end})
+
+    for table in ["chat_messages", "command_use", "stream_uptime", "bot_time"]:
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def time_query(conn, sql: str, params: dict) -> float:
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        conn.execute(text(sql), params).fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+# the plan each query gets at the largest size, to see which index it uses
+def explain(conn) -> None:
+    for name, (sql, params) in QUERIES.items():
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) {sql}"), params).fetchall()
+        print(f"\n{name}")
+        for (line,) in plan:
+            print(f"  {line}")
+
+
+def main(sizes: list = SIZES, partition: bool = False, show_plans: bool = False):
+    admin = create_engine(DB_FINAL_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    engine = create_engine(DB_FINAL_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    migrations.migrate(engine, partition_chat=partition)
+
+    print(f"{'rows':>10}  " + "  ".join(f"{name:>22}" for name in QUERIES))
+    rows = 0
+    try:
+        for size in sorted(sizes):
+            with engine.begin() as conn:
+                fill(conn, rows, size)
+            rows = size
+
+            with engine.connect() as conn:
+                medians = [time_query(conn, sql, params) for sql, params in QUERIES.values()]
+            print(f"{rows:>10}  " + "  ".join(f"{m * 1000:>19.2f} ms" for m in medians))
+
+        if show_plans:
+            with engine.connect() as conn:
+                explain(conn)
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        admin.dispose()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    sizes = [int(n) for n in args[0].split(",")] if args else SIZES
+    main(sizes, partition="--partition" in sys.argv, show_plans="--explain" in sys.argv)
@@ -0,0 +1,308 @@
+# replay an IRC transcript through the bot and measure how much chat it keeps up with
+# a local socket stands in for Twitch, the stub server for the external APIs and, unless --postgres
+# is given, a scratch SQLite file for the database
+# run from src/: python -m benchmarks.replay_bench [messages] [--corpus] [--postgres]
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import tempfile
+import tracemalloc
+import contextlib
+from sqlalchemy import create_engine, event, insert, text
+import command
+import migrations
+from bot import Bot
+from environment import env
+from tokens import CachedToken
+from irc import IRCConnection
+from models import Base, TextCommands
+from write_behind import WriteBehindQueue
+from text_commands import TextCommandCache
+from rank_index import Leaderboards
+from database import DB_FINAL_URL
+from benchmarks.stub_server import start_stub_server
+from benchmarks.parse_bench import load_corpus
+
+CHANNEL = "mitchsworkshop"
+USERS = 500
+MESSAGES = 20000
+
+# share of chat lines that are commands, and the ones used; !nope doesn't exist
+COMMAND_SHARE = 0.1
+COMMANDS = ["!joke", "!funfact", "!rank", "!uptime", "!lurk", "!leaderboard", "!commands", "!hello", "!nope"]
+
+# bytes per socket write, so lines are split across reads the way a busy channel's are
+CHUNK_SIZE = 4096
+
+# messages replayed with allocation tracing on, which is too slow for the throughput run
+TRACED_MESSAGES = 2000
+
+# tables the chat path touches; the rest need postgres types
+TABLES = ["chat_messages", "command_use", "text_commands", "false_commands", "bot_time", "stream_uptime",
+          "feature_requests"]
+
+SCHEMA = "replay_bench"
+
+
+def privmsg(nick: str, user_id: int, text: str, channel: str = CHANNEL) -> str:
+    color = f"{user_id * 2654435761 % 0xFFFFFF:06X}"
+    return (
+        f"@badge-info=;badges=;color=#{color};display-name={nick.title()};emotes=;first-msg=0;flags=;"
+        f"id={uuid.uuid4()};mod=0;room-id=1;subscriber=0;tmi-sent-ts=1633562354821;turbo=0;"
+        f"user-id={user_id};user-type= :{nick}!{nick}@{nick}.tmi.twitch.tv PRIVMSG #{channel} :{text}"
+    )
+
+
+# chat from a few hundred users, some of it commands, with the odd PING
+def synthetic_transcript(n: int = MESSAGES, users: int = USERS, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        if i % 1000 == 999:
+            lines.append("PING :tmi.twitch.tv")
+        user = rng.randrange(users)
+        if rng.random() < COMMAND_SHARE:
+            text = rng.choice(COMMANDS)
+        else:
+            text = " ".join(rng.choice(["hello", "pog", "nice", "lol", "gg", "what", "chat"])
+                            for _ in range(rng.randint(1, 12)))
+        lines.append(privmsg(f"user{user}", 100000 + user, text))
+    return lines
+
+
+# the recorded corpus, repeated up to n lines
+def corpus_transcript(n: int = MESSAGES) -> list:
+    corpus = load_corpus()
+    return [corpus[i % len(corpus)] for i in range(n)]
+
+
+# plays the part of Twitch: sends the transcript and collects what the bot says back
+class ReplayServer():
+    def __init__(self, lines: list):
+        self.data = "".join(line + "\r\n" for line in lines).encode()
+        self.received = []
+        self.server = None
+        self.done = None
+
+
+    async def handle(self, reader, writer) -> None:
+        async def collect():
+            while line := await reader.readline():
+                self.received.append(line)
+        collector = asyncio.create_task(collect())
+
+        for start in range(0, len(self.data), CHUNK_SIZE):
+            writer.write(self.data[start:start + CHUNK_SIZE])
+            await writer.drain()
+
+        # the bot hangs up once the replay is over
+        await collector
+        writer.close()
+        self.done.set()
+
+
+    async def start(self) -> int:
+        self.done = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+
+    async def stop(self) -> None:
+        await self.done.wait()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def sqlite_engine(path: str):
+    # rows are written from worker threads
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[Base.metadata.tables[t] for t in TABLES])
+    return engine
+
+
+# the bot's own schema, in a scratch schema of the configured postgres database
+@contextlib.contextmanager
+def postgres_engine():
+    admin = create_engine(DB_FINAL_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    engine = create_engine(DB_FINAL_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    try:
+        migrations.migrate(engine)
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        admin.dispose()
+
+
+# count statements sent to the database; an executemany is one round-trip
+class RoundTrips():
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+# replay lines through a bot, returning its timings
+async def replay(lines: list, engine, trace: bool = False) -> dict:
+    server = ReplayServer(lines)
+    port = await server.start()
+
+    bot = Bot(
+        server="127.0.0.1", port=port, oauth_token="bench", bot_name="benchbot", channel=CHANNEL,
+        client_id="bench", irc=IRCConnection("127.0.0.1", port), db_writer=WriteBehindQueue(engine)
+    )
+    bot.text_commands = TextCommandCache(CHANNEL, engine)
+    bot.leaderboards = Leaderboards(bot.db_writer, CHANNEL, engine)
+    await bot.load()
+
+    # time the synchronous part of each line and each command to completion
+    handle_times = []
+    command_times = []
+    handle_line = bot.handle_line
+    execute_command = bot.execute_command
+
+    def timed_handle_line(line):
+        start = time.perf_counter()
+        handle_line(line)
+        handle_times.append(time.perf_counter() - start)
+
+    async def timed_execute_command(*args):
+        start = time.perf_counter()
+        await execute_command(*args)
+        command_times.append(time.perf_counter() - start)
+
+    bot.handle_line = timed_handle_line
+    bot.execute_command = timed_execute_command
+
+    expected = sum(1 for line in lines if not line.startswith("PING"))
+    round_trips = RoundTrips(engine)
+    loop_tasks = []
+
+    # chat is printed to the terminal as it's handled; that's part of the cost, not of the output
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        await bot.connect_to_channel()
+        loop_tasks = [asyncio.create_task(c) for c in (
+            bot.irc.read_lines(), bot.irc.write_lines(), bot.dispatch_messages(), bot.db_writer.run(),
+            bot.outbound.run()
+        )]
+
+        while len(handle_times) < expected:
+            await asyncio.sleep(0.005)
+        ingested = time.perf_counter() - start
+
+        # commands still running and rows still queued
+        while bot.tasks:
+            await asyncio.gather(*bot.tasks, return_exceptions=True)
+        await bot.db_writer.flush()
+        elapsed = time.perf_counter() - start
+
+        if trace:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    event.remove(engine, "before_cursor_execute", round_trips.on_execute)
+    for task in loop_tasks:
+        task.cancel()
+    await asyncio.gather(*loop_tasks, return_exceptions=True)
+    for pool in command.content_pools:
+        await pool.stop()
+    await bot.irc.close()
+    await server.stop()
+
+    result = {
+        "messages": expected,
+        "ingested": ingested,
+        "elapsed": elapsed,
+        "handle_p50": percentile(handle_times, 0.5),
+        "handle_p99": percentile(handle_times, 0.99),
+        "commands": len(command_times),
+        "command_p50": percentile(command_times, 0.5),
+        "command_p99": percentile(command_times, 0.99),
+        "round_trips": round_trips.count,
+        "written": bot.db_writer.written,
+        "replies": len(server.received),
+    }
+    if trace:
+        result["retained"] = current
+        result["peak"] = peak
+    return result
+
+
+def seed(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(TextCommands).values(channel=CHANNEL, command="!hello", message="Hello there!"))
+
+
+def report(result: dict) -> None:
+    n = result["messages"]
+    print(f"{n} messages read and handled in {result['ingested']:.2f}s: {n / result['ingested']:.0f} msg/s, "
+          f"{result['elapsed']:.2f}s until every command finished and row was written")
+    print(f"  handler    p50 {result['handle_p50'] * 1e6:8.1f} us   p99 {result['handle_p99'] * 1e6:8.1f} us")
+    print(f"  commands   p50 {result['command_p50'] * 1e3:8.2f} ms   p99 {result['command_p99'] * 1e3:8.2f} ms"
+          f"   ({result['commands']} run)")
+    print(f"  database   {result['round_trips']} round-trips, {result['round_trips'] / n:.3f} per message, "
+          f"{result['written']} rows written")
+    print(f"  replies    {result['replies']} lines sent back")
+
+
+async def run(lines: list, engine, directory: str) -> None:
+    # the bot's API calls go to the stub server
+    stub = start_stub_server()
+    for name, url in stub.api_urls().items():
+        if hasattr(command, name):
+            setattr(command, name, url)
+    command.engine = engine
+
+    # stub jokes and facts stay out of the bot's saved pools
+    for pool in command.content_pools:
+        pool.path = os.path.join(directory, f"{pool.name}_pool.json")
+
+    # !so asks for a token; the stub doesn't check it
+    env.tokens.cache["Bearer"] = CachedToken("bench")
+
+    seed(engine)
+    report(await replay(lines, engine))
+
+    traced = await replay(lines[:TRACED_MESSAGES], engine, trace=True)
+    n = traced["messages"]
+    print(f"  memory     {traced['peak'] / 1024:.0f} KiB peak, {traced['retained'] / n:.0f} B retained per "
+          f"message over {n} traced messages")
+    stub.shutdown()
+
+
+def main(n: int = MESSAGES, corpus: bool = False, postgres: bool = False):
+    lines = corpus_transcript(n) if corpus else synthetic_transcript(n)
+    with tempfile.TemporaryDirectory() as directory:
+        if postgres:
+            with postgres_engine() as engine:
+                asyncio.run(run(lines, engine, directory))
+            return
+
+        engine = sqlite_engine(os.path.join(directory, "replay.db"))
+        asyncio.run(run(lines, engine, directory))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    main(*(int(a) for a in args[:1]), corpus="--corpus" in sys.argv, postgres="--postgres" in sys.argv)
@@ -0,0 +1,39 @@
+# time cold imports of the bot's modules, each in a fresh interpreter
+# importing must not need the network or a database, so this runs offline
+# run from src/: python -m benchmarks.startup_bench [runs] [--bootstrap]
+import sys
+import time
+import asyncio
+import statistics
+import subprocess
+
+MODULES = ["database", "environment", "models", "command", "bot", "channels", "chat_bot", "app"]
+
+
+def import_time(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+# schema, tokens and user id; needs credentials.env, Postgres and Twitch
+async def time_bootstrap() -> float:
+    from bootstrap import bootstrap
+    start = time.perf_counter()
+    await bootstrap()
+    return time.perf_counter() - start
+
+
+def main(runs: int = 5, with_bootstrap: bool = False):
+    for module in MODULES:
+        times = [import_time(module) for _ in range(runs)]
+        print(f"import {module:12} median {statistics.median(times) * 1000:7.1f} ms  "
+              f"max {max(times) * 1000:7.1f} ms")
+
+    if with_bootstrap:
+        print(f"bootstrap: {asyncio.run(time_bootstrap()) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    main(*(int(a) for a in args[:1]), with_bootstrap="--bootstrap" in sys.argv)
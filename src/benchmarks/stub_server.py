@@ -0,0 +1,214 @@
+# local stand-in for the external APIs the bot calls, for offline runs
+# run from src/: python -m benchmarks.stub_server [port]
+import json
+import random
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+JOKES = [
+    "I'm reading a book about anti-gravity. It's impossible to put down.",
+    "Why don't eggs tell jokes? They'd crack each other up.",
+    "I used to hate facial hair, but then it grew on me.",
+    "What do you call a fake noodle? An impasta.",
+]
+
+FACTS = [
+    "Honey never spoils.",
+    "Octopuses have three hearts.",
+    "Bananas are berries, but strawberries aren't.",
+]
+
+POEMS = [
+    {"title": f"Stub Poem {i}", "author": "Stub", "linecount": "4",
+     "lines": [f"line one of {i}", "line two", "line three", "line four"]}
+    for i in range(200)
+]
+
+# synthetic followers served by the helix stand-in
+FOLLOWERS = [
+    {"from_id": str(100000 + i), "from_name": f"follower{i}", "followed_at": "2021-06-01T12:00:00Z"}
+    for i in range(1000)
+]
+
+SUBSCRIPTIONS = [
+    {"id": f"sub-{i}", "type": t, "status": "enabled"}
+    for i, t in enumerate(["channel.follow", "channel.subscribe", "stream.online", "stream.offline",
+                           "channel.channel_points_custom_reward_redemption.add"])
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive so connection reuse can be observed
+    protocol_version = "HTTP/1.1"
+
+    # headers and body go out as separate writes; with Nagle on, each response waits on a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+    # a helix page of items, with the offset of the next page as the cursor
+    def send_page(self, items: list, query: dict, headers: dict) -> None:
+        start = int(query.get("after", 0))
+        first = min(int(query.get("first", 20)), 100)
+        page = items[start:start + first]
+        pagination = {"cursor": str(start + first)} if start + first < len(items) else {}
+        self.send_json({"total": len(items), "data": page, "pagination": pagination}, headers=headers)
+
+
+    def send_json(self, data, status:int = 200, headers:dict = None) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k,v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def send_text(self, text: str, status:int = 200) -> None:
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k:v[0] for k,v in parse_qs(url.query).items()}
+        stats = self.server.stats
+        stats[url.path] = stats.get(url.path, 0) + 1
+
+        # numbered, so callers that skip repeats see a fresh one every time like the real APIs
+        if url.path == "/joke":
+            self.send_json({"id": "stub", "joke": f"{random.choice(JOKES)} #{stats[url.path]}", "status": 200})
+
+        elif url.path == "/poems":
+            self.send_json(POEMS)
+
+        elif url.path == "/fact":
+            self.send_json({"id": "stub", "text": f"{random.choice(FACTS)} #{stats[url.path]}"})
+
+        elif url.path.startswith("/year/"):
+            year = url.path.split("/")[2]
+            self.send_text(f"{year} is the year that a stub server answered a question.")
+
+        # fails every other request so retries can be observed
+        elif url.path == "/flaky":
+            if stats[url.path] % 2:
+                self.send_json({"error": "try again"}, status=503)
+            else:
+                self.send_json({"ok": True})
+
+        elif url.path.startswith("/helix/"):
+            self.helix(url.path, query)
+
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+
+    # twitch's rate limit headers on every helix response; 429 once the bucket is empty
+    def helix(self, path: str, query: dict) -> None:
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        headers = self.server.take_helix_request()
+        if headers is None:
+            headers = self.server.rate_limit_headers()
+            self.send_json({"error": "Too Many Requests", "status": 429}, status=429, headers=headers)
+            return
+
+        if path == "/helix/users/follows":
+            self.send_page(FOLLOWERS, query, headers)
+
+        elif path == "/helix/eventsub/subscriptions":
+            self.send_page(SUBSCRIPTIONS, query, headers)
+
+        elif path == "/helix/search/channels":
+            login = query.get("query", "").lower()
+            self.send_json({"data": [{"broadcaster_login": login, "display_name": login.title()}]}, headers=headers)
+
+        else:
+            self.send_json({"error": "not found"}, status=404, headers=headers)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler=StubHandler, rate_limit:int = 800, rate_window:float = 60.0,
+                delay:float = 0.0):
+        super().__init__(address, handler)
+        # request counts per path
+        self.stats = {}
+
+        # helix stand-in: a bucket of rate_limit requests, refilled whole every rate_window seconds,
+        # and seconds of simulated latency per request
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.delay = delay
+        self.remaining = rate_limit
+        self.reset = time.time() + rate_window
+        self.rate_lock = threading.Lock()
+
+
+    def rate_limit_headers(self) -> dict:
+        return {
+            "Ratelimit-Limit": str(self.rate_limit),
+            "Ratelimit-Remaining": str(self.remaining),
+            "Ratelimit-Reset": f"{self.reset:.3f}"
+        }
+
+
+    # take a request from the bucket; its headers, or None when it's empty
+    def take_helix_request(self):
+        with self.rate_lock:
+            now = time.time()
+            if now >= self.reset:
+                self.remaining = self.rate_limit
+                self.reset = now + self.rate_window
+            if self.remaining <= 0:
+                self.stats["429"] = self.stats.get("429", 0) + 1
+                return None
+            self.remaining -= 1
+            return self.rate_limit_headers()
+
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    # urls matching the constants in command.py
+    def api_urls(self) -> dict:
+        return {
+            "JOKE_URL": f"{self.base_url}/joke",
+            "POEM_URL": f"{self.base_url}/poems",
+            "FACT_URL": f"{self.base_url}/fact",
+            "YEAR_URL": f"{self.base_url}/year/{{year}}",
+            "CHANNEL_SEARCH_URL": f"{self.base_url}/helix/search/channels",
+            "HELIX_URL": f"{self.base_url}/helix",
+        }
+
+
+# start a stub server on a background thread; port 0 picks a free port
+def start_stub_server(port:int = 0, handler=StubHandler, **options) -> StubServer:
+    server = StubServer(("127.0.0.1", port), handler, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    server = StubServer(("127.0.0.1", port))
+    print(f"stub APIs on {server.base_url}")
+    for name, url in server.api_urls().items():
+        print(f"  {name} = {url}")
+    server.serve_forever()
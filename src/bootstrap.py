@@ -0,0 +1,46 @@
+import asyncio
+import database
+import migrations
+from environment import env
+
+# importing any module is free of network and database work;
+# entry points call bootstrap() once before running
+
+# the one setup run every caller waits on, so callers racing at startup don't set up twice
+task = None
+
+
+# create the database and apply pending migrations
+def create_schema() -> None:
+    database.create_database()
+    migrations.migrate()
+
+
+# set up the schema, then tokens and user ids
+# tokens are loaded from and saved to the tokens table, so they wait for the schema;
+# the token requests run side by side
+async def setup() -> None:
+    await asyncio.to_thread(create_schema)
+
+    # tokens saved by an earlier run are reused until they're close to expiring
+    await asyncio.gather(
+        asyncio.to_thread(env.tokens.ensure, ["Bearer"]),
+        asyncio.to_thread(env.tokens.ensure, ["App_Access"])
+    )
+
+    # read from the cache file after the first run
+    await asyncio.to_thread(lambda: env.user_id)
+    await asyncio.to_thread(lambda: env.channel_ids)
+
+
+# a failed setup is tried again by the next caller
+async def bootstrap() -> None:
+    global task
+    if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+        task = asyncio.ensure_future(setup())
+    await task
+
+
+# for scripts that don't run an event loop
+def run() -> None:
+    asyncio.run(bootstrap())
@@ -1,25 +1,24 @@
-import re
-import socket
+import asyncio
 import command
+from irc import IRCConnection
+from message import parse, parse_privmsg
+from outbound import OutboundScheduler, PRIORITY_NORMAL, PRIORITY_LOW
+from write_behind import WriteBehindQueue
+import text_commands
+from text_commands import TextCommandCache
+from rank_index import Leaderboards
 from environment import env
-from datetime import datetime
-from sqlalchemy import insert, select
-from database import Session, Base, engine
-from models import ChatMessages, CommandUse, FalseCommands, BotTime, TextCommands
-
-session = Session()
-Base.metadata.create_all(bind=engine)
-
-def get_text_commands() -> dict:
-    command_rows = engine.execute(select(TextCommands.command, TextCommands.message))
-    text_commands = {k:v for k,v in [e for e in command_rows]}
-    return text_commands
-
+from datetime import datetime, timezone
+from models import ChatMessages, CommandUse, FalseCommands
 
+# chat bot for one channel
+# run() gives it its own connection; channels.ChannelManager instead passes in a shared
+# connection, db writer and account rate limit and feeds it the lines for its channel
 class Bot():
     def __init__(self, server:str = env.irc_server, port:int = env.irc_port, oauth_token:str = env.oauth, 
-                bot_name:str = env.bot_name, channel:str = env.channel, user_id:str = env.user_id, 
-                client_id:str = env.client_id):
+                bot_name:str = env.bot_name, channel:str = env.channel, user_id:str = None, 
+                client_id:str = env.client_id, irc: IRCConnection = None, db_writer: WriteBehindQueue = None,
+                account_bucket = None):
         self.server = server
         self.port = port
         self.oauth_token = oauth_token
@@ -28,160 +27,238 @@ class Bot():
         self.user_id = user_id
         self.client_id = client_id
         self.commands = {s.command_name: s for s in (c(self) for c in command.CommandBase.__subclasses__())}
-        self.text_commands = get_text_commands()
 
+        # text commands are read from memory; add/edit/delete keep it in sync with the db
+        self.text_commands = TextCommandCache(self.channel)
+        self.irc = irc or IRCConnection(self.server, self.port)
+
+        # chat messages are paced under Twitch's rate limits; the broadcaster gets the mod limit
+        self.outbound = OutboundScheduler(
+            self.irc.send,
+            self.channel,
+            is_moderator=self.bot_name.lower() == self.channel.lower(),
+            account_bucket=account_bucket
+        )
+
+        # chat, command and false command rows are written in batches
+        # an empty queue is falsy, so a shared one is checked against None
+        self.db_writer = db_writer if db_writer is not None else WriteBehindQueue()
+
+        # chat and command ranks, seeded once and updated as rows are stored
+        self.leaderboards = Leaderboards(self.db_writer, self.channel)
+
+        # references to running handler tasks so they aren't garbage collected
+        self.tasks = set()
+
+
+    # read text commands and leaderboard counts; nothing touches the database before this
+    async def load(self):
+        await asyncio.gather(
+            asyncio.to_thread(self.text_commands.load),
+            asyncio.to_thread(self.leaderboards.load)
+        )
+
+
+    # connect to IRC server and join the channel
+    async def connect_to_channel(self):
+        await self.irc.connect()
+
+        # start filling joke, poem and fact pools before anyone asks
+        for pool in command.content_pools:
+            pool.start()
 
-    # connect to IRC server and begin checking for messages
-    def connect_to_channel(self):
-        self.irc = socket.socket()
-        self.irc.connect((self.server, self.port))
         self.irc_command(f"PASS oauth:{self.oauth_token}")
         self.irc_command(f"NICK {self.bot_name}")
         self.irc_command(f"JOIN #{self.channel}")        
-        self.irc_command(f"CAP REQ :twitch.tv/tags")
+        self.irc_command(f"CAP REQ :twitch.tv/tags twitch.tv/commands")
         self.send_message("I AM ALIVE!!")
 
     
     # execute IRC commands
     def irc_command(self, command: str):
-        self.irc.send((command + "\r\n").encode())
+        self.irc.send(command)
 
 
     # send privmsg's, which are normal chat messages
-    def send_message(self, message: str):
-        self.irc_command(f"PRIVMSG #{self.channel} :{message}")
+    # safe to call from other threads
+    def send_message(self, message: str, priority: int = PRIORITY_NORMAL):
+        self.outbound.call(self.outbound.submit, message, priority)
+
+
+    # send one item of a message that's merged with others of the same key
+    # e.g. send_grouped("welcome", user, "Welcome aboard, {}!")
+    def send_grouped(self, key: str, item: str, template: str, priority: int = PRIORITY_LOW):
+        self.outbound.call(self.outbound.submit_grouped, key, item, template, priority)
+
+
+    # tasks that belong to this channel alone
+    def background_tasks(self) -> list:
+        return [
+            self.outbound.run(),
+            self.leaderboards.reconcile_forever()
+        ]
 
 
     # main loop
-    def check_for_messages(self):
+    # reading, dispatching and writing run concurrently so a slow handler never stalls ingestion
+    async def check_for_messages(self):
+        await asyncio.gather(
+            self.irc.read_lines(),
+            self.irc.write_lines(),
+            self.dispatch_messages(),
+            self.db_writer.run(),
+            text_commands.listen({self.channel: self.text_commands}),
+            *self.background_tasks()
+        )
+
+
+    # connect and process messages until cancelled
+    async def run(self):
+        await asyncio.gather(self.load(), self.connect_to_channel())
+        try:
+            await self.check_for_messages()
+        finally:
+            for pool in command.content_pools:
+                await pool.stop()
+            await self.db_writer.close()
+            await self.irc.close()
+
+
+    # hand each received line to the parser
+    async def dispatch_messages(self):
         while True:
-            messages = self.irc.recv(1024).decode()
+            self.handle_line(await self.irc.inbox.get())
+
+
+    def handle_line(self, line: str):
+        parsed = parse(line)
+        if parsed is not None:
+            self.handle_message(parsed)
+
 
-            # respond to pings from Twitch
-            if messages.startswith("PING"):
-                self.irc_command("PONG :tmi.twitch.tv")
-                continue
-                
-            for m in messages.split("\r\n"):
-                self.parse_message(m)
+    # react to a parsed line from this channel
+    def handle_message(self, parsed):
+        if parsed.command == "PRIVMSG":
+            self.handle_chat(parsed)
+        elif parsed.command == "USERSTATE":
+            self.update_user_state(parsed)
+
+
+    # an EventSub event for this channel, from the event bus
+    def handle_event(self, event_type: str, event: dict):
+        if event_type == "channel.follow":
+            # a follow burst is merged into one welcome line
+            self.send_grouped("welcome", event["user_name"], "Welcome aboard, {}!")
+
+        for c in self.commands.values():
+            c.on_event(event_type, event)
+
+
+    # twitch sends the bot's own badges on join and after it speaks
+    def update_user_state(self, parsed):
+        badges = parsed.badges
+        is_moderator = parsed.tag("mod") == "1" or "moderator" in badges or "broadcaster" in badges
+        self.outbound.set_moderator(is_moderator)
+
+
+    # schedule a coroutine on the event loop without waiting for it
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(self.task_done)
+        return task
+
+
+    # report a failed handler here, rather than as an unretrieved exception whenever it's collected
+    def task_done(self, task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"command failed: {task.exception()!r}")
 
 
     # check for command being executed
     def parse_message(self, message: str):
-        try:
-            if not message.startswith("PING :"):
-                # regex pattern
-                pat_message = re.compile(
-                    fr"badges=(?P<badges>[^;]*).*color=(?P<color>[^;]*).*display-name=(?P<display_name>[^;]*).*emotes=(?P<emotes>[^;]*);.+user-id=(?P<user_id>[\d]+).+:(?P<username>[\d\w]+)![^:]+:(?P<text>.*)",
-                    flags=re.IGNORECASE
-                )
-
-                # get all message data as dict by group name
-                message_data = pat_message.search(message).groupdict() 
-
-                # TODO: emote storage
-                # emotes look like:
-                # 86:0-9,11-20,22-31,33-42,44-53
-
-                # convert badges string to list of badges
-                badges = re.sub("/\d+,?", " ", message_data["badges"]).split() 
-
-                text = message_data["text"]
-                user = message_data["username"]
-                display_name = message_data["display_name"]
-                chatter_id = message_data["user_id"]
-                user_color = message_data["color"].lstrip("#")
-
-                # set color of username for display in terminal
-                default_color = (56, 146, 66)
-                if not user_color:
-                    rgb = default_color
-                else:
-                    # convert hex to RGB tuple
-                    rgb = tuple(int(user_color[i:i+2], 16) for i in (0,2,4))
-                    
-                # print colored chat message to terminal
-                print(f"\033[38;2;{rgb[0]};{rgb[1]};{rgb[2]}m" + f"{display_name}" + "\033[38;2;255;255;255m", f"{text}\n")
-
-                # check for commands being used
-                if text.startswith("!"):
-                    command = text.split()[0].lower()
-                    if command not in self.text_commands and command not in self.commands:
-                        self.store_wrong_command(user, command)
-                    else:
-                        self.execute_command(user, command, text, badges)
-                self.store_message_data(user, chatter_id, text)
-
-        except AttributeError:
-            pass
+        # anything other than a chat message is ignored
+        parsed = parse_privmsg(message)
+        if parsed is not None:
+            self.handle_chat(parsed)
+
+
+    def handle_chat(self, parsed):
+        # TODO: emote storage
+        # emotes look like:
+        # 86:0-9,11-20,22-31,33-42,44-53
+
+        text = parsed.text
+        user = parsed.nick
+        display_name = parsed.tag("display-name", user)
+        chatter_id = parsed.tag("user-id")
+        badges = parsed.badges
+        rgb = parsed.color
+
+        # print colored chat message to terminal
+        print(f"\033[38;2;{rgb[0]};{rgb[1]};{rgb[2]}m" + f"{display_name}" + "\033[38;2;255;255;255m", f"{text}\n")
+
+        # check for commands being used
+        if text.startswith("!"):
+            command = text.split()[0].lower()
+            if command not in self.text_commands and command not in self.commands:
+                self.store_wrong_command(user, command)
+            else:
+                self.spawn(self.execute_command(user, command, text, badges))
+        self.store_message_data(user, chatter_id, text)
 
 
     # store data on commands attempted that don't exist
+    # rows are queued and written in bulk, so the time is taken when queued
     def store_wrong_command(self, user: str, command: str):
         entry = {
+            "time" : datetime.now(timezone.utc),
+            "channel" : self.channel,
             "user" : user,
             "command" : command
         }
-        
-        engine.execute(
-             insert(FalseCommands)
-             .values(entry)
-        )
+        self.db_writer.add(FalseCommands, entry)
         
 
     # insert data to db
     def store_message_data(self, user: str, user_id: str, message: str) -> None:
         entry = {
+            "time" : datetime.now(timezone.utc),
+            "channel" : self.channel,
             "username" : user,
             "user_id" : user_id,
             "message" : message
         }
-        
-        engine.execute(
-            insert(ChatMessages)
-            .values(entry)
-        )
+        self.db_writer.add(ChatMessages, entry)
+        self.leaderboards.record_message(user)
         
 
-    # insert data to SQLite db
+    # insert data to db
     def store_command_data(self, user: str, command: str, is_custom: int):
         entry = {
+            "time" : datetime.now(timezone.utc),
+            "channel" : self.channel,
             "user" : user,
             "command" : command,
             "is_custom" : is_custom
         }
-        engine.execute(
-            insert(CommandUse)
-            .values(entry)
-        )
+        self.db_writer.add(CommandUse, entry)
+        self.leaderboards.record_command(user, command)
 
 
     # execute each command
-    def execute_command(self, user: str, command: str, message: str, badges: list):
+    async def execute_command(self, user: str, command: str, message: str, badges: list):
         # execute hard-coded command
         if command in self.commands.keys():
-            self.commands[command].execute(user, message, badges) 
+            await self.commands[command].execute(user, message, badges) 
             is_custom_command = 0 
             self.store_command_data(user, command, is_custom_command)
 
-            # refresh text commands dict if admin command used
-            if self.commands[command].restricted:
-                self.text_commands = self.reload_text_commands()
-
         # execute custom text commands
-        elif command in self.text_commands.keys():
+        elif command in self.text_commands:
             self.send_message(
                 self.text_commands[command]
             )
             is_custom_command = 1
             self.store_command_data(user, command, is_custom_command)
-
-
-    def reload_text_commands(self):
-        stmt = select(
-            TextCommands.command,
-            TextCommands.message
-        )
-        commands = {k:v for k,v in [e for e in engine.execute(stmt)]}
-        return commands
-
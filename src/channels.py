@@ -0,0 +1,120 @@
+import asyncio
+import command
+import text_commands
+from bot import Bot
+from irc import IRCConnection
+from message import parse
+from outbound import TokenBucket, MOD_LIMIT, LIMIT_WINDOW
+from write_behind import WriteBehindQueue
+from event_bus import EventBus, bus
+from environment import env
+
+# channels joined over a single IRC connection
+CHANNELS_PER_CONNECTION = 50
+
+# Twitch allows an account 20 JOINs every 10 seconds
+JOIN_LIMIT = 20
+JOIN_WINDOW = 10
+
+
+# runs one Bot per channel in a single process
+# channels share a few IRC connections, one db writer, the content pools,
+# one LISTEN connection and the account's chat and JOIN rate limits
+# EventSub events published on the bus are handed to the bot for the channel they're about
+class ChannelManager():
+    def __init__(self, channels: list, server:str = env.irc_server, port:int = env.irc_port,
+                oauth_token:str = env.oauth, bot_name:str = env.bot_name, client_id:str = env.client_id,
+                per_connection:int = CHANNELS_PER_CONNECTION, bus: EventBus = bus, user_ids: dict = None):
+        self.server = server
+        self.port = port
+        self.oauth_token = oauth_token
+        self.bot_name = bot_name
+        self.channels = [c.lower().lstrip("#") for c in channels]
+        self.bus = bus
+
+        # each channel's broadcaster id, by login
+        self.user_ids = user_ids if user_ids is not None else env.load_user_ids(self.channels)
+
+        self.db_writer = WriteBehindQueue()
+
+        # Twitch counts messages per account across every channel, on top of each channel's limit
+        self.account_bucket = TokenBucket(MOD_LIMIT, LIMIT_WINDOW)
+        self.join_bucket = TokenBucket(JOIN_LIMIT, JOIN_WINDOW)
+
+        # connection -> channels joined on it
+        self.connections = {}
+        self.bots = {}
+        for i in range(0, len(self.channels), per_connection):
+            irc = IRCConnection(server, port)
+            self.connections[irc] = self.channels[i:i + per_connection]
+            for channel in self.connections[irc]:
+                self.bots[channel] = Bot(
+                    server, port, oauth_token, bot_name, channel,
+                    self.user_ids.get(channel),
+                    client_id,
+                    irc=irc,
+                    db_writer=self.db_writer,
+                    account_bucket=self.account_bucket
+                )
+
+
+    # open every connection and log in; channels are joined separately, under the JOIN limit
+    async def connect(self) -> None:
+        for irc in self.connections:
+            await irc.connect()
+            irc.send(f"PASS oauth:{self.oauth_token}")
+            irc.send(f"NICK {self.bot_name}")
+            irc.send("CAP REQ :twitch.tv/tags twitch.tv/commands")
+
+        for pool in command.content_pools:
+            pool.start()
+
+
+    async def join_channels(self) -> None:
+        for irc, channels in self.connections.items():
+            for channel in channels:
+                while not self.join_bucket.try_take():
+                    await asyncio.sleep(self.join_bucket.wait_time())
+                irc.send(f"JOIN #{channel}")
+                self.bots[channel].send_message("I AM ALIVE!!")
+
+
+    # hand each line from a connection to the bot for its channel
+    async def route(self, irc: IRCConnection) -> None:
+        while True:
+            parsed = parse(await irc.inbox.get())
+            if parsed is None:
+                continue
+
+            bot = self.bots.get(parsed.channel)
+            if bot is not None:
+                bot.handle_message(parsed)
+
+
+    def route_event(self, event_type: str, event: dict) -> None:
+        bot = self.bots.get(event.get("broadcaster_user_login", "").lower())
+        if bot is not None:
+            bot.handle_event(event_type, event)
+
+
+    # connect and process messages for every channel until cancelled
+    async def run(self) -> None:
+        await asyncio.gather(self.connect(), *(bot.load() for bot in self.bots.values()))
+        self.bus.subscribe("*", self.route_event)
+
+        tasks = [self.join_channels(), self.db_writer.run()]
+        tasks.append(text_commands.listen({c: b.text_commands for c,b in self.bots.items()}))
+        for irc in self.connections:
+            tasks += [irc.read_lines(), irc.write_lines(), self.route(irc)]
+        for bot in self.bots.values():
+            tasks += bot.background_tasks()
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.bus.unsubscribe("*", self.route_event)
+            for pool in command.content_pools:
+                await pool.stop()
+            await self.db_writer.close()
+            for irc in self.connections:
+                await irc.close()
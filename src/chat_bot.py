@@ -1,26 +1,75 @@
-from sqlalchemy import select, update, insert
-from bot import Bot
+import sys
+import asyncio
+from sqlalchemy import insert
+from bootstrap import bootstrap
+from channels import ChannelManager
+from rollups import RollupEngine, UPDATE_INTERVAL
+from scheduler import Scheduler
 from environment import env
-from datetime import datetime
-from sqlalchemy import select, insert
-from database import Base, Session, engine
-from models import TextCommands, BotTime 
+from event_bus import bus, BusServer
+from database import engine
+from models import BotTime
+import view_tracker
+import follower_tracker
+import app
 
+# seconds of random delay added to each job run, so jobs sharing an interval don't fire together
+JOB_JITTER = 5
 
-def main():
-    # create all tables
-    Base.metadata.create_all(bind=engine)
+# seconds between job timing reports in the log
+REPORT_INTERVAL = 600
+
+
+# follows come in while a channel is live; offline syncs would only spend api quota
+async def sync_live_followers() -> dict:
+    return await follower_tracker.refresh_follow_tables(sorted(view_tracker.sampler.live))
+
+
+# periodic jobs that used to run as their own processes, each paying for a full startup
+def create_scheduler() -> Scheduler:
+    scheduler = Scheduler()
+    scheduler.add("viewership", view_tracker.sampler.sample, view_tracker.SAMPLE_INTERVAL, JOB_JITTER)
+
+    scheduler.add("followers", sync_live_followers, follower_tracker.SYNC_INTERVAL,
+                  JOB_JITTER, when=view_tracker.is_live)
+
+    # dashboards read the rollups, which are kept current from here
+    scheduler.add("rollups", RollupEngine().update, UPDATE_INTERVAL, JOB_JITTER)
+    scheduler.add("report", lambda: print(scheduler.report()), REPORT_INTERVAL)
+    return scheduler
+
+
+# eventsub: receive EventSub webhooks in this process too, instead of running app.py alongside
+async def run(eventsub: bool = False):
+    # create the schema and refresh tokens
+    await bootstrap()
 
     # log bot startup time
-    engine.execute(insert(BotTime))
+    await asyncio.to_thread(engine.execute, insert(BotTime))
+
+    # every configured channel, sharing connections in this process
+    manager = ChannelManager(env.channels, bus=bus, user_ids=env.channel_ids)
+
+    scheduler = create_scheduler()
+    tasks = [manager.run(), env.tokens.run(), scheduler.run()]
+    if eventsub:
+        tasks.append(app.serve(bus, manager.db_writer))
+    else:
+        # events from app.py running as its own process
+        tasks.append(BusServer(bus, env.event_bus_socket).run())
 
-    bot = Bot()
-    bot.connect_to_channel()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # samples still waiting for their batch
+        await view_tracker.sampler.close()
 
+
+# run from src/: python chat_bot.py [--eventsub]
+def main():
     # loop forever
-    bot.check_for_messages()
+    asyncio.run(run(eventsub="--eventsub" in sys.argv))
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,17 +1,57 @@
-import requests
 import re
+import asyncio
 import random
-import json
-from datetime import datetime
+import requests
+from datetime import datetime, timezone
 from dateutil import relativedelta
 from abc import ABC, abstractmethod
-from sqlalchemy import select, insert, delete, update, func
-from database import engine, Session, Base
-from models import BotTime, Followers, TextCommands, ChatMessages, CommandUse, FeatureRequest, StreamUptime
+from sqlalchemy import select, insert
+from database import engine
+from models import BotTime, FeatureRequest, StreamUptime
 from environment import env
+from http_client import http
+from content_pool import ContentPool
+from eventsub import parse_timestamp
+from outbound import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+# external APIs used by the fun commands
+JOKE_URL = "https://icanhazdadjoke.com/"
+POEM_URL = "https://poetrydb.org/linecount/4/lines"
+FACT_URL = "https://uselessfacts.jsph.pl/random.json?language=en"
+YEAR_URL = "http://numbersapi.com/{year}/year"
+CHANNEL_SEARCH_URL = "https://api.twitch.tv/helix/search/channels"
+
+# the poem corpus rarely changes, so it's fetched once a day and sampled locally
+POEM_TTL = 24 * 60 * 60
+
+# channel search results for !so
+SEARCH_TTL = 5 * 60
+
+# poems drawn from the cached corpus per pool refill
+POEMS_PER_FETCH = 10
+
+
+async def fetch_jokes() -> list:
+    result = await http.get_json(JOKE_URL, headers={"accept" : "application/json"})
+    return [result["joke"]]
+
 
-Base.metadata.create_all(bind=engine)
-session = Session()
+async def fetch_poems() -> list:
+    poems = await http.get_json(POEM_URL, ttl=POEM_TTL)
+    chosen = random.sample(poems, min(POEMS_PER_FETCH, len(poems)))
+    return ["; ".join(p["lines"]) for p in chosen]
+
+
+async def fetch_facts() -> list:
+    result = await http.get_json(FACT_URL)
+    return [result["text"]]
+
+
+# replies for !joke, !poem and !funfact are fetched ahead of time
+joke_pool = ContentPool("joke", fetch_jokes)
+poem_pool = ContentPool("poem", fetch_poems)
+fact_pool = ContentPool("fact", fetch_facts, max_length=450)
+content_pools = [joke_pool, poem_pool, fact_pool]
 
 class CommandBase(ABC):
     def __init__(self, bot):
@@ -29,45 +69,48 @@ class CommandBase(ABC):
         return False
 
 
+    # replies from restricted commands go out first, fun commands can wait
+    @property
+    def priority(self):
+        return PRIORITY_HIGH if self.restricted else PRIORITY_NORMAL
+
+
+    def send_message(self, message):
+        self.bot.send_message(message, priority=self.priority)
+
+
     @abstractmethod
-    def execute(self):
+    async def execute(self):
         raise NotImplementedError
 
 
+    # EventSub events for the bot's channel, from the event bus; e.g. to drop state a stream change makes stale
+    def on_event(self, event_type: str, event: dict):
+        pass
+
+
     def __repr__(self):
         return self.command_name
 
 
     def get_commands(self):
         # get all text commands
-        result = engine.execute(select(TextCommands.command)).fetchall()
-        text_commands = [c[0] for c in result]
+        text_commands = list(self.bot.text_commands)
         return [*text_commands, *self.bot.commands] 
 
 
+    # users ranked by number of times they used a given command
     def get_command_users(self, command):
-        # query database for number of times each user used a given command
-        result = engine.execute(
-            select(CommandUse.user)
-            .where(CommandUse.command == command)
-            .group_by(CommandUse.user)
-            .order_by(func.count(CommandUse.user).desc())
-        )
-        return [u[0] for u in result]
+        return self.bot.leaderboards.command_index(command)
 
 
+    # chatters ranked by number of messages sent
     def get_top_chatters(self):
-        # get count of unique chatters from chat_messages table
-        result = engine.execute(
-            select(ChatMessages.username)
-            .group_by(ChatMessages.username)
-            .order_by(func.count(ChatMessages.username).desc())
-        )
-        return [u[0] for u in result]
+        return self.bot.leaderboards.chatters
 
 
     def get_timedelta_message(self, uptime, message_base, error_message) -> str:
-        now = datetime.now()
+        now = datetime.now(timezone.utc)
 
         # get timedelta
         delta = relativedelta.relativedelta(now, uptime)
@@ -103,14 +146,14 @@ class AddCommand(CommandBase):
     def restricted(self):
         return True
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         # only mods can run this command
         if "moderator" in badges or "broadcaster" in badges:
             first_word = message.split()[1].lower()
 
             # check for invalid characters in command name
             if re.match(r"[^a-zA-Z\d]", first_word):
-                self.bot.send_message(f"That command name contains invalid characters, {user}.")
+                self.send_message(f"That command name contains invalid characters, {user}.")
                 return
 
             command = first_word if first_word.startswith("!") else "!" + first_word
@@ -118,21 +161,19 @@ class AddCommand(CommandBase):
 
             # check for missing command output
             if len(result) == 0:
-                self.bot.send_message(f"Every command needs text, {user}.")
+                self.send_message(f"Every command needs text, {user}.")
                 return
 
             # check for duplicate command
-            if command in self.bot.text_commands.keys():
-                self.bot.send_message(f"That command already exists, {user}.")
+            if command in self.bot.text_commands:
+                self.send_message(f"That command already exists, {user}.")
                 return
 
-            entry = {"command":command, "message":result}
-            engine.execute(
-                insert(TextCommands)
-                .values(entry)
-            )
+            if not await self.bot.text_commands.add(command, result):
+                self.send_message(f"That command already exists, {user}.")
+                return
 
-            self.bot.send_message(f"{command} added successfully!")
+            self.send_message(f"{command} added successfully!")
 
 
 class DeleteCommand(CommandBase):
@@ -144,33 +185,26 @@ class DeleteCommand(CommandBase):
     def restricted(self):
         return True
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         # only mods can run this command
         if "moderator" in badges or "broadcaster" in badges:
             try:
                 first_word = message.split()[1]
             except IndexError:
-                self.bot.send_message("You didn't select a command to delete!")
+                self.send_message("You didn't select a command to delete!")
                 return
 
             command = first_word if first_word.startswith("!") else "!" + first_word
 
-            # select all commands from TextCommands table
-            result = engine.execute(select(TextCommands.command)).fetchall()
-            current_commands = [c[0] for c in result]
-
-            if command not in current_commands:
-                self.bot.send_message(f"The {command} command doesn't exist, {user}.")
+            if command not in self.bot.text_commands:
+                self.send_message(f"The {command} command doesn't exist, {user}.")
                 return
 
-            entry = {"command": command}
-
-            engine.execute(
-                delete(TextCommands)
-                .where(TextCommands.command == command)
-            )
+            if not await self.bot.text_commands.delete(command):
+                self.send_message(f"The {command} command doesn't exist, {user}.")
+                return
 
-            self.bot.send_message(f"{command} command deleted!")
+            self.send_message(f"{command} command deleted!")
 
 
 # edit existing text command
@@ -183,29 +217,24 @@ class EditCommand(CommandBase):
     def restricted(self):
         return True
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         # only mods and streamer can run this command
         if "moderator" in badges or "broadcaster" in badges:
             first_word = message.split()[1]
             command = first_word if first_word.startswith("!") else "!" + first_word
 
-            result = engine.execute(select(TextCommands.command)).fetchall()
-            current_commands = [c[0] for c in result]
-
-            if command not in current_commands:
-                self.bot.send_message(f"That command doesn't exist, {user}.")
+            if command not in self.bot.text_commands:
+                self.send_message(f"That command doesn't exist, {user}.")
                 return
 
             new_message = " ".join(message.split()[2:])
 
             # edit the message for a given command
-            engine.execute(
-                update(TextCommands)
-                .where(TextCommands.command == command)
-                .values(message=new_message)
-            )
-            
-            self.bot.send_message(f"{command} command edit complete!")
+            if not await self.bot.text_commands.edit(command, new_message):
+                self.send_message(f"That command doesn't exist, {user}.")
+                return
+
+            self.send_message(f"{command} command edit complete!")
 
 
 # check joke API for joke of length that fits in a chat message
@@ -214,19 +243,19 @@ class JokeCommand(CommandBase):
     def command_name(self):
         return "!joke"
 
+    @property
+    def priority(self):
+        return PRIORITY_LOW
+
 
-    def execute(self, user, message, badges):
-        max_message_len = 500
-        url = "https://icanhazdadjoke.com/"
-        headers = {"accept" : "application/json"}
-        for _ in range(10):
-            result = requests.get(url, headers = headers).json()
-            joke = result["joke"]
-            if len(joke) <= max_message_len:
-                self.bot.send_message(joke)
-                return
+    async def execute(self, user, message, badges):
+        # only jokes that fit in a chat message make it into the pool
+        joke = await joke_pool.get()
+        if joke:
+            self.send_message(joke)
+            return
 
-        self.bot.send_message(f"I'm sorry! I couldn't find a short enough joke. :(")
+        self.send_message(f"I'm sorry! I couldn't find a short enough joke. :(")
 
 
 class PoemCommand(CommandBase):
@@ -234,22 +263,18 @@ class PoemCommand(CommandBase):
     def command_name(self):
         return "!poem"
 
+    @property
+    def priority(self):
+        return PRIORITY_LOW
 
-    def execute(self, user, message, badges):
-        num_lines = 4
-        url = f"https://poetrydb.org/linecount/{num_lines}/lines"
-        result = requests.get(url)
-        poems = json.loads(result.text)
-        num_poems = len(poems)
-        for _ in range(5):
-            idx = random.randint(0, num_poems)
-            lines = poems[idx]["lines"]
-            poem = "; ".join(lines)
-            if len(poem) <= 500:
-                self.bot.send_message(poem)
-                return
 
-        self.bot.send_message(f"@{user}, I couldn't find a short enough poem. I'm sorry. :(")
+    async def execute(self, user, message, badges):
+        poem = await poem_pool.get()
+        if poem:
+            self.send_message(poem)
+            return
+
+        self.send_message(f"@{user}, I couldn't find a short enough poem. I'm sorry. :(")
 
 
 class CommandsCommand(CommandBase):
@@ -258,10 +283,9 @@ class CommandsCommand(CommandBase):
         return "!commands"
 
 
-    def execute(self, user, message, badges):
-        result = engine.execute(select(TextCommands.command)).fetchall()
+    async def execute(self, user, message, badges):
+        text_commands = list(self.bot.text_commands)
         subclasses = (s(self) for s in CommandBase.__subclasses__())
-        text_commands = [c[0] for c in result]
         hard_commands = [c.command_name for c in subclasses if not c.restricted]
 
         commands_str = ", ".join(text_commands) + ", " + ", ".join(hard_commands)
@@ -272,7 +296,7 @@ class CommandsCommand(CommandBase):
             commands = commands[:-2]
             commands_str = " ".join(commands)
 
-        self.bot.send_message(commands_str)
+        self.send_message(commands_str)
 
 
 # TODO: fill follower table with new script, update with eventsub
@@ -282,7 +306,7 @@ class CommandsCommand(CommandBase):
 #        return "!followage"
 #
 #
-#    def execute(self, user, message, badges):
+#    async def execute(self, user, message, badges):
 #        if len(message.split()) > 1:
 #            user = message.split()[1].strip("@").lower()
 #
@@ -295,7 +319,7 @@ class CommandsCommand(CommandBase):
 #        follow_time = user_entry[0]
 #        
 #        # current time
-#        now = datetime.now()
+#        now = datetime.now(timezone.utc)
 #
 #        # get time delta
 #        delta = relativedelta.relativedelta(now, follow_time)
@@ -317,7 +341,7 @@ class CommandsCommand(CommandBase):
 #        message += "!"
 #
 #        # send message
-#        self.bot.send_message(
+#        self.send_message(
 #            
 #            message
 #        )
@@ -329,12 +353,14 @@ class BotTimeCommand(CommandBase):
         return "!bottime"
 
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         # get most recent uptime
-        result = engine.execute(
+        result = (await asyncio.to_thread(
+            engine.execute,
             select(BotTime.uptime)
             .order_by(BotTime.uptime.desc())
-        ).fetchone()
+            .limit(1)
+        )).fetchone()
 
         uptime = result[0]
         message_base = "I have been alive for"
@@ -343,7 +369,7 @@ class BotTimeCommand(CommandBase):
         # create message from time delta
         message = self.get_timedelta_message(uptime, message_base, error_message)
 
-        self.bot.send_message(message)
+        self.send_message(message)
 
 
 class RankCommand(CommandBase):
@@ -352,7 +378,7 @@ class RankCommand(CommandBase):
         return "!rank"
 
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         if len(message.split()) > 1:
             command = message.split()[1]
 
@@ -363,36 +389,34 @@ class RankCommand(CommandBase):
             commands = self.get_commands()
 
             if command not in commands:
-                self.bot.send_message(f"I don't have a {command} command! Sorry!")
+                self.send_message(f"I don't have a {command} command! Sorry!")
                 return
 
-            # query database for number of times each user used a given command
+            # number of times each user used a given command
             users = self.get_command_users(command)
 
-            try:
-                user_rank = users.index(user) + 1
-            except ValueError:
-                self.bot.send_message(
+            user_rank = users.rank(user)
+            if user_rank is None:
+                self.send_message(
                     f"{user}, you haven't used that command since I've been listening. Sorry!"
                 )
                 return
 
             message = f"{user}, you are the number {user_rank} user of the {command} command out of {len(users)} users."
-            self.bot.send_message(message)
+            self.send_message(message)
 
         else:
             chatters = self.get_top_chatters()
 
-            try:
-                # find rank of a given user
-                user_rank = chatters.index(user) + 1
-
-                # send the rank in chat
-                message = f"{user}, you are number {user_rank} out of {len(chatters)} chatters!"
-                self.bot.send_message(message)
+            # find rank of a given user
+            user_rank = chatters.rank(user)
+            if user_rank is None:
+                self.send_message(f"{user}, I don't have you on my list. This is awkward...")
+                return
 
-            except ValueError:
-                self.bot.send_message(f"{user}, I don't have you on my list. This is awkward...")
+            # send the rank in chat
+            message = f"{user}, you are number {user_rank} out of {len(chatters)} chatters!"
+            self.send_message(message)
 
             
 class FeatureRequestCommand(CommandBase):
@@ -401,17 +425,19 @@ class FeatureRequestCommand(CommandBase):
         return "!featurerequest"
 
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         entry = {
+                "channel": self.bot.channel,
                 "user": user, 
                 "message": " ".join(message.split()[1:])
             }
-        engine.execute(
+        await asyncio.to_thread(
+            engine.execute,
             insert(FeatureRequest)
             .values(entry)
         )
 
-        self.bot.send_message(f"Got it! Thanks for your help, {user}!")
+        self.send_message(f"Got it! Thanks for your help, {user}!")
 
 
 class LurkCommand(CommandBase):
@@ -420,8 +446,9 @@ class LurkCommand(CommandBase):
         return "!lurk"
 
     
-    def execute(self, user, message, badges):
-        self.bot.send_message(f"Don't worry {user}, we got mad love for the lurkers! <3")
+    # a raid full of lurkers gets one reply
+    async def execute(self, user, message, badges):
+        self.bot.send_grouped("lurk", user, "Don't worry {}, we got mad love for the lurkers! <3")
         
 
 class ShoutoutCommand(CommandBase):
@@ -430,10 +457,10 @@ class ShoutoutCommand(CommandBase):
         return "!so"
 
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         # check if user shouting out no one
         if len(message.split()) < 2:
-            self.bot.send_message(f"I can't shoutout no one, {user}!")
+            self.send_message(f"I can't shoutout no one, {user}!")
 
         # if shouting someone
         else:
@@ -441,18 +468,28 @@ class ShoutoutCommand(CommandBase):
 
             # correct for users trying to shout themselves out
             if user.lower() == so_user.lower():
-                self.bot.send_message(f"You can't shoutout yourself, {user}!")
+                self.send_message(f"You can't shoutout yourself, {user}!")
                 return
 
             # api only returns users that have streamed in the past six months
-            url = f"https://api.twitch.tv/helix/search/channels?query={so_user}"
             headers = {
                 "client-id" : env.client_id,
-                "authorization" : f"Bearer {env.get_bearer()}"
+                "authorization" : f"Bearer {await env.tokens.get_async('Bearer')}"
             }
+            params = {"query": so_user}
 
-            response = requests.get(url, headers=headers)
-            data = json.loads(response.content)["data"][0]
+            try:
+                results = await http.get_json(CHANNEL_SEARCH_URL, ttl=SEARCH_TTL, headers=headers, params=params)
+            except requests.RequestException as e:
+                print(f"channel search failed: {e}")
+                self.send_message(f"I couldn't look up {so_user} right now, {user}. :(")
+                return
+
+            if not results["data"]:
+                self.send_message(f"{so_user} isn't a frequent streamer, {user}.")
+                return
+
+            data = results["data"][0]
             so_display_name = data["display_name"]
             so_login = data["broadcaster_login"]
 
@@ -460,11 +497,11 @@ class ShoutoutCommand(CommandBase):
             # TODO: can't find absenth762 specifically
             if so_user.lower() == so_login:
                 so_url = f"https://twitch.tv/{so_login}"
-                self.bot.send_message(f"Shoutout to {so_display_name}! Check them out here! {so_url}")
+                self.send_message(f"Shoutout to {so_display_name}! Check them out here! {so_url}")
 
             # user could not exist or not have streamed in 6 months
             else:
-                self.bot.send_message(f"{so_user} isn't a frequent streamer, {user}.")
+                self.send_message(f"{so_user} isn't a frequent streamer, {user}.")
 
 
 # TODO: !leaderboard command
@@ -474,7 +511,7 @@ class LeaderboardCommand(CommandBase):
         return "!leaderboard"
 
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         if len(message.split()) > 1:
             # command-specific leaderboard
             command = message.split()[1]
@@ -483,7 +520,7 @@ class LeaderboardCommand(CommandBase):
             
             commands = self.get_commands()
             if command not in commands:
-                self.bot.send_message(f"Sorry {user}, that command doesn't exist!")
+                self.send_message(f"Sorry {user}, that command doesn't exist!")
                 return
 
             users = self.get_command_users(command)
@@ -492,10 +529,10 @@ class LeaderboardCommand(CommandBase):
             users = self.get_top_chatters()
             
         top_n = 5
-        leaders = users[:top_n]
+        leaders = users.top(top_n)
         message_ranks = [f"{i}. {user}" for i,user in enumerate(leaders, start=1)]
 
-        self.bot.send_message(", ".join(message_ranks))
+        self.send_message(", ".join(message_ranks))
 
 
 class AliasCommand(CommandBase):
@@ -508,24 +545,12 @@ class AliasCommand(CommandBase):
         return True
 
 
-    # this function adds an alias to the text_commands table
-    def add_alias(self, command, alias):
-        entry = {
-            "command": alias,
-            "message": self.bot.text_commands[command]
-        }
-        engine.execute(
-            insert(TextCommands)
-            .values(entry)
-        )
-    
-
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         if "moderator" in badges or "broadcaster" in badges:
             params = message.split()
             # correct if user doesn't pass enough parameters
             if len(params) < 3:
-                self.bot.send_message(
+                self.send_message(
                     f"You didn't give me enough direction, {user}. I am now lost in this world. :("
                 )
                 return
@@ -536,18 +561,24 @@ class AliasCommand(CommandBase):
                 command2 = params[2] if params[2].startswith("!") else f"!{params[2]}"
 
 
+                # adds an alias to the text_commands table
                 if command1 in self.bot.text_commands:
-                    self.add_alias(command1, command2)
+                    cloned = await self.bot.text_commands.clone(command1, command2)
 
                 elif command2 in self.bot.text_commands:
-                    self.add_alias(command2, command1)
+                    cloned = await self.bot.text_commands.clone(command2, command1)
                     
                 # if neither command is a text command
                 else:
-                    self.bot.send_message(f"I don't have those commands, {user}. Sorry!")
+                    self.send_message(f"I don't have those commands, {user}. Sorry!")
+                    return
+
+                # the alias is already a command, here or in another process
+                if not cloned:
+                    self.send_message(f"Both of those commands already exist, {user}.")
                     return
 
-                self.bot.send_message("Clone created!")
+                self.send_message("Clone created!")
 
 
 # fun fact command
@@ -556,18 +587,19 @@ class FactCommand(CommandBase):
     def command_name(self):
         return "!funfact"
 
+    @property
+    def priority(self):
+        return PRIORITY_LOW
 
-    def execute(self, user, message, badges):
-        url = "https://uselessfacts.jsph.pl/random.json?language=en"
-        response = requests.get(url).json()
-        fact = response["text"]
 
-        # check that fact fits in a chat message
-        while len(fact) > 450:
-            response =requests.get(url).json()
-            fact = response["text"]
+    async def execute(self, user, message, badges):
+        # facts are limited to 450 characters to leave room for the prefix
+        fact = await fact_pool.get()
+        if fact:
+            self.send_message(f"FUN FACT: {fact}")
+            return
 
-        self.bot.send_message(f"FUN FACT: {fact}") 
+        self.send_message(f"I couldn't find a short enough fact, {user}. :(")
 
 
 # number fact command
@@ -576,45 +608,83 @@ class YearCommand(CommandBase):
     def command_name(self):
         return "!year"
 
+    @property
+    def priority(self):
+        return PRIORITY_LOW
+
 
-    def execute(self, user, message, badges):
+    async def execute(self, user, message, badges):
         words = message.split()
         if len(words) < 2:
-            self.bot.send_message(f"I need a year to check, {user}.")
+            self.send_message(f"I need a year to check, {user}.")
             return
         
         else:
-            # get user's year choice
+            # get user's year choice; it goes into the url path, so anything but a whole number is refused
             year = words[1]
+            if not re.fullmatch(r"[+-]?[0-9]+", year):
+                self.send_message(f"I need a year to check, {user}.")
+                return
 
             # get fact from api
-            url = f"http://numbersapi.com/{year}/year"
-            fact = requests.get(url).text
+            try:
+                fact = await http.get_text(YEAR_URL.format(year=year))
+            except requests.RequestException as e:
+                print(f"year fact request failed: {e}")
+                self.send_message(f"I couldn't find a fact about {year}, {user}. :(")
+                return
 
             # send fact in chat
-            self.bot.send_message(fact)
+            self.send_message(fact)
 
 
 class UptimeCommand(CommandBase):
+    def __init__(self, bot):
+        super().__init__(bot)
+        # start of the current stream, or None while offline; only known once an online or offline event arrives
+        self.live_since = None
+        self.known = False
+
+
     @property
     def command_name(self):
         return "!uptime"
 
 
-    def execute(self, user, message, badges):
-        result = engine.execute(
+    def on_event(self, event_type, event):
+        if event_type == "stream.online":
+            self.live_since = parse_timestamp(event["started_at"])
+            self.known = True
+        elif event_type == "stream.offline":
+            self.live_since = None
+            self.known = True
+
+
+    async def execute(self, user, message, badges):
+        error_message = "The stream isn't online...yet!"
+        if self.known:
+            message = error_message
+            if self.live_since is not None:
+                message = self.get_timedelta_message(self.live_since, "Stream has been live for", error_message)
+            self.send_message(message)
+            return
+
+        # nothing heard since the bot started; the last recorded start is the best guess
+        result = (await asyncio.to_thread(
+            engine.execute,
             select(StreamUptime.uptime)
+            .where(StreamUptime.channel == self.bot.channel)
             .order_by(StreamUptime.uptime.desc())
-        ).fetchone()
+            .limit(1)
+        )).fetchone()
 
         try:
             uptime = result[0]
             message_base = "Stream has been live for"
-            error_message = "The stream isn't online...yet!"
 
             message = self.get_timedelta_message(uptime, message_base, error_message)
-            self.bot.send_message(message)
+            self.send_message(message)
 
         except TypeError:
-            self.bot.send_message("I don't track stream uptimes yet!")
+            self.send_message("I don't track stream uptimes yet!")
 
@@ -0,0 +1,195 @@
+import os
+import json
+import asyncio
+from collections import deque
+
+# where pools are saved so a restart starts warm
+CACHE_DIR = os.getenv("CACHE_DIR", "../cache")
+
+POOL_SIZE = 20
+LOW_WATER = 5
+
+# longest item that fits in a chat message
+MAX_LENGTH = 500
+
+# recently served items that won't be accepted again
+SEEN_SIZE = 500
+
+# fetches per refill before giving up until the next one
+MAX_ATTEMPTS = 50
+
+# seconds to wait before retrying after a failed fetch
+RETRY_DELAY = 30
+
+
+# bounded pool of pre-fetched, pre-filtered chat replies
+# commands pop from memory; a background task tops the pool up from the api
+class ContentPool():
+    def __init__(self, name: str, fetch, size:int = POOL_SIZE, low_water:int = LOW_WATER,
+                max_length:int = MAX_LENGTH, path:str = None):
+        self.name = name
+        # async callable returning a list of new items
+        self.fetch = fetch
+        self.size = size
+        self.low_water = low_water
+        self.max_length = max_length
+        self.path = path or os.path.join(CACHE_DIR, f"{name}_pool.json")
+
+        self.items = deque()
+        self.seen = deque(maxlen=SEEN_SIZE)
+        self.loaded = False
+
+        # created inside the running event loop
+        self.task = None
+        self.loading = None
+        self.wakeup = None
+        self.available = None
+        self.filling = None
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    # accept an item if it fits in chat and hasn't been used recently
+    def add(self, item: str) -> bool:
+        if not item or len(item) > self.max_length:
+            return False
+        if item in self.items or item in self.seen or len(self.items) >= self.size:
+            return False
+        self.items.append(item)
+        if self.available is not None:
+            self.available.set()
+        return True
+
+
+    # take an item without waiting; None if the pool is empty
+    def pop(self) -> str:
+        if not self.items:
+            item = None
+        else:
+            item = self.items.popleft()
+            self.seen.append(item)
+        if not self.items and self.available is not None:
+            self.available.clear()
+
+        if len(self.items) < self.low_water and self.wakeup is not None:
+            self.wakeup.set()
+        return item
+
+
+    # take an item, waiting only for the first one a fill brings in when the pool has run dry
+    # None if nothing could be fetched, so the command sends its fallback instead of going quiet
+    async def get(self) -> str:
+        self.start()
+        await self.loading
+        if not self.items:
+            filling = self.fill_task()
+            available = asyncio.get_running_loop().create_task(self.available.wait())
+            try:
+                await asyncio.wait({filling, available}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                available.cancel()
+        return self.pop()
+
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+    # read the saved pool off the event loop, then add its items on it
+    async def load(self) -> None:
+        data = await asyncio.to_thread(self.read)
+        self.seen.extend(data.get("seen", []))
+        for item in data.get("items", []):
+            self.add(item)
+        self.loaded = True
+
+
+    # write to a temp file first so a crash never leaves a half-written pool
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"items": list(self.items), "seen": list(self.seen)}, f)
+        os.replace(tmp_path, self.path)
+
+
+    # fetch until the pool is full; returns the number of items added
+    async def fill(self) -> int:
+        added = 0
+        attempts = 0
+        try:
+            while len(self.items) < self.size and attempts < MAX_ATTEMPTS:
+                attempts += 1
+                for item in await self.fetch():
+                    added += self.add(item)
+        finally:
+            # keep what came in even if a later fetch failed
+            if added:
+                await asyncio.to_thread(self.save)
+        return added
+
+
+    # one fill at a time; a burst of callers on an empty pool shares it
+    def fill_task(self) -> asyncio.Task:
+        if self.filling is None:
+            self.filling = asyncio.get_running_loop().create_task(self.fill())
+            self.filling.add_done_callback(self.fill_done)
+        return self.filling
+
+
+    async def refill(self) -> int:
+        return await asyncio.shield(self.fill_task())
+
+
+    def fill_done(self, task) -> None:
+        self.filling = None
+        if not task.cancelled() and task.exception() is not None:
+            print(f"{self.name} pool refill failed: {task.exception()}")
+
+
+    # top up whenever the pool drops below the low-water mark
+    async def run(self) -> None:
+        await self.loading
+        while True:
+            self.wakeup.clear()
+            if len(self.items) >= self.low_water:
+                await self.wakeup.wait()
+                continue
+
+            try:
+                added = await self.refill()
+            except Exception:
+                # already reported by fill_done
+                added = 0
+
+            # back off when the api is failing or only returning duplicates
+            if not added:
+                await asyncio.sleep(RETRY_DELAY)
+
+
+    # start the background refill task if it isn't running
+    def start(self) -> None:
+        if self.task is None:
+            loop = asyncio.get_running_loop()
+            self.wakeup = asyncio.Event()
+            self.available = asyncio.Event()
+            self.loading = loop.create_task(self.load())
+            self.task = loop.create_task(self.run())
+
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.loaded:
+            await asyncio.to_thread(self.save)
@@ -1,24 +1,38 @@
 import requests 
 import os 
 import json
-from database import Base, Session, engine
-from sqlalchemy import select, delete, insert
-from models import Tokens
+from tokens import TokenManager
 from dotenv import load_dotenv
 load_dotenv("../credentials.env")
 
-Base.metadata.create_all(bind=engine)
-session = Session()
+# user ids looked up from Twitch, saved so later starts skip the request
+USER_ID_CACHE = os.path.join(os.getenv("CACHE_DIR", "../cache"), "user_ids.json")
 
+
+# settings from credentials.env; creating it does no network or database work
+# tokens are refreshed by bootstrap.py and the user id is looked up on first use
 class Environment():
     def __init__(self):
         # get creds from env file
         self.channel = os.getenv("CHANNEL")
+        # every channel one process serves, comma separated; defaults to CHANNEL
+        channels = os.getenv("CHANNELS") or self.channel or ""
+        self.channels = [c.strip().lower().lstrip("#") for c in channels.split(",") if c.strip()]
         self.bot_name = os.getenv("BOT_NAME")
         self.client_id = os.getenv("CLIENT_ID")
         self.client_secret = os.getenv("CLIENT_SECRET")
         self.oauth = os.getenv("OAUTH_TOKEN")
         self.callback_address = os.getenv("CALLBACK_ADDRESS")
+        # signs every eventsub message; 10 to 100 characters, and must be kept private
+        # there's no default: anyone who knows the secret can forge notifications
+        self.eventsub_secret = os.getenv("EVENTSUB_SECRET")
+        # certificate for serving eventsub over https; unset when a proxy or tunnel terminates tls
+        self.ssl_cert = os.getenv("SSL_CERT")
+        self.ssl_key = os.getenv("SSL_KEY")
+        # unix socket app.py sends EventSub events to chat_bot.py over when they run as separate processes
+        self.event_bus_socket = os.getenv(
+            "EVENT_BUS_SOCKET", os.path.join(os.getenv("CACHE_DIR", "../cache"), "events.sock")
+        )
 
         # these are pre-defined
         self.irc_port = 6667
@@ -32,23 +46,59 @@ class Environment():
             "channel:read:redemptions",
         ]
 
-        # start with new tokens
-        self.refresh_bearer()
-        self.refresh_app_access()
+        self._user_id = None
+        self._channel_ids = None
 
-        self.user_id = self.get_user_id()
-        self.app_access = self.get_app_access()
+        # tokens are read from memory and refreshed shortly before they expire
+        self.tokens = TokenManager()
+        self.tokens.register("Bearer", self.request_client_token)
+        self.tokens.register("App_Access", self.request_client_token)
+        self.tokens.register("User_Access", self.request_user_access)
 
 
-    # get new bearer token
-    def refresh_bearer(self) -> None:
-        # delete existing bearer
-        engine.execute(
-            delete(Tokens)
-            .where(Tokens.name == "Bearer")
-        )
+    @property
+    def user_id(self) -> str:
+        if self._user_id is None:
+            self._user_id = self.load_user_ids([self.channel])[self.channel]
+        return self._user_id
+
+
+    # broadcaster id of every channel served, by login
+    @property
+    def channel_ids(self) -> dict:
+        if self._channel_ids is None:
+            self._channel_ids = self.load_user_ids(self.channels)
+        return self._channel_ids
+
+
+    @property
+    def app_access(self) -> str:
+        return self.get_app_access()
+
+
+    # a login's user id never changes, so ids are read from the cache file when possible
+    # logins missing from it are looked up together; ones Twitch doesn't know are left out
+    def load_user_ids(self, logins: list) -> dict:
+        try:
+            with open(USER_ID_CACHE, encoding="utf-8") as f:
+                user_ids = json.load(f)
+        except (OSError, ValueError):
+            user_ids = {}
+
+        missing = [login for login in logins if login not in user_ids]
+        if missing:
+            user_ids.update(self.get_user_ids(missing))
+            os.makedirs(os.path.dirname(USER_ID_CACHE) or ".", exist_ok=True)
+            tmp_path = USER_ID_CACHE + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(user_ids, f)
+            os.replace(tmp_path, USER_ID_CACHE)
+
+        return {login: user_ids[login] for login in logins if login in user_ids}
 
-        # get new bearer from Twitch
+
+    # request a client credentials token from Twitch; returns (token, expires_in)
+    def request_client_token(self) -> tuple:
         url = "https://id.twitch.tv/oauth2/token"
         params = {
             "client_id" : self.client_id,
@@ -56,136 +106,84 @@ class Environment():
             "grant_type" : "client_credentials"
         }
         response = requests.post(url, params = params, timeout=3)
+        response.raise_for_status()
         data = json.loads(response.content)
-        bearer = data["access_token"]
+        return data["access_token"], data.get("expires_in")
+
 
-        # write new bearer to database
-        entry = {
-            "name": "Bearer",
-            "token": bearer
+    # trade the refresh token for a new user access token; returns (token, expires_in)
+    def request_user_access(self) -> tuple:
+        url = "https://id.twitch.tv/oauth2/token"
+        params = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "grant_type": "refresh_token",
+            "refresh_token": self.get_refresh_token()
         }
-        engine.execute(
-            insert(Tokens)
-            .values(entry)
-        )
+        response = requests.post(url, params=params, timeout=3)
+        response.raise_for_status()
+        data = response.json()
+
+        # twitch may hand back a new refresh token with the access token
+        if data.get("refresh_token"):
+            self.set_refresh_token(data["refresh_token"])
+        return data["access_token"], data.get("expires_in")
+
+
+    # get new bearer token
+    def refresh_bearer(self) -> str:
+        return self.tokens.refresh("Bearer")
 
     
-    # get bearer from database
+    # cached bearer, refreshed if it has expired
     def get_bearer(self) -> str:
-        result = engine.execute(
-            select(Tokens.token)
-            .where(Tokens.name == "Bearer")
-        ).fetchone()
+        return self.tokens.get("Bearer")
 
-        # return bearer from result
-        bearer = result[0]
-        return bearer
 
-
-    def get_user_id(self) -> str:
-        url = f"https://api.twitch.tv/helix/users?login={self.channel}"
+    # login -> user id, looked up 100 logins at a time
+    def get_user_ids(self, logins: list) -> dict:
         headers = {
             "client-id": self.client_id,
             "authorization": f"Bearer {self.get_bearer()}"
         }
-        response = requests.get(url, headers = headers)
-        data = json.loads(response.content)
-        user_id = data["data"][0]["id"]
-        return user_id
+        user_ids = {}
+        for i in range(0, len(logins), 100):
+            chunk = logins[i:i + 100]
+            response = requests.get("https://api.twitch.tv/helix/users", params=[("login", l) for l in chunk],
+                                    headers=headers, timeout=3)
+            response.raise_for_status()
+            # twitch answers with lowercase logins
+            by_login = {user["login"]: user["id"] for user in response.json()["data"]}
+            user_ids.update({l: by_login[l.lower()] for l in chunk if l.lower() in by_login})
+        return user_ids
+
+
+    def refresh_app_access(self) -> str:
+        return self.tokens.refresh("App_Access")
+        
 
+    # cached app access token, refreshed if it has expired
+    def get_app_access(self):
+        return self.tokens.get("App_Access")
 
-    def refresh_app_access(self) -> None:
-        # delete old app access token
-        engine.execute(
-            delete(Tokens)
-            .where(Tokens.name=="App_Access")
-        )
 
-        # get new app access token
-        url = "https://id.twitch.tv/oauth2/token"
-        params = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials"
-        }
-        response = requests.post(url, params=params)
-        token = response.json()["access_token"]
+    def set_user_access(self, token:str, expires_in:float = None) -> None:
+        self.tokens.set("User_Access", token, expires_in)
 
-        # write new token to db
-        entry = {
-            "name": "App_Access",
-            "token": token
-        }
-        engine.execute(
-            insert(Tokens)
-            .values(entry)
-        )
-        
-
-    # read app access token from db
-    def get_app_access(self):
-        result = engine.execute(
-            select(Tokens.token)
-            .where(Tokens.name=="App_Access")
-        ).fetchone()
-        token = result[0]
-        return token
-
-
-    # TODO: use longer sql statement to update if exists
-    def set_user_access(self, token:str) -> None:
-        # delete old token
-        engine.execute(
-            delete(Tokens)
-            .where(Tokens.name=="User_Access")
-        )
 
-        # set new token
-        entry = {
-            "name": "User_Access",
-            "token": token
-        }
-        engine.execute(
-            insert(Tokens)
-            .values(entry)
-        )
+    def refresh_user_access(self) -> str:
+        return self.tokens.refresh("User_Access")
 
 
     def get_user_access(self) -> str:
-        result = engine.execute(
-            select(Tokens.token)
-            .where(Tokens.name=="User_Access")
-        ).fetchone()
-        token = result[0]
-        return token
+        return self.tokens.get("User_Access")
 
 
-    # TODO: use longer sql statement to update if exists
     def set_refresh_token(self, token:str) -> None:
-        # del old token
-        engine.execute(
-            delete(Tokens)
-            .where(Tokens.name=="Refresh")
-        )
-
-        # write new token
-        entry = {
-            "name": "Refresh",
-            "token": token
-        }
-        engine.execute(
-            insert(Tokens)
-            .values(entry)
-        )
+        self.tokens.set("Refresh", token)
 
 
     def get_refresh_token(self) -> str:
-        result = engine.execute(
-            select(Tokens.token)
-            .where(Tokens.name=="Refresh")
-        ).fetchone()
-        token = result[0]
-        return token
+        return self.tokens.get("Refresh")
 
 env = Environment()
-
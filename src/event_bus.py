@@ -0,0 +1,188 @@
+import os
+import json
+import asyncio
+import inspect
+from collections import deque
+
+# events held by a BusClient while the other process is unreachable; the oldest are dropped
+MAX_BUFFER = 1000
+
+# seconds between attempts to reach the other process
+RECONNECT_DELAY = 2.0
+
+# longest line accepted on the socket
+MAX_LINE = 1024 * 1024
+
+
+# publish/subscribe within one process
+# eventsub.EventSubServer's dispatcher publishes what Twitch sends; channels.ChannelManager hands it to the
+# bots and their commands. subscribers are function(event_type, event), blocking or async; blocking ones
+# run inline, so they should be quick
+class EventBus():
+    def __init__(self):
+        # event type, or "*" for every type -> subscribers
+        self.subscribers = {}
+
+        # references to running subscriber tasks so they aren't garbage collected
+        self.tasks = set()
+
+        # counters for monitoring
+        self.published = 0
+        self.delivered = 0
+        self.failed = 0
+
+
+    def subscribe(self, event_type: str, subscriber) -> None:
+        self.subscribers.setdefault(event_type, []).append(subscriber)
+
+
+    def unsubscribe(self, event_type: str, subscriber) -> None:
+        subscribers = self.subscribers.get(event_type, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+
+
+    def publish(self, event_type: str, event: dict) -> None:
+        self.published += 1
+        for subscriber in [*self.subscribers.get(event_type, []), *self.subscribers.get("*", [])]:
+            try:
+                if inspect.iscoroutinefunction(subscriber):
+                    task = asyncio.get_running_loop().create_task(self.deliver(subscriber, event_type, event))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                else:
+                    subscriber(event_type, event)
+                    self.delivered += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"{event_type} subscriber failed: {e}")
+
+
+    async def deliver(self, subscriber, event_type: str, event: dict) -> None:
+        try:
+            await subscriber(event_type, event)
+            self.delivered += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"{event_type} subscriber failed: {e}")
+
+
+def encode(event_type: str, event: dict) -> bytes:
+    return json.dumps({"type": event_type, "event": event}).encode() + b"\n"
+
+
+# receives events from a BusClient in another process over a unix socket and publishes them on a bus
+# for running app.py apart from chat_bot.py
+class BusServer():
+    def __init__(self, bus: EventBus, path: str):
+        self.bus = bus
+        self.path = path
+        self.received = 0
+        self.server = None
+
+
+    async def handle_connection(self, reader, writer) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                self.received += 1
+                self.bus.publish(message["type"], message["event"])
+        except (ConnectionError, ValueError):
+            # ValueError: a line over MAX_LINE
+            pass
+        finally:
+            writer.close()
+
+
+    async def start(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # left behind if the last run didn't shut down cleanly
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_connection, self.path, limit=MAX_LINE)
+
+
+    async def run(self) -> None:
+        if self.server is None:
+            await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+# publishes to a BusServer in another process; stands in for an EventBus on the publishing side
+# events published while the server is unreachable are buffered and sent once it's back
+class BusClient():
+    def __init__(self, path: str, max_buffer:int = MAX_BUFFER, reconnect_delay:float = RECONNECT_DELAY):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.buffer = deque(maxlen=max_buffer)
+
+        # counters for monitoring
+        self.published = 0
+        self.sent = 0
+        self.dropped = 0
+
+        # created inside the running event loop
+        self.wakeup = None
+
+
+    def publish(self, event_type: str, event: dict) -> None:
+        self.published += 1
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(encode(event_type, event))
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+
+    # write buffered events until the connection drops
+    async def send(self, writer) -> None:
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.buffer:
+                # taken off first: publishes during the drain can push the oldest event out of a full buffer,
+                # and it mustn't be this one
+                data = self.buffer.popleft()
+                try:
+                    writer.write(data)
+                    await writer.drain()
+                except BaseException:
+                    # back at the front for the next connection; a buffer filled meanwhile loses its newest
+                    if len(self.buffer) == self.buffer.maxlen:
+                        self.dropped += 1
+                    self.buffer.appendleft(data)
+                    raise
+                self.sent += 1
+
+
+    # keep a connection to the server open, reconnecting until cancelled
+    async def run(self) -> None:
+        self.wakeup = asyncio.Event()
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            self.wakeup.set()
+            try:
+                await self.send(writer)
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+# the process-wide bus
+bus = EventBus()
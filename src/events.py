@@ -0,0 +1,230 @@
+import asyncio
+from uuid import UUID
+from datetime import datetime, timezone
+from abc import ABC, abstractmethod
+from sqlalchemy.dialects.postgresql import insert
+from database import engine
+from models import ChannelPointRewards, Followers, StreamUptime
+from eventsub import parse_timestamp
+
+# seconds a handler waits after its first event for more of the same type
+BATCH_WINDOW = 0.5
+
+# most events handled in one call
+MAX_BATCH = 500
+
+# events waiting across every type; past this Twitch is told to retry later
+MAX_PENDING = 10000
+
+
+# stores one EventSub subscription type; registered by subclassing, like command.CommandBase
+# events of a type are collected for batch_window seconds and handled together
+# reacting in chat is left to the bus's subscribers, see Bot.handle_event
+class EventHandler(ABC):
+    batch_window = BATCH_WINDOW
+    max_batch = MAX_BATCH
+
+    def __init__(self, db_writer):
+        self.db_writer = db_writer
+
+
+    @property
+    @abstractmethod
+    def event_type(self):
+        raise NotImplementedError
+
+
+    # handle a batch of events, oldest first
+    @abstractmethod
+    async def handle(self, events: list):
+        raise NotImplementedError
+
+
+    def __repr__(self):
+        return self.event_type
+
+
+class RedemptionHandler(EventHandler):
+    @property
+    def event_type(self):
+        return "channel.channel_points_custom_reward_redemption.add"
+
+
+    # rows go through the write-behind queue, so a burst is one insert
+    async def handle(self, events: list):
+        for event in events:
+            reward = event["reward"]
+            entry = {
+                "channel": event["broadcaster_user_login"],
+                "event_id": UUID(event["id"]),
+                "redeemed_at": parse_timestamp(event["redeemed_at"]),
+                "reward_id": UUID(reward["id"]),
+                "title": reward["title"],
+                "cost": reward["cost"],
+                "user": event["user_name"]
+            }
+            self.db_writer.add(ChannelPointRewards, entry)
+
+
+class FollowHandler(EventHandler):
+    @property
+    def event_type(self):
+        return "channel.follow"
+
+
+    def store_followers(self, rows: list) -> None:
+        stmt = insert(Followers)
+        engine.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Followers.channel, Followers.user_id],
+                set_={"follow_time": stmt.excluded.follow_time, "username": stmt.excluded.username,
+                      "last_seen": stmt.excluded.last_seen}
+            ),
+            rows
+        )
+
+
+    # one upsert for the batch
+    async def handle(self, events: list):
+        rows = {}
+        for event in events:
+            channel = event["broadcaster_user_login"]
+            rows[(channel, event["user_id"])] = {
+                "channel": channel,
+                "user_id": event["user_id"],
+                "follow_time": parse_timestamp(event["followed_at"]),
+                "username": event["user_name"],
+                "last_seen": datetime.now(timezone.utc)
+            }
+        await asyncio.to_thread(self.store_followers, list(rows.values()))
+
+
+class StreamInfoHandler(EventHandler):
+    @property
+    def event_type(self):
+        return "channel.update"
+
+
+    # only the latest title matters
+    async def handle(self, events: list):
+        title = events[-1]["title"]
+        print(f"The new title of the stream is:\n{title}")
+
+
+class StreamOnlineHandler(EventHandler):
+    @property
+    def event_type(self):
+        return "stream.online"
+
+
+    async def handle(self, events: list):
+        for event in events:
+            entry = {
+                "channel": event["broadcaster_user_login"],
+                "uptime": parse_timestamp(event["started_at"])
+            }
+            self.db_writer.add(StreamUptime, entry)
+
+
+class StreamOfflineHandler(EventHandler):
+    @property
+    def event_type(self):
+        return "stream.offline"
+
+
+    async def handle(self, events: list):
+        for event in events:
+            print(f"{event['broadcaster_user_login']} went offline")
+
+
+# queues notifications by subscription type and hands each type's handler its events in batches
+# once stored, events are published on the bus, an event_bus.EventBus or a BusClient to another process
+class EventDispatcher():
+    def __init__(self, bus, db_writer=None, handlers: list = None, max_pending:int = MAX_PENDING):
+        self.bus = bus
+        if handlers is None:
+            handlers = [h(db_writer) for h in EventHandler.__subclasses__()]
+        self.handlers = {h.event_type: h for h in handlers}
+        self.max_pending = max_pending
+
+        # type -> events waiting for its handler
+        self.pending = {t: [] for t in self.handlers}
+        self.size = 0
+
+        # counters for monitoring
+        self.processed = 0
+        self.batches = 0
+        self.failed = 0
+        self.unhandled = 0
+
+        # created inside the running event loop
+        self.wakeups = None
+        self.idle = None
+
+
+    # queue a notification's event; False if there's no room for it
+    def submit(self, payload: dict) -> bool:
+        event_type = payload["subscription"]["type"]
+        if event_type not in self.handlers:
+            self.unhandled += 1
+            return True
+        if self.size >= self.max_pending:
+            return False
+
+        self.pending[event_type].append(payload["event"])
+        self.size += 1
+        self.idle.clear()
+        self.wakeups[event_type].set()
+        return True
+
+
+    # take the next batch for a handler, waiting for more events for up to its batch window
+    async def next_batch(self, handler: EventHandler) -> list:
+        wakeup = self.wakeups[handler.event_type]
+        await wakeup.wait()
+        if handler.batch_window:
+            await asyncio.sleep(handler.batch_window)
+
+        events = self.pending[handler.event_type]
+        batch = events[:handler.max_batch]
+        del events[:handler.max_batch]
+        if not events:
+            wakeup.clear()
+        return batch
+
+
+    async def run_handler(self, handler: EventHandler) -> None:
+        while True:
+            batch = await self.next_batch(handler)
+            try:
+                await handler.handle(batch)
+                self.processed += len(batch)
+                self.batches += 1
+                if self.bus is not None:
+                    for event in batch:
+                        self.bus.publish(handler.event_type, event)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"{handler.event_type} handler failed: {e}")
+            finally:
+                self.size -= len(batch)
+                if self.size == 0:
+                    self.idle.set()
+
+
+    # must be called inside the event loop before events are submitted
+    def start(self) -> None:
+        if self.wakeups is None:
+            self.wakeups = {t: asyncio.Event() for t in self.handlers}
+            self.idle = asyncio.Event()
+            self.idle.set()
+
+
+    async def run(self) -> None:
+        self.start()
+        await asyncio.gather(*(self.run_handler(h) for h in self.handlers.values()))
+
+
+    # wait until every queued event has been handled
+    async def drain(self) -> None:
+        await self.idle.wait()
@@ -0,0 +1,352 @@
+import re
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+HOST = "localhost"
+PORT = 5000
+
+# largest request head and body accepted
+MAX_HEAD = 16 * 1024
+MAX_BODY = 1024 * 1024
+
+# seconds an idle keep-alive connection is held open
+IDLE_TIMEOUT = 60
+
+# the callback every subscription is created with
+EVENT_PATH = "/eventsub"
+
+# per-type callbacks used by subscriptions created before there was one endpoint
+LEGACY_EVENT_PREFIX = "/event/"
+
+# messages older than this are refused, so a captured request can't be replayed later
+MAX_AGE = 10 * 60
+
+# message ids remembered for spotting redeliveries; Twitch stops retrying well within MAX_AGE
+SEEN_SIZE = 50000
+SEEN_TTL = MAX_AGE
+
+# lengths of secret Twitch accepts when a subscription is created
+MIN_SECRET = 10
+MAX_SECRET = 100
+
+
+# refuse to verify or subscribe without a usable secret, since messages could then be forged
+def check_secret(secret: str) -> None:
+    if not secret:
+        raise ValueError("no EventSub secret; set EVENTSUB_SECRET")
+    if not MIN_SECRET <= len(secret) <= MAX_SECRET:
+        raise ValueError(f"EVENTSUB_SECRET must be {MIN_SECRET} to {MAX_SECRET} characters")
+
+
+class Request():
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: dict, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        # lower-cased names
+        self.headers = headers
+        self.body = body
+
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Response():
+    __slots__ = ("status", "body", "content_type")
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain"):
+        self.status = status
+        self.body = body.encode() if isinstance(body, str) else body
+        self.content_type = content_type
+
+
+    def encode(self, keep_alive: bool) -> bytes:
+        head = (
+            f"HTTP/1.1 {self.status} {HTTPStatus(self.status).phrase}\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Length: {len(self.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        return head.encode() + self.body
+
+
+class BadRequest(Exception):
+    pass
+
+
+# the signature Twitch sends: HMAC-SHA256, keyed by the subscription's secret, over id + timestamp + body
+def signature(secret: str, message_id: str, timestamp: str, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), message_id.encode() + timestamp.encode() + body, hashlib.sha256)
+    return "sha256=" + digest.hexdigest()
+
+
+def verify_signature(secret: str, headers: dict, body: bytes) -> bool:
+    expected = signature(
+        secret,
+        headers.get("twitch-eventsub-message-id", ""),
+        headers.get("twitch-eventsub-message-timestamp", ""),
+        body
+    )
+    # constant time, so the signature can't be guessed byte by byte from response times
+    return hmac.compare_digest(expected, headers.get("twitch-eventsub-message-signature", ""))
+
+
+# Twitch sends RFC 3339 with nanoseconds, which fromisoformat doesn't take before python 3.11
+def parse_timestamp(timestamp: str) -> datetime:
+    match = re.fullmatch(r"(.+?)(\.\d+)?(Z|[+-]\d\d:\d\d)", timestamp.strip())
+    if match is None:
+        raise ValueError(f"bad timestamp: {timestamp!r}")
+    base, fraction, offset = match.groups()
+    # older versions only take 3 or 6 digits
+    fraction = fraction[:7].ljust(7, "0") if fraction else ""
+    offset = "+00:00" if offset == "Z" else offset
+    return datetime.fromisoformat(base + fraction + offset)
+
+
+# message ids seen recently, forgotten after ttl seconds or once there are more than max_size
+class SeenMessages():
+    def __init__(self, max_size:int = SEEN_SIZE, ttl:float = SEEN_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # id -> when it expires, oldest first
+        self.entries = OrderedDict()
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __contains__(self, message_id: str) -> bool:
+        self.expire()
+        return message_id in self.entries
+
+
+    def expire(self) -> None:
+        now = self.clock()
+        entries = self.entries
+        while entries and next(iter(entries.values())) <= now:
+            entries.popitem(last=False)
+
+
+    def add(self, message_id: str) -> None:
+        self.expire()
+        self.entries[message_id] = self.clock() + self.ttl
+        self.entries.move_to_end(message_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+# read one request from the stream; None once the client hangs up between requests
+async def read_request(reader: asyncio.StreamReader) -> Request:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise BadRequest("connection closed mid-request")
+    except asyncio.LimitOverrunError:
+        raise BadRequest("request head too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise BadRequest(f"bad request line: {lines[0]!r}")
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise BadRequest("request body too large")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    query = {k:v[0] for k,v in parse_qs(url.query).items()}
+    return Request(method, url.path, query, headers, body)
+
+
+# receives Twitch EventSub webhooks on a plain asyncio server
+# notifications are acknowledged as soon as the dispatcher has queued them and are handled in the
+# background, so a burst of follows or redemptions during a raid never keeps Twitch waiting
+class EventSubServer():
+    def __init__(self, secret: str, dispatcher, host:str = HOST, port:int = PORT, ssl=None,
+                max_age:float = MAX_AGE, seen: SeenMessages = None, on_revocation=None):
+        # the secret subscriptions were created with; every message is signed with it
+        self.secret = secret
+        # has submit(payload) -> bool, start(), run() and drain(); see events.EventDispatcher
+        self.dispatcher = dispatcher
+        # function(subscription) called when Twitch revokes one, e.g. to recreate it
+        self.on_revocation = on_revocation
+        self.max_age = max_age
+        self.seen = seen if seen is not None else SeenMessages()
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+
+        # (method, path) -> async function(request) returning a Response
+        self.routes = {}
+
+        # counters for monitoring
+        self.received = 0
+        self.rejected = 0
+        self.forged = 0
+        self.stale = 0
+        self.duplicates = 0
+        self.revoked = 0
+
+        # created inside the running event loop
+        self.server = None
+
+
+    def route(self, method: str, path: str, handler) -> None:
+        self.routes[(method, path)] = handler
+
+
+    async def handle_connection(self, reader, writer) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                except (BadRequest, ValueError) as e:
+                    writer.write(Response(400, str(e)).encode(keep_alive=False))
+                    break
+                if request is None:
+                    break
+
+                response = await self.handle_request(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                writer.write(response.encode(keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def handle_request(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if request.method == "POST" and (request.path == EVENT_PATH
+                                         or request.path.startswith(LEGACY_EVENT_PREFIX)):
+            handler = self.receive
+        if handler is None:
+            return Response(404, "not found")
+
+        try:
+            return await handler(request)
+        except Exception as e:
+            print(f"{request.method} {request.path} failed: {e}")
+            return Response(500, "internal error")
+
+
+    # signed with our secret and recent; the reason it isn't, or None
+    def check_message(self, headers: dict, body: bytes) -> str:
+        if not verify_signature(self.secret, headers, body):
+            self.forged += 1
+            return "bad signature"
+
+        try:
+            sent = parse_timestamp(headers["twitch-eventsub-message-timestamp"])
+        except (KeyError, ValueError):
+            self.forged += 1
+            return "bad timestamp"
+
+        age = (datetime.now(timezone.utc) - sent).total_seconds()
+        if abs(age) > self.max_age:
+            self.stale += 1
+            return "message too old"
+        return None
+
+
+    # a message from Twitch: answer challenges, queue notifications, log revocations
+    async def receive(self, request: Request) -> Response:
+        problem = self.check_message(request.headers, request.body)
+        if problem is not None:
+            return Response(403, problem)
+
+        # a redelivery of something already accepted; Twitch only needs to hear it arrived
+        message_id = request.headers["twitch-eventsub-message-id"]
+        if message_id in self.seen:
+            self.duplicates += 1
+            return Response(204)
+
+        message_type = request.headers.get("twitch-eventsub-message-type")
+        try:
+            payload = request.json()
+        except ValueError:
+            return Response(400, "body isn't json")
+
+        # if callback is being used for validating a new subscription
+        if message_type == "webhook_callback_verification":
+            return Response(200, payload["challenge"])
+
+        if message_type == "notification":
+            if not self.dispatcher.submit(payload):
+                self.rejected += 1
+                return Response(503, "busy")
+            self.received += 1
+            self.seen.add(message_id)
+            return Response(204)
+
+        if message_type == "revocation":
+            subscription = payload["subscription"]
+            print(f"subscription {subscription['type']} revoked: {subscription['status']}")
+            self.revoked += 1
+            self.seen.add(message_id)
+            if self.on_revocation is not None:
+                self.on_revocation(subscription)
+            return Response(204)
+
+        return Response(400, "unknown message type")
+
+
+    async def start(self) -> None:
+        check_secret(self.secret)
+        self.dispatcher.start()
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, ssl=self.ssl, limit=MAX_HEAD
+        )
+        # port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+
+    # serve and process until cancelled
+    async def run(self) -> None:
+        if self.server is None:
+            await self.start()
+        try:
+            await asyncio.gather(
+                self.server.serve_forever(),
+                self.dispatcher.run()
+            )
+        finally:
+            await self.close()
+
+
+    # stop accepting requests; queued notifications are left to drain()
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+    # wait until every queued notification has been handled
+    async def drain(self) -> None:
+        await self.dispatcher.drain()
@@ -1,119 +1,131 @@
-import requests
-from datetime import datetime, timedelta
+import io
+import csv
+import time
+import asyncio
+import bootstrap
 from environment import env
-from sqlalchemy import select, insert, func, delete, update
-from database import Base, engine
-from models import Followers
-
-Base.metadata.create_all(bind=engine)
-
-FOLLOW_URL = "https://api.twitch.tv/helix/users/follows"
-FOLLOW_HEADERS = {
-    "Authorization": f"Bearer {env.app_access}",
-    "Client-Id": env.client_id
-}
- 
-def get_follower_count(env=env) -> int:
-    # api response
-    response = requests.get(
-        url=FOLLOW_URL, 
-        headers=FOLLOW_HEADERS, 
-        params={"to_id":env.user_id}
-    ).json()
-    follow_count = response["total"]
-    return follow_count
-
-
-# get followers from database
-def get_db_followers() -> int:
-    # count the number of followers currently in the database
-    followers = engine.execute(
-        select([func.count()]).select_from(Followers)
-    ).fetchone()[0]
-    
-    return followers
-
-# reconstuct follower table
-def refresh_follow_table(env=env) -> None:
-    params = {
-        "to_id": env.user_id,
-        "first": 100 # max allowed by twitch
+from helix import helix
+from database import engine
+
+# seconds between syncs while the bot runs
+SYNC_INTERVAL = 300
+
+
+# yield each page of followers from Twitch; raises if any page fails, so a partial list is never applied
+def follower_pages(broadcaster_id: str, client=helix):
+    return client.pages("users/follows", {"to_id": broadcaster_id})
+
+
+# copy one page into the sync table as csv, without a round-trip per follower
+def copy_page(cursor, page: list) -> int:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for follower in page:
+        writer.writerow([follower["from_id"], follower["followed_at"], follower["from_name"]])
+    buffer.seek(0)
+    cursor.copy_expert("COPY follower_sync (user_id, follow_time, username) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(page)
+
+
+def create_sync_table(cursor) -> None:
+    cursor.execute("""
+        CREATE TEMP TABLE follower_sync (user_id TEXT, follow_time TIMESTAMPTZ, username TEXT)
+        ON COMMIT DROP
+    """)
+
+
+# apply the copied list with one upsert and one set-difference delete
+def apply_sync(cursor, channel: str, copied: int) -> dict:
+    cursor.execute("ANALYZE follower_sync")
+
+    # xmax is 0 only on rows this statement inserted
+    cursor.execute("""
+        INSERT INTO followers (channel, user_id, follow_time, username, last_seen)
+        SELECT DISTINCT ON (user_id) %(channel)s, user_id, follow_time, username, now()
+        FROM follower_sync
+        ON CONFLICT (channel, user_id) DO UPDATE SET
+            follow_time = excluded.follow_time,
+            username = excluded.username,
+            last_seen = excluded.last_seen
+        RETURNING user_id, username, xmax = 0
+    """, {"channel": channel})
+    upserted = cursor.fetchall()
+
+    # an empty list is far more likely an api problem than every follower leaving
+    removed = []
+    if copied:
+        cursor.execute("""
+            DELETE FROM followers f
+            WHERE f.channel = %(channel)s
+            AND NOT EXISTS (SELECT 1 FROM follower_sync s WHERE s.user_id = f.user_id)
+            RETURNING user_id, username
+        """, {"channel": channel})
+        removed = cursor.fetchall()
+
+    return {
+        "total": len(upserted),
+        "added": [(user_id, username) for user_id, username, inserted in upserted if inserted],
+        "removed": removed
     }
-    response = requests.get(
-        url=FOLLOW_URL, 
-        headers=FOLLOW_HEADERS, 
-        params=params
-    ).json()
-    print(response["total"])
-
-    # run until end of follower list
-    while True:
-        data = response["data"]
-        
-        # KeyError if on last page of followers
+
+
+# make the channel's rows in the followers table match Twitch's list in one transaction
+# each page is copied into a temp table while the next one downloads
+# returns {"total": n, "added": [(user_id, username)], "removed": [(user_id, username)]}
+async def refresh_follow_table(channel: str = env.channel, broadcaster_id: str = None, pages=None) -> dict:
+    if pages is None:
+        if broadcaster_id is None:
+            broadcaster_id = (await asyncio.to_thread(env.load_user_ids, [channel]))[channel]
+        pages = follower_pages(broadcaster_id)
+
+    conn = await asyncio.to_thread(engine.raw_connection)
+    try:
+        cursor = conn.cursor()
+        await asyncio.to_thread(create_sync_table, cursor)
+        copied = 0
+        async for page in pages:
+            copied += await asyncio.to_thread(copy_page, cursor, page)
+        diff = await asyncio.to_thread(apply_sync, cursor, channel, copied)
+        await asyncio.to_thread(conn.commit)
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return diff
+
+
+# sync each channel in turn; one channel failing doesn't hold up the rest
+async def refresh_follow_tables(channels: list) -> dict:
+    broadcaster_ids = await asyncio.to_thread(env.load_user_ids, list(channels))
+    diffs = {}
+    for channel in channels:
+        if channel not in broadcaster_ids:
+            print(f"no user id for {channel}, followers not synced")
+            continue
         try:
-            cursor = response["pagination"]["cursor"]
-            params["after"] = cursor
-        except KeyError:
-            pass
-
-        # check every follower
-        for follower in data:
-            entry = {
-                "user_id": follower["from_id"],
-                "follow_time": follower["followed_at"],
-                "username": follower["from_name"]
-            }
-
-            # if follower in table, update last_seen
-            try:
-                update_entry = {
-                    "last_seen": datetime.now(),
-                    "username": entry["username"]
-                }
-
-                engine.execute(
-                    update(Followers)
-                    .where(Followers.user_id == entry["user_id"])
-                    .values(update_entry)
-                )
-
-            # if follower not in database, add them
-            except Exception as e: 
-                print(e)
-                # write new follower
-                engine.execute(
-                    insert(Followers)
-                    .values(entry)
-                )
-                print("new follower added")
-
-        # stop running on last page
-        if not response["pagination"]:
-            break
-            
-        # make new request with new cursor
-        response = requests.get(
-            url=FOLLOW_URL, 
-            headers=FOLLOW_HEADERS, 
-            params=params
-        ).json()
-
-
-    # delete unfollows
-    # remove rows with last_seen values > 12 hours
-    engine.execute(
-        delete(Followers)
-        .where(Followers.last_seen < datetime.now() - timedelta(hours=12))
-    )
+            diffs[channel] = await refresh_follow_table(channel, broadcaster_ids[channel])
+        except Exception as e:
+            print(f"follower sync failed for {channel}: {e}")
+    return diffs
 
 
 def main():
-    followers = get_follower_count()
-    db_followers = get_db_followers()
-
-    if followers != db_followers:
-        refresh_follow_table()
+    bootstrap.run()
+
+    # a full sync is a few queries, so it runs even when the counts agree,
+    # since a follow and an unfollow leave the count unchanged
+    start = time.perf_counter()
+    diffs = asyncio.run(refresh_follow_tables(env.channels))
+    elapsed = time.perf_counter() - start
+
+    for channel, diff in diffs.items():
+        print(f"{channel}: {diff['total']} followers synced")
+        for user_id, username in diff["added"]:
+            print(f"  + {username} ({user_id})")
+        for user_id, username in diff["removed"]:
+            print(f"  - {username} ({user_id})")
+    print(f"{len(diffs)} of {len(env.channels)} channels synced in {elapsed:.1f}s")
 
 
 if __name__ == "__main__":
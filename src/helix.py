@@ -0,0 +1,177 @@
+import time
+import asyncio
+from http_client import HTTPClient
+from environment import env
+
+HELIX_URL = "https://api.twitch.tv/helix"
+
+# largest page Helix hands out
+PAGE_SIZE = 100
+
+# requests kept back from the bucket so other callers sharing the token aren't starved
+RESERVE = 1
+
+# attempts for a request that keeps coming back 429
+MAX_ATTEMPTS = 5
+
+# seconds to wait after a 429 with no reset time still ahead, doubled on each attempt
+BACKOFF = 1.0
+
+# server errors are retried by the session; 429 is handled here, using Twitch's reset time
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class HelixError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+# async client for the Twitch Helix api
+# requests share one keep-alive session and wait out Twitch's rate-limit bucket instead of hitting it
+class HelixClient():
+    def __init__(self, client_id:str = None, tokens=None, token_name:str = "App_Access",
+                base_url:str = HELIX_URL, http: HTTPClient = None, clock=time.time):
+        self.client_id = client_id
+        self.tokens = tokens
+        self.token_name = token_name
+        self.base_url = base_url.rstrip("/")
+        self.http = http or HTTPClient(retry_statuses=RETRY_STATUSES)
+        self.clock = clock
+
+        # from the last response's Ratelimit-* headers
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+
+        # counters for monitoring
+        self.requests = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+
+    # env's tokens unless others were given; looked up late since env is set up by bootstrap
+    @property
+    def token_manager(self):
+        return self.tokens or env.tokens
+
+
+    # the token is only fetched in a thread when it isn't cached, so the event loop doesn't block on it
+    async def headers(self) -> dict:
+        return {
+            "Client-Id": self.client_id or env.client_id,
+            "Authorization": f"Bearer {await self.token_manager.get_async(self.token_name)}"
+        }
+
+
+    # wait if the bucket is down to the reserve and hasn't been refilled yet
+    async def wait_for_bucket(self) -> None:
+        while self.remaining is not None and self.remaining <= RESERVE:
+            delay = self.reset - self.clock()
+            if delay <= 0:
+                self.remaining = None
+                break
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+
+    def read_rate_limit(self, response) -> None:
+        headers = response.headers
+        if "Ratelimit-Remaining" in headers:
+            self.limit = int(headers.get("Ratelimit-Limit", 0)) or self.limit
+            self.remaining = int(headers["Ratelimit-Remaining"])
+            self.reset = float(headers.get("Ratelimit-Reset", self.clock()))
+
+
+    # how long to hold off after a 429 whose Ratelimit-Reset is missing or already past
+    def backoff(self, response, attempt: int) -> float:
+        delay = BACKOFF * 2 ** attempt
+        try:
+            return max(delay, float(response.headers.get("Retry-After", 0)))
+        except ValueError:
+            return delay
+
+
+    # send a request, returning the decoded json body
+    async def request(self, method: str, path: str, params=None, json=None) -> dict:
+        refreshed = False
+        for attempt in range(MAX_ATTEMPTS):
+            await self.wait_for_bucket()
+            if self.remaining is not None:
+                self.remaining -= 1
+
+            response = await self.http.request(
+                method, f"{self.base_url}/{path.lstrip('/')}",
+                headers=await self.headers(), params=params, json=json
+            )
+            self.requests += 1
+            self.read_rate_limit(response)
+
+            # out of requests: the bucket refills at Ratelimit-Reset
+            if response.status_code == 429:
+                self.rate_limited += 1
+                self.remaining = 0
+                # without a reset time ahead, wait_for_bucket would send the retry straight away
+                if self.reset <= self.clock():
+                    self.reset = self.clock() + self.backoff(response, attempt)
+                continue
+
+            # token expired or was revoked; get a new one once
+            if response.status_code == 401 and not refreshed and self.token_name in self.token_manager.refreshers:
+                refreshed = True
+                await asyncio.to_thread(self.token_manager.refresh, self.token_name)
+                continue
+
+            if response.status_code >= 400:
+                raise HelixError(response.status_code, response.text)
+            return response.json() if response.content else {}
+
+        raise HelixError(429, f"still rate limited after {MAX_ATTEMPTS} attempts")
+
+
+    async def get(self, path: str, params=None) -> dict:
+        return await self.request("GET", path, params=params)
+
+
+    # yield each page's data from a paginated endpoint
+    # the next page is requested as soon as its cursor is known, so it downloads while the caller
+    # works on the current one
+    async def pages(self, path: str, params: dict = None, first:int = PAGE_SIZE):
+        params = dict(params or {})
+        params.setdefault("first", first)
+
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self.get(path, dict(params)))
+        try:
+            while task is not None:
+                body = await task
+                task = None
+
+                cursor = (body.get("pagination") or {}).get("cursor")
+                if cursor and body.get("data"):
+                    params["after"] = cursor
+                    task = loop.create_task(self.get(path, dict(params)))
+
+                yield body.get("data", [])
+        finally:
+            if task is not None:
+                task.cancel()
+
+
+    # yield every item from a paginated endpoint
+    async def items(self, path: str, params: dict = None, first:int = PAGE_SIZE):
+        async for page in self.pages(path, params, first):
+            for item in page:
+                yield item
+
+
+    # every item from a paginated endpoint, as a list
+    async def collect(self, path: str, params: dict = None, first:int = PAGE_SIZE) -> list:
+        return [item async for item in self.items(path, params, first)]
+
+
+    def close(self) -> None:
+        self.http.close()
+
+
+helix = HelixClient()
@@ -0,0 +1,174 @@
+import time
+import asyncio
+import requests
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# concurrent requests allowed to a single host
+MAX_PER_HOST = 4
+
+# retries for idempotent requests on connection errors and 429/5xx
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# default size and lifetime of cached responses
+CACHE_SIZE = 256
+CACHE_TTL = 300
+
+
+# least-recently-used cache whose entries expire after a ttl
+class TTLCache():
+    def __init__(self, max_size:int = CACHE_SIZE, ttl:float = CACHE_TTL, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+
+    # cached value, or None if missing or expired
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+
+    def set(self, key, value, ttl:float = None) -> None:
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        self.entries[key] = (expires, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+# shared HTTP client for the bot's external API calls
+# one keep-alive session, per-host concurrency limits, timeouts, retries with backoff
+# and an optional response cache
+class HTTPClient():
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_per_host:int = MAX_PER_HOST, retries:int = RETRIES,
+                backoff_factor:float = BACKOFF_FACTOR, cache=None, retry_statuses=RETRY_STATUSES):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.cache = cache if cache is not None else TTLCache()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=retry_statuses,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_maxsize=max_per_host, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # created inside the running event loop
+        self.host_limits = {}
+        self.in_flight = {}
+
+
+    # semaphores are tied to an event loop, so there's one per host per loop
+    def host_limit(self, url: str) -> asyncio.Semaphore:
+        key = (asyncio.get_running_loop(), urlsplit(url).netloc)
+        if key not in self.host_limits:
+            self.host_limits[key] = asyncio.Semaphore(self.max_per_host)
+        return self.host_limits[key]
+
+
+    # send a request from a worker thread, waiting for a free slot on the host
+    async def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        async with self.host_limit(url):
+            return await asyncio.to_thread(self.session.request, method, url, **kwargs)
+
+
+    async def get(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("GET", url, **kwargs)
+
+
+    async def post(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("POST", url, **kwargs)
+
+
+    async def delete(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+
+    # GET and decode a response, caching the result for ttl seconds if given
+    # concurrent misses for the same url share one request
+    async def get_cached(self, url: str, decode, ttl:float = None, **kwargs):
+        if ttl is None:
+            response = await self.get(url, **kwargs)
+            response.raise_for_status()
+            return decode(response)
+
+        key = (url, tuple(sorted((kwargs.get("params") or {}).items())))
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        if flight_key in self.in_flight:
+            return await asyncio.shield(self.in_flight[flight_key])
+
+        future = loop.create_future()
+        self.in_flight[flight_key] = future
+        try:
+            response = await self.get(url, **kwargs)
+            response.raise_for_status()
+            value = decode(response)
+            self.cache.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark it retrieved, since nobody may be waiting on it
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[flight_key]
+
+
+    async def get_json(self, url: str, ttl:float = None, **kwargs):
+        return await self.get_cached(url, lambda r: r.json(), ttl, **kwargs)
+
+
+    async def get_text(self, url: str, ttl:float = None, **kwargs) -> str:
+        return await self.get_cached(url, lambda r: r.text, ttl, **kwargs)
+
+
+    def close(self) -> None:
+        self.session.close()
+
+
+http = HTTPClient()
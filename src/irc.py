@@ -0,0 +1,122 @@
+import asyncio
+
+# bytes requested per socket read; a raid burst easily exceeds the old 1024
+RECV_SIZE = 65536
+
+# drop a partial line that grows past this without a terminator
+MAX_LINE_SIZE = 65536
+
+
+# accumulates raw socket data and hands back only complete lines
+# lines that cross a read boundary stay in the buffer until their "\r\n" arrives
+class LineBuffer():
+    def __init__(self):
+        self.buffer = bytearray()
+
+
+    # add received bytes and return every line they complete
+    def feed(self, data: bytes) -> list:
+        buffer = self.buffer
+        buffer += data
+
+        lines = []
+        start = 0
+        view = memoryview(buffer)
+        try:
+            while True:
+                end = buffer.find(b"\r\n", start)
+                if end == -1:
+                    break
+
+                # decode straight from the buffer, one complete line at a time
+                if end > start:
+                    lines.append(str(view[start:end], "utf-8", "replace"))
+                start = end + 2
+        finally:
+            # the buffer can't be resized while a view of it exists
+            view.release()
+
+        # keep only the unterminated tail
+        if start:
+            del buffer[:start]
+        if len(buffer) > MAX_LINE_SIZE:
+            buffer.clear()
+
+        return lines
+
+
+# asyncio connection to the Twitch IRC server
+# reading and writing run as separate tasks so neither waits on the other
+class IRCConnection():
+    def __init__(self, server:str, port:int):
+        self.server = server
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.loop = None
+        self.inbox = None
+        self.outbox = None
+        self.lines = LineBuffer()
+
+        # lines queued before the connection was opened
+        self.pending = []
+
+
+    # open the socket; must be awaited inside the event loop that will run it
+    async def connect(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        self.reader, self.writer = await asyncio.open_connection(self.server, self.port)
+
+        for line in self.pending:
+            self.outbox.put_nowait(line)
+        self.pending.clear()
+
+
+    # queue a raw IRC line for the writer task
+    # safe to call from threads other than the one running the event loop
+    def send(self, line: str) -> None:
+        if self.outbox is None:
+            self.pending.append(line)
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            self.outbox.put_nowait(line)
+        else:
+            self.loop.call_soon_threadsafe(self.outbox.put_nowait, line)
+
+
+    # read from the socket and queue each line for dispatch
+    async def read_lines(self) -> None:
+        while True:
+            data = await self.reader.read(RECV_SIZE)
+            if not data:
+                raise ConnectionError("IRC server closed the connection")
+
+            for line in self.lines.feed(data):
+                # respond to pings from Twitch without waiting on the dispatcher
+                if line.startswith("PING"):
+                    self.send("PONG" + line[4:])
+                    continue
+
+                self.inbox.put_nowait(line)
+
+
+    # write queued lines to the socket
+    async def write_lines(self) -> None:
+        while True:
+            line = await self.outbox.get()
+            self.writer.write((line + "\r\n").encode())
+            await self.writer.drain()
+
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
@@ -0,0 +1,163 @@
+# IRCv3 message parsing for Twitch chat
+# lines look like:
+# @badges=moderator/1;color=#1E90FF;display-name=Foo;user-id=1234 :foo!foo@foo.tmi.twitch.tv PRIVMSG #channel :hello
+
+DEFAULT_COLOR = (56, 146, 66)
+
+# escaped characters allowed in IRCv3 tag values
+TAG_ESCAPES = {
+    ":": ";",
+    "s": " ",
+    "\\": "\\",
+    "r": "\r",
+    "n": "\n"
+}
+
+
+def unescape_tag_value(value: str) -> str:
+    if "\\" not in value:
+        return value
+
+    result = []
+    chars = iter(value)
+    for c in chars:
+        if c == "\\":
+            escaped = next(chars, "")
+            result.append(TAG_ESCAPES.get(escaped, escaped))
+        else:
+            result.append(c)
+    return "".join(result)
+
+
+# a single parsed IRC line
+# tags are kept as the raw string until something asks for them
+class Message():
+    __slots__ = ("raw_tags", "prefix", "command", "params", "text", "_tags")
+
+    def __init__(self, raw_tags: str, prefix: str, command: str, params: list, text: str):
+        self.raw_tags = raw_tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self.text = text
+        self._tags = None
+
+
+    def __repr__(self):
+        return f"Message({self.command} {' '.join(self.params)} :{self.text})"
+
+
+    # split tags into a dict on first use
+    @property
+    def tags(self) -> dict:
+        if self._tags is None:
+            tags = {}
+            if self.raw_tags:
+                for pair in self.raw_tags.split(";"):
+                    key, _, value = pair.partition("=")
+                    tags[key] = unescape_tag_value(value)
+            self._tags = tags
+        return self._tags
+
+
+    # look up a single tag; scans the raw string instead of splitting every tag
+    def tag(self, name: str, default: str = "") -> str:
+        if self._tags is not None:
+            return self._tags.get(name, default) or default
+
+        raw = self.raw_tags
+        key = name + "="
+        if raw.startswith(key):
+            start = len(key)
+        else:
+            start = raw.find(";" + key)
+            if start == -1:
+                return default
+            start += len(key) + 1
+
+        end = raw.find(";", start)
+        value = raw[start:] if end == -1 else raw[start:end]
+        return unescape_tag_value(value) or default
+
+
+    # login name of the sender, taken from nick!user@host
+    @property
+    def nick(self) -> str:
+        return self.prefix.partition("!")[0]
+
+
+    @property
+    def channel(self) -> str:
+        if self.params and self.params[0].startswith("#"):
+            return self.params[0][1:]
+        return ""
+
+
+    # badge names without their versions, e.g. ["moderator", "subscriber"]
+    @property
+    def badges(self) -> list:
+        badges = self.tag("badges")
+        if not badges:
+            return []
+        return [b.partition("/")[0] for b in badges.split(",")]
+
+
+    # username color as an RGB tuple
+    @property
+    def color(self) -> tuple:
+        color = self.tag("color").lstrip("#")
+        if len(color) != 6:
+            return DEFAULT_COLOR
+        value = int(color, 16)
+        return (value >> 16, (value >> 8) & 0xFF, value & 0xFF)
+
+
+# parse any IRC line; returns None for empty lines
+# only_command skips building a message for lines with any other command
+def parse(line: str, only_command: str = None) -> Message:
+    if not line:
+        return None
+
+    raw_tags = ""
+    prefix = ""
+    pos = 0
+
+    if line[0] == "@":
+        pos = line.find(" ")
+        if pos == -1:
+            return None
+        raw_tags = line[1:pos]
+        pos += 1
+
+    if line.startswith(":", pos):
+        end = line.find(" ", pos)
+        if end == -1:
+            return None
+        prefix = line[pos+1:end]
+        pos = end + 1
+
+    end = line.find(" ", pos)
+    if end == -1:
+        command = line[pos:]
+        rest = ""
+    else:
+        command = line[pos:end]
+        rest = line[end+1:]
+
+    # reject unwanted traffic before touching the params
+    if only_command is not None and command != only_command:
+        return None
+
+    # trailing param after " :" is the message text
+    if rest.startswith(":"):
+        middle, text = "", rest[1:]
+    else:
+        middle, _, text = rest.partition(" :")
+    params = middle.split() if middle else []
+
+    return Message(raw_tags, prefix, command, params, text)
+
+
+# parse a line only if it's a chat message
+def parse_privmsg(line: str) -> Message:
+    return parse(line, only_command="PRIVMSG")
@@ -0,0 +1,420 @@
+# versioned schema changes, applied in order and recorded in schema_migrations
+# run from src/: python migrations.py [--status] [--partition-chat-messages]
+import sys
+from datetime import date
+from sqlalchemy import text
+from database import engine
+from environment import env
+
+# serializes migration runs across processes
+LOCK_ID = 727274
+
+# tables rollups.py aggregates -> their time column
+ROLLUP_SOURCES = {
+    "chat_messages": "time",
+    "command_use": "time",
+    "viewership": "time",
+    "cp_rewards": "redeemed_at",
+}
+
+# monthly chat_messages partitions created ahead of time
+PARTITION_MONTHS_AHEAD = 3
+
+
+# tables as they were before migrations existed; IF NOT EXISTS so older databases pass through
+def baseline(conn) -> None:
+    statements = [
+        """CREATE TABLE IF NOT EXISTS chat_messages (
+            id SERIAL PRIMARY KEY, time TIMESTAMP, username TEXT, user_id TEXT, message TEXT)""",
+        """CREATE TABLE IF NOT EXISTS viewers (
+            id SERIAL PRIMARY KEY, username TEXT, display_name TEXT, is_follower BOOLEAN,
+            follow_time TIMESTAMP, banned BOOLEAN, banned_time TIMESTAMP)""",
+        """CREATE TABLE IF NOT EXISTS command_use (
+            id SERIAL PRIMARY KEY, time TIMESTAMP, "user" TEXT, command TEXT, is_custom INTEGER)""",
+        """CREATE TABLE IF NOT EXISTS text_commands (
+            id SERIAL PRIMARY KEY, command TEXT, message TEXT)""",
+        """CREATE TABLE IF NOT EXISTS false_commands (
+            id SERIAL PRIMARY KEY, time TIMESTAMP, "user" TEXT, command TEXT)""",
+        """CREATE TABLE IF NOT EXISTS bot_time (
+            id SERIAL PRIMARY KEY, uptime TIMESTAMP)""",
+        """CREATE TABLE IF NOT EXISTS stream_uptime (
+            id SERIAL PRIMARY KEY, uptime TIMESTAMP)""",
+        """CREATE TABLE IF NOT EXISTS followers (
+            user_id INTEGER PRIMARY KEY, follow_time TIMESTAMP, username TEXT, last_seen TIMESTAMP)""",
+        """CREATE TABLE IF NOT EXISTS feature_requests (
+            id SERIAL PRIMARY KEY, time TIMESTAMP, "user" TEXT, message TEXT)""",
+        """CREATE TABLE IF NOT EXISTS tokens (
+            id SERIAL PRIMARY KEY, name TEXT UNIQUE, token TEXT)""",
+        """CREATE TABLE IF NOT EXISTS subscriptions (
+            id SERIAL PRIMARY KEY, sub_name TEXT UNIQUE, sub_id TEXT UNIQUE, sub_type TEXT)""",
+        """CREATE TABLE IF NOT EXISTS viewership (
+            id SERIAL PRIMARY KEY, time TIMESTAMP, stream_id TEXT, title TEXT, game_id TEXT,
+            game_name TEXT, viewer_count INTEGER)""",
+        """CREATE TABLE IF NOT EXISTS cp_rewards (
+            id SERIAL PRIMARY KEY, event_id UUID, redeemed_at TIMESTAMP, reward_id UUID, title TEXT,
+            cost INTEGER, "user" TEXT)""",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+# rows from before multi-channel support belong to the configured channel
+def channel_columns(conn) -> None:
+    for table in ["chat_messages", "command_use", "false_commands", "text_commands",
+                  "feature_requests", "stream_uptime"]:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS channel TEXT"))
+        conn.execute(text(f"UPDATE {table} SET channel = :channel WHERE channel IS NULL"),
+                     {"channel": env.channel})
+
+
+def token_expiry(conn) -> None:
+    conn.execute(text("ALTER TABLE tokens ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP"))
+
+
+# indexes for the leaderboard, rank and uptime queries
+# composites lead with channel, so they also serve channel-only lookups
+def analytics_indexes(conn) -> None:
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_channel_username ON chat_messages (channel, username)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_time ON chat_messages (time)",
+        'CREATE INDEX IF NOT EXISTS ix_command_use_channel_command_user ON command_use (channel, command, "user")',
+        'CREATE INDEX IF NOT EXISTS ix_command_use_channel_user ON command_use (channel, "user")',
+        "CREATE INDEX IF NOT EXISTS ix_false_commands_channel_command ON false_commands (channel, command)",
+        "CREATE INDEX IF NOT EXISTS ix_text_commands_channel_command ON text_commands (channel, command)",
+        "CREATE INDEX IF NOT EXISTS ix_feature_requests_channel_time ON feature_requests (channel, time)",
+        "CREATE INDEX IF NOT EXISTS ix_stream_uptime_channel_uptime ON stream_uptime (channel, uptime DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_bot_time_uptime ON bot_time (uptime DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_viewership_time ON viewership (time)",
+        "CREATE INDEX IF NOT EXISTS ix_viewership_stream_id ON viewership (stream_id)",
+        "CREATE INDEX IF NOT EXISTS ix_followers_last_seen ON followers (last_seen)",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+    # single-column channel indexes made by earlier create_all runs, covered by the ones above
+    for table in ["chat_messages", "command_use", "false_commands", "text_commands",
+                  "feature_requests", "stream_uptime"]:
+        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table}_channel"))
+
+
+# twitch user ids are strings
+def follower_id_text(conn) -> None:
+    conn.execute(text("ALTER TABLE followers ALTER COLUMN user_id TYPE TEXT USING user_id::text"))
+
+
+# (table, column, whether the database fills it in) for every timestamp column
+TIME_COLUMNS = [
+    ("chat_messages", "time", True),
+    ("command_use", "time", True),
+    ("false_commands", "time", True),
+    ("feature_requests", "time", True),
+    ("bot_time", "uptime", True),
+    ("stream_uptime", "uptime", True),
+    ("viewership", "time", True),
+    ("cp_rewards", "redeemed_at", True),
+    ("followers", "last_seen", True),
+    ("followers", "follow_time", False),
+    ("viewers", "follow_time", False),
+    ("viewers", "banned_time", False),
+    ("tokens", "expires_at", False),
+]
+
+
+# timezone-aware columns, with now() taken by the database at insert
+# existing values were written in the bot's local time, which is the session time zone here
+def timestamptz_defaults(conn) -> None:
+    for table, column, has_default in TIME_COLUMNS:
+        # a partition key can't change type; tables partitioned from here on are created with it
+        if not (table == "chat_messages" and chat_is_partitioned(conn)):
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE TIMESTAMPTZ"))
+        if has_default:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT now()"))
+
+
+def create_dirty_trigger(conn, table: str, column: str) -> None:
+    conn.execute(text(f"""
+        CREATE TRIGGER {table}_dirty_minutes AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION queue_dirty_minutes('{column}')
+    """))
+
+
+# per-minute and per-stream aggregates kept by rollups.py
+def rollup_tables(conn) -> None:
+    statements = [
+        "ALTER TABLE viewership ADD COLUMN IF NOT EXISTS channel TEXT",
+        "ALTER TABLE cp_rewards ADD COLUMN IF NOT EXISTS channel TEXT",
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_channel_time ON chat_messages (channel, time)",
+        "CREATE INDEX IF NOT EXISTS ix_command_use_channel_time ON command_use (channel, time)",
+        "CREATE INDEX IF NOT EXISTS ix_viewership_channel_time ON viewership (channel, time)",
+        "CREATE INDEX IF NOT EXISTS ix_cp_rewards_channel_redeemed_at ON cp_rewards (channel, redeemed_at)",
+        """CREATE TABLE IF NOT EXISTS minute_stats (
+            channel TEXT NOT NULL,
+            minute TIMESTAMPTZ NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            chatters INTEGER NOT NULL DEFAULT 0,
+            commands INTEGER NOT NULL DEFAULT 0,
+            viewer_samples INTEGER NOT NULL DEFAULT 0,
+            viewers_total INTEGER NOT NULL DEFAULT 0,
+            peak_viewers INTEGER,
+            redemptions INTEGER NOT NULL DEFAULT 0,
+            points_spent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (channel, minute))""",
+        """CREATE TABLE IF NOT EXISTS stream_stats (
+            stream_id TEXT PRIMARY KEY,
+            channel TEXT,
+            started_at TIMESTAMPTZ,
+            ended_at TIMESTAMPTZ,
+            title TEXT,
+            game_name TEXT,
+            viewer_samples INTEGER,
+            avg_viewers DOUBLE PRECISION,
+            peak_viewers INTEGER,
+            messages INTEGER,
+            chatters INTEGER,
+            commands INTEGER,
+            redemptions INTEGER,
+            points_spent INTEGER)""",
+        "CREATE INDEX IF NOT EXISTS ix_stream_stats_channel_started_at ON stream_stats (channel, started_at)",
+        # minutes and streams inserts into the sources touch, queued by triggers and taken by rollups.py;
+        # rows reach the queue as they commit, whatever time they carry
+        """CREATE TABLE IF NOT EXISTS rollup_dirty_minutes (
+            id BIGSERIAL PRIMARY KEY,
+            channel TEXT NOT NULL,
+            minute TIMESTAMPTZ NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS rollup_dirty_streams (
+            id BIGSERIAL PRIMARY KEY,
+            stream_id TEXT NOT NULL)""",
+        # one insert per statement, of the distinct minutes in it; the time column is the trigger's argument
+        """CREATE OR REPLACE FUNCTION queue_dirty_minutes() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            EXECUTE format(
+                'INSERT INTO rollup_dirty_minutes (channel, minute) '
+                'SELECT DISTINCT channel, date_trunc(''minute'', %1$I) FROM new_rows '
+                'WHERE channel IS NOT NULL AND %1$I IS NOT NULL', TG_ARGV[0]);
+            RETURN NULL;
+        END $$""",
+        """CREATE OR REPLACE FUNCTION queue_dirty_streams() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO rollup_dirty_streams (stream_id)
+            SELECT DISTINCT stream_id FROM new_rows WHERE stream_id IS NOT NULL;
+            RETURN NULL;
+        END $$""",
+        """CREATE TRIGGER viewership_dirty_streams AFTER INSERT ON viewership
+           REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION queue_dirty_streams()""",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+    for table in ["viewership", "cp_rewards"]:
+        conn.execute(text(f"UPDATE {table} SET channel = :channel WHERE channel IS NULL"),
+                     {"channel": env.channel})
+
+    # rows already there are queued, so the first update builds the rollups from them
+    for table, column in ROLLUP_SOURCES.items():
+        create_dirty_trigger(conn, table, column)
+        conn.execute(text(f"""
+            INSERT INTO rollup_dirty_minutes (channel, minute)
+            SELECT DISTINCT channel, date_trunc('minute', {column}) FROM {table}
+            WHERE channel IS NOT NULL AND {column} IS NOT NULL
+        """))
+    conn.execute(text("""
+        INSERT INTO rollup_dirty_streams (stream_id)
+        SELECT DISTINCT stream_id FROM viewership WHERE stream_id IS NOT NULL
+    """))
+
+
+# desired EventSub subscriptions, kept by subscriptions.py; sub_id and status are what Helix last reported
+# rows written before this only recorded ids, and are replaced when the desired set is next declared
+def subscription_state(conn) -> None:
+    statements = [
+        "ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS version TEXT NOT NULL DEFAULT '1'",
+        "ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS condition JSONB",
+        "ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS callback TEXT",
+        "ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS status TEXT",
+        "ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ",
+        "DELETE FROM subscriptions WHERE condition IS NULL",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+# one row per channel and command, so two processes adding the same command can't both succeed
+# duplicates already there keep the newest row, the one the last notification put in every cache
+def text_command_keys(conn) -> None:
+    statements = [
+        """DELETE FROM text_commands a USING text_commands b
+           WHERE a.channel = b.channel AND a.command = b.command AND a.id < b.id""",
+        "DROP INDEX IF EXISTS ix_text_commands_channel_command",
+        "CREATE UNIQUE INDEX ix_text_commands_channel_command ON text_commands (channel, command)",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+# followers and viewers are kept per channel, like the other per-channel tables
+# rows already there belong to the configured channel
+def follower_channels(conn) -> None:
+    for table in ["followers", "viewers"]:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS channel TEXT"))
+        conn.execute(text(f"UPDATE {table} SET channel = :channel WHERE channel IS NULL"),
+                     {"channel": env.channel})
+
+    # the same account can follow several channels
+    statements = [
+        "ALTER TABLE followers ALTER COLUMN channel SET NOT NULL",
+        "ALTER TABLE followers DROP CONSTRAINT IF EXISTS followers_pkey",
+        "ALTER TABLE followers ADD PRIMARY KEY (channel, user_id)",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+# (version, name, function taking a connection); never edit or reorder applied entries
+MIGRATIONS = [
+    (1, "baseline", baseline),
+    (2, "channel_columns", channel_columns),
+    (3, "token_expiry", token_expiry),
+    (4, "analytics_indexes", analytics_indexes),
+    (5, "follower_id_text", follower_id_text),
+    (6, "timestamptz_defaults", timestamptz_defaults),
+    (7, "rollup_tables", rollup_tables),
+    (8, "subscription_state", subscription_state),
+    (9, "text_command_keys", text_command_keys),
+    (10, "follower_channels", follower_channels),
+]
+
+
+def month_start(day: date, months: int = 0) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+# create chat_messages partitions for every month from start through PARTITION_MONTHS_AHEAD from now
+def create_chat_partitions(conn, start: date = None, months_ahead:int = PARTITION_MONTHS_AHEAD) -> None:
+    today = date.today()
+    month = month_start(start or today)
+    last = month_start(today, months_ahead)
+    while month <= last:
+        following = month_start(month, 1)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS chat_messages_{month:%Y_%m} PARTITION OF chat_messages "
+            f"FOR VALUES FROM ('{month}') TO ('{following}')"
+        ))
+        month = following
+
+
+def chat_is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('chat_messages'))"
+    )).scalar()
+
+
+# optional: turn chat_messages into a table partitioned by month of time
+# old partitions can then be dropped or archived without touching recent chat
+# on an already partitioned table this only adds upcoming months
+def partition_chat_messages(conn) -> None:
+    if chat_is_partitioned(conn):
+        create_chat_partitions(conn)
+        return
+
+    # names of constraints and indexes are per schema, so the old ones move out of the way
+    conn.execute(text("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned"))
+    conn.execute(text("ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_unpartitioned_pkey"))
+    conn.execute(text("ALTER INDEX IF EXISTS ix_chat_messages_channel_username RENAME TO ix_chat_messages_unpartitioned_channel_username"))
+    conn.execute(text("ALTER INDEX IF EXISTS ix_chat_messages_time RENAME TO ix_chat_messages_unpartitioned_time"))
+    conn.execute(text("ALTER INDEX IF EXISTS ix_chat_messages_channel_time RENAME TO ix_chat_messages_unpartitioned_channel_time"))
+
+    # the partition key has to be part of the primary key, so time can't be null
+    conn.execute(text("""
+        CREATE TABLE chat_messages (
+            id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+            time TIMESTAMPTZ NOT NULL DEFAULT now(),
+            username TEXT,
+            user_id TEXT,
+            message TEXT,
+            channel TEXT,
+            PRIMARY KEY (id, time)
+        ) PARTITION BY RANGE (time)
+    """))
+    conn.execute(text("ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id"))
+    conn.execute(text("CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT"))
+
+    first = conn.execute(text("SELECT min(time) FROM chat_messages_unpartitioned")).scalar()
+    create_chat_partitions(conn, first.date() if first else None)
+
+    conn.execute(text("CREATE INDEX ix_chat_messages_channel_username ON chat_messages (channel, username)"))
+    conn.execute(text("CREATE INDEX ix_chat_messages_time ON chat_messages (time)"))
+    conn.execute(text("CREATE INDEX ix_chat_messages_channel_time ON chat_messages (channel, time)"))
+
+    # rows written before time had a usable default go in at the epoch
+    conn.execute(text("""
+        INSERT INTO chat_messages (id, time, username, user_id, message, channel)
+        SELECT id, COALESCE(time, 'epoch'), username, user_id, message, channel
+        FROM chat_messages_unpartitioned
+    """))
+    conn.execute(text("DROP TABLE chat_messages_unpartitioned"))
+
+    # added after the copy, so the rows moved across aren't queued for the rollups again
+    create_dirty_trigger(conn, "chat_messages", ROLLUP_SOURCES["chat_messages"])
+
+
+def applied_versions(conn) -> set:
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """))
+    return {v for v, in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+# apply every pending migration, each in its own transaction; returns the versions applied
+def migrate(engine=engine, partition_chat:bool = False) -> list:
+    applied = []
+    with engine.connect() as conn:
+        # held for the whole run so two processes starting together don't race
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": LOCK_ID})
+        try:
+            with conn.begin():
+                done = applied_versions(conn)
+
+            for version, name, func in MIGRATIONS:
+                if version in done:
+                    continue
+                with conn.begin():
+                    func(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                        {"version": version, "name": name}
+                    )
+                print(f"applied migration {version} {name}")
+                applied.append(version)
+
+            # once partitioned, every run makes sure the coming months have partitions
+            with conn.begin():
+                if partition_chat or chat_is_partitioned(conn):
+                    partition_chat_messages(conn)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": LOCK_ID})
+
+    return applied
+
+
+def status(engine=engine) -> None:
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+        partitioned = chat_is_partitioned(conn)
+    for version, name, _ in MIGRATIONS:
+        print(f"{version:4} {name:20} {'applied' if version in done else 'pending'}")
+    print(f"chat_messages partitioned: {partitioned}")
+
+
+if __name__ == "__main__":
+    import database
+    database.create_database()
+    if "--status" in sys.argv:
+        status()
+    else:
+        migrate(partition_chat="--partition-chat-messages" in sys.argv)
@@ -1,13 +1,18 @@
-from sqlalchemy import Column, Text, Integer, DateTime, Boolean
-from sqlalchemy.dialects.postgresql import UUID
-from datetime import datetime
+from sqlalchemy import Column, Text, Integer, BigInteger, Float, DateTime, Boolean, Index, func
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from database import Base
 
 class ChatMessages(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_channel_username", "channel", "username"),
+        Index("ix_chat_messages_time", "time"),
+        Index("ix_chat_messages_channel_time", "channel", "time"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    time = Column("time", DateTime, default=datetime.now())
+    channel = Column("channel", Text)
+    time = Column("time", DateTime(timezone=True), server_default=func.now())
     username = Column("username", Text)
     user_id = Column("user_id", Text)
     message = Column("message", Text)
@@ -25,12 +30,13 @@ class Viewers(Base):
     __tablename__ = "viewers"
 
     id_ = Column("id", Integer, primary_key=True)
+    channel = Column("channel", Text)
     username = Column("username", Text)
     display_name = Column("display_name", Text)
     is_follower = Column("is_follower", Boolean)
-    follow_time = Column("follow_time", DateTime)
+    follow_time = Column("follow_time", DateTime(timezone=True))
     banned = Column("banned", Boolean)
-    banned_time = Column("banned_time", DateTime)
+    banned_time = Column("banned_time", DateTime(timezone=True))
 
     def __init__(self):
         self.username == username
@@ -43,9 +49,15 @@ class Viewers(Base):
 
 class CommandUse(Base):
     __tablename__ = "command_use"
+    __table_args__ = (
+        Index("ix_command_use_channel_command_user", "channel", "command", "user"),
+        Index("ix_command_use_channel_user", "channel", "user"),
+        Index("ix_command_use_channel_time", "channel", "time"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    time = Column("time", DateTime, default=datetime.now())
+    channel = Column("channel", Text)
+    time = Column("time", DateTime(timezone=True), server_default=func.now())
     user = Column("user", Text)
     command = Column("command", Text)
     is_custom = Column("is_custom", Integer)
@@ -59,8 +71,12 @@ class CommandUse(Base):
 
 class TextCommands(Base):
     __tablename__ = "text_commands"
+    __table_args__ = (
+        Index("ix_text_commands_channel_command", "channel", "command", unique=True),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
+    channel = Column("channel", Text)
     command = Column("command", Text)
     message = Column("message", Text)
     
@@ -71,9 +87,13 @@ class TextCommands(Base):
 
 class FalseCommands(Base):
     __tablename__ = "false_commands"
+    __table_args__ = (
+        Index("ix_false_commands_channel_command", "channel", "command"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    time = Column("time", DateTime, default=datetime.now())
+    channel = Column("channel", Text)
+    time = Column("time", DateTime(timezone=True), server_default=func.now())
     user = Column("user", Text)
     command = Column("command", Text)
 
@@ -86,9 +106,12 @@ class FalseCommands(Base):
 # single row to keep track of time bot was started
 class BotTime(Base):
     __tablename__ = "bot_time"
+    __table_args__ = (
+        Index("ix_bot_time_uptime", "uptime"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    uptime = Column("uptime", DateTime, default=datetime.now())
+    uptime = Column("uptime", DateTime(timezone=True), server_default=func.now())
 
     def __init__(self):
         self.uptime = uptime
@@ -97,35 +120,41 @@ class BotTime(Base):
 # stream uptime
 class StreamUptime(Base):
     __tablename__ = "stream_uptime"
+    __table_args__ = (
+        Index("ix_stream_uptime_channel_uptime", "channel", "uptime"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    uptime = Column("uptime", DateTime, default=datetime.now())
+    channel = Column("channel", Text)
+    uptime = Column("uptime", DateTime(timezone=True), server_default=func.now())
 
     def __init__(self):
         self.uptime = uptime
 
 
-# list of followers by user ID and follow time
+# list of each channel's followers by user ID and follow time
 class Followers(Base):
     __tablename__ = "followers"
+    __table_args__ = (
+        Index("ix_followers_last_seen", "last_seen"),
+    )
 
-    user_id = Column("user_id", Integer, primary_key=True)
-    follow_time = Column("follow_time", DateTime)
+    channel = Column("channel", Text, primary_key=True)
+    user_id = Column("user_id", Text, primary_key=True)
+    follow_time = Column("follow_time", DateTime(timezone=True))
     username = Column("username", Text)
-    last_seen = Column("last_seen", DateTime, default=datetime.now())
-
-    def __init__(self):
-        self.user_id = user_id
-        self.follow_time = follow_time
-        self.username = username
-        self.last_seen = last_seen
+    last_seen = Column("last_seen", DateTime(timezone=True), server_default=func.now())
 
 
 class FeatureRequest(Base):
     __tablename__ = "feature_requests"
+    __table_args__ = (
+        Index("ix_feature_requests_channel_time", "channel", "time"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    time = Column("time", DateTime)
+    channel = Column("channel", Text)
+    time = Column("time", DateTime(timezone=True), server_default=func.now())
     user = Column("user", Text)
     message = Column("message", Text)
 
@@ -141,10 +170,7 @@ class Tokens(Base):
     id_ = Column("id", Integer, primary_key=True)
     name = Column("name", Text, unique=True)
     token = Column("token", Text)
-    
-    def __init__(self):
-        self.name = name
-        self.token = token
+    expires_at = Column("expires_at", DateTime(timezone=True))
 
 
 class Subscriptions(Base):
@@ -154,19 +180,25 @@ class Subscriptions(Base):
     sub_name = Column("sub_name", Text, unique=True)
     sub_id = Column("sub_id", Text, unique=True)
     sub_type = Column("sub_type", Text)
-
-    def __init__(self):
-        self.sub_name = sub_name
-        self.sub_id = sub_id
-        self.sub_type = sub_type
+    version = Column("version", Text, nullable=False, server_default="1")
+    condition = Column("condition", JSONB)
+    callback = Column("callback", Text)
+    status = Column("status", Text)
+    updated_at = Column("updated_at", DateTime(timezone=True))
 
 
 # tracking viewership with view_tracker.py
 class Viewership(Base):
     __tablename__ = "viewership"
+    __table_args__ = (
+        Index("ix_viewership_time", "time"),
+        Index("ix_viewership_stream_id", "stream_id"),
+        Index("ix_viewership_channel_time", "channel", "time"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
-    time = Column("time", DateTime, default=datetime.now())
+    channel = Column("channel", Text)
+    time = Column("time", DateTime(timezone=True), server_default=func.now())
     stream_id = Column("stream_id", Text)
     title = Column("title", Text)
     category_id = Column("game_id", Text)
@@ -183,10 +215,14 @@ class Viewership(Base):
 
 class ChannelPointRewards(Base):
     __tablename__ = "cp_rewards"
+    __table_args__ = (
+        Index("ix_cp_rewards_channel_redeemed_at", "channel", "redeemed_at"),
+    )
 
     id_ = Column("id", Integer, primary_key=True)
+    channel = Column("channel", Text)
     event_id = Column("event_id", UUID(as_uuid=True))
-    time = Column("redeemed_at", DateTime, default=datetime.now())
+    time = Column("redeemed_at", DateTime(timezone=True), server_default=func.now())
     reward_id = Column("reward_id", UUID(as_uuid=True))
     title = Column("title", Text)
     cost = Column("cost", Integer)
@@ -200,3 +236,58 @@ class ChannelPointRewards(Base):
         self.cost = cost
         self.user = user
 
+
+# per-minute totals maintained by rollups.py
+class MinuteStats(Base):
+    __tablename__ = "minute_stats"
+
+    channel = Column("channel", Text, primary_key=True)
+    minute = Column("minute", DateTime(timezone=True), primary_key=True)
+    messages = Column("messages", Integer, nullable=False, server_default="0")
+    chatters = Column("chatters", Integer, nullable=False, server_default="0")
+    commands = Column("commands", Integer, nullable=False, server_default="0")
+    viewer_samples = Column("viewer_samples", Integer, nullable=False, server_default="0")
+    viewers_total = Column("viewers_total", Integer, nullable=False, server_default="0")
+    peak_viewers = Column("peak_viewers", Integer)
+    redemptions = Column("redemptions", Integer, nullable=False, server_default="0")
+    points_spent = Column("points_spent", Integer, nullable=False, server_default="0")
+
+
+# per-stream totals maintained by rollups.py; a stream is one viewership stream_id
+class StreamStats(Base):
+    __tablename__ = "stream_stats"
+    __table_args__ = (
+        Index("ix_stream_stats_channel_started_at", "channel", "started_at"),
+    )
+
+    stream_id = Column("stream_id", Text, primary_key=True)
+    channel = Column("channel", Text)
+    started_at = Column("started_at", DateTime(timezone=True))
+    ended_at = Column("ended_at", DateTime(timezone=True))
+    title = Column("title", Text)
+    category = Column("game_name", Text)
+    viewer_samples = Column("viewer_samples", Integer)
+    avg_viewers = Column("avg_viewers", Float)
+    peak_viewers = Column("peak_viewers", Integer)
+    messages = Column("messages", Integer)
+    chatters = Column("chatters", Integer)
+    commands = Column("commands", Integer)
+    redemptions = Column("redemptions", Integer)
+    points_spent = Column("points_spent", Integer)
+
+
+# minutes with new raw rows, queued by triggers on the rollup sources and taken by rollups.py
+class RollupDirtyMinutes(Base):
+    __tablename__ = "rollup_dirty_minutes"
+
+    id_ = Column("id", BigInteger, primary_key=True)
+    channel = Column("channel", Text, nullable=False)
+    minute = Column("minute", DateTime(timezone=True), nullable=False)
+
+
+# streams with new viewership samples, queued alongside the minutes
+class RollupDirtyStreams(Base):
+    __tablename__ = "rollup_dirty_streams"
+
+    id_ = Column("id", BigInteger, primary_key=True)
+    stream_id = Column("stream_id", Text, nullable=False)
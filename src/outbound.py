@@ -0,0 +1,257 @@
+import time
+import heapq
+import asyncio
+import itertools
+
+# Twitch chat limits: messages per window for regular users and for mods/broadcasters
+USER_LIMIT = 20
+MOD_LIMIT = 100
+LIMIT_WINDOW = 30
+
+# lower numbers are sent first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# messages waiting beyond this are dropped
+MAX_QUEUE = 200
+
+MAX_MESSAGE_LENGTH = 500
+
+
+# allows bursts up to the limit and refills at limit/window tokens per second
+class TokenBucket():
+    def __init__(self, limit:int = USER_LIMIT, window:float = LIMIT_WINDOW, clock=time.monotonic):
+        self.clock = clock
+        self.window = window
+        self.limit = limit
+        self.tokens = float(limit)
+        self.updated = clock()
+
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.window
+
+
+    def refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    # change the limit, keeping the fraction of tokens that were available
+    def set_limit(self, limit: int) -> None:
+        self.refill()
+        self.tokens = self.tokens * limit / self.limit
+        self.limit = limit
+
+
+    def try_take(self) -> bool:
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+    # seconds until a token is available
+    def wait_time(self) -> float:
+        self.refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+# a queued chat message; grouped messages collect items rendered into one line
+class OutboundMessage():
+    __slots__ = ("priority", "seq", "text", "key", "template", "items", "queued_at")
+
+    def __init__(self, priority: int, seq: int, text: str, key: str = None, template: str = None):
+        self.priority = priority
+        self.seq = seq
+        self.text = text
+        self.key = key
+        self.template = template
+        self.items = []
+        self.queued_at = time.monotonic()
+
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+    def render(self) -> str:
+        if self.template is None:
+            return self.text
+        return self.template.format(", ".join(self.items))
+
+
+# paces outgoing chat messages under Twitch's rate limits
+# higher priority messages go first, duplicate replies are merged
+class OutboundScheduler():
+    def __init__(self, send_line, channel: str, is_moderator: bool = False, max_queue:int = MAX_QUEUE,
+                account_bucket: TokenBucket = None):
+        # called with the raw IRC line for each message sent
+        self.send_line = send_line
+        self.channel = channel
+        self.max_queue = max_queue
+        self.bucket = TokenBucket(MOD_LIMIT if is_moderator else USER_LIMIT)
+        self.is_moderator = is_moderator
+
+        # shared by every channel the account is in; a message needs a token from both
+        self.account_bucket = account_bucket
+
+        self.queue = []
+        self.counter = itertools.count()
+
+        # pending messages by text and by group key, for coalescing
+        self.pending_text = {}
+        self.pending_groups = {}
+
+        # metrics
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+        # created inside the running event loop
+        self.loop = None
+        self.wakeup = None
+        self.early = []
+
+
+    def set_moderator(self, is_moderator: bool) -> None:
+        if is_moderator != self.is_moderator:
+            self.is_moderator = is_moderator
+            self.bucket.set_limit(MOD_LIMIT if is_moderator else USER_LIMIT)
+            if self.wakeup is not None:
+                self.wakeup.set()
+
+
+    # run func on the scheduler's loop, from any thread
+    def call(self, func, *args) -> None:
+        if self.loop is None:
+            self.early.append((func, args))
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+
+    def push(self, message: OutboundMessage) -> bool:
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+
+        heapq.heappush(self.queue, message)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.wakeup.set()
+        return True
+
+
+    # queue a message; an identical message already waiting absorbs it
+    def submit(self, text: str, priority: int = PRIORITY_NORMAL) -> None:
+        pending = self.pending_text.get(text)
+        if pending is not None:
+            self.coalesced += 1
+            if priority < pending.priority:
+                pending.priority = priority
+                heapq.heapify(self.queue)
+            return
+
+        message = OutboundMessage(priority, next(self.counter), text)
+        if self.push(message):
+            self.pending_text[text] = message
+
+
+    # queue an item for a grouped message, e.g. many welcomes in one line
+    # template has a single {} that receives the comma-separated items
+    def submit_grouped(self, key: str, item: str, template: str, priority: int = PRIORITY_LOW) -> None:
+        pending = self.pending_groups.get(key)
+        if pending is not None and item in pending.items:
+            self.coalesced += 1
+            return
+
+        if pending is not None:
+            pending.items.append(item)
+            if len(pending.render()) <= MAX_MESSAGE_LENGTH:
+                self.coalesced += 1
+                return
+
+            # too long for one chat message; start a new group
+            pending.items.pop()
+
+        message = OutboundMessage(priority, next(self.counter), None, key, template)
+        message.items.append(item)
+        if self.push(message):
+            self.pending_groups[key] = message
+
+
+    def pop(self) -> OutboundMessage:
+        message = heapq.heappop(self.queue)
+        if message.key is None:
+            self.pending_text.pop(message.text, None)
+        elif self.pending_groups.get(message.key) is message:
+            del self.pending_groups[message.key]
+        return message
+
+
+    # seconds until both this channel and the account can send
+    def wait_time(self) -> float:
+        wait = self.bucket.wait_time()
+        if self.account_bucket is not None:
+            wait = max(wait, self.account_bucket.wait_time())
+        return wait
+
+
+    # send queued messages as tokens become available
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        for func, args in self.early:
+            func(*args)
+        self.early.clear()
+
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            # wait for a token; a limit change wakes this early to recompute
+            wait = self.wait_time()
+            if wait > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.bucket.try_take()
+            if self.account_bucket is not None:
+                self.account_bucket.try_take()
+
+            message = self.pop()
+            self.send_line(f"PRIVMSG #{self.channel} :{message.render()}")
+            self.sent += 1
+
+
+    def metrics(self) -> dict:
+        oldest = min((m.queued_at for m in self.queue), default=None)
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "limit": self.bucket.limit,
+            "tokens": round(self.bucket.tokens, 2),
+            "oldest_wait": 0.0 if oldest is None else time.monotonic() - oldest
+        }
@@ -0,0 +1,141 @@
+import asyncio
+from sortedcontainers import SortedList
+from sqlalchemy import select, func
+from database import engine
+from models import ChatMessages, CommandUse
+
+# seconds between full recounts against the database
+RECONCILE_INTERVAL = 15 * 60
+
+
+# usage counts per user, kept sorted so rank and top-n are O(log n)
+class RankIndex():
+    def __init__(self, counts: dict = None):
+        self.seed(counts or {})
+
+
+    def __len__(self):
+        return len(self.counts)
+
+
+    def __contains__(self, user: str) -> bool:
+        return user in self.counts
+
+
+    # replace everything with counts from the database
+    def seed(self, counts: dict) -> None:
+        self.counts = dict(counts)
+        self.ranked = SortedList((-c, u) for u,c in self.counts.items())
+
+
+    def increment(self, user: str, amount: int = 1) -> None:
+        count = self.counts.get(user, 0)
+        if count:
+            self.ranked.remove((-count, user))
+        self.counts[user] = count + amount
+        self.ranked.add((-(count + amount), user))
+
+
+    # 1-based rank of user, or None if they aren't ranked
+    def rank(self, user: str) -> int:
+        count = self.counts.get(user)
+        if count is None:
+            return None
+        return self.ranked.index((-count, user)) + 1
+
+
+    def top(self, n: int) -> list:
+        return [u for _,u in self.ranked.islice(0, n)]
+
+
+# one channel's chat and per-command leaderboards, updated as rows are stored
+class Leaderboards():
+    def __init__(self, db_writer, channel: str, engine=engine):
+        self.db_writer = db_writer
+        self.channel = channel
+        self.engine = engine
+        self.chatters = RankIndex()
+        self.commands = {}
+
+        # increments recorded while a reconcile is reading the database
+        self.replay = None
+
+
+    def command_index(self, command: str) -> RankIndex:
+        return self.commands.setdefault(command, RankIndex())
+
+
+    def record_message(self, user: str) -> None:
+        self.chatters.increment(user)
+        if self.replay is not None:
+            self.replay.append((user, None))
+
+
+    def record_command(self, user: str, command: str) -> None:
+        self.command_index(command).increment(user)
+        if self.replay is not None:
+            self.replay.append((user, command))
+
+
+    # count messages per chatter and command uses per user
+    def query_counts(self) -> tuple:
+        chatters = dict(self.engine.execute(
+            select(ChatMessages.username, func.count())
+            .where(ChatMessages.channel == self.channel)
+            .group_by(ChatMessages.username)
+        ).fetchall())
+
+        commands = {}
+        rows = self.engine.execute(
+            select(CommandUse.command, CommandUse.user, func.count())
+            .where(CommandUse.channel == self.channel)
+            .group_by(CommandUse.command, CommandUse.user)
+        )
+        for command, user, count in rows:
+            commands.setdefault(command, {})[user] = count
+
+        return chatters, commands
+
+
+    def seed(self, chatters: dict, commands: dict) -> None:
+        self.chatters.seed(chatters)
+        self.commands = {c: RankIndex(users) for c,users in commands.items()}
+
+
+    # initial load; blocking, call once at startup
+    def load(self) -> None:
+        self.seed(*self.query_counts())
+
+
+    # recount from the database to correct any drift
+    # increments are recorded from before the flush, so rows added while it runs are replayed too
+    async def reconcile(self) -> None:
+        # no other flushes while reading, so queued rows are exactly what's being replayed
+        async with self.db_writer.get_lock():
+            self.replay = []
+            try:
+                # rows put back by a failed flush are in neither the counts nor the replay
+                if not await self.db_writer.write_pending():
+                    print(f"#{self.channel} leaderboard reconcile skipped: queued rows weren't written")
+                    return
+                counts = await asyncio.to_thread(self.query_counts)
+                replay = self.replay
+            finally:
+                self.replay = None
+
+            self.seed(*counts)
+
+        for user, command in replay:
+            if command is None:
+                self.chatters.increment(user)
+            else:
+                self.command_index(command).increment(user)
+
+
+    async def reconcile_forever(self, interval: float = RECONCILE_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"#{self.channel} leaderboard reconcile failed: {e}")
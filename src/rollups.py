@@ -0,0 +1,222 @@
+# per-minute and per-stream aggregates of chat, commands, viewers and channel points
+# inserts into the raw tables queue the minutes and streams they touch (see migrations.rollup_tables);
+# only those are recomputed, so an update costs what arrived since the last one
+# run from src/: python rollups.py [--rebuild]
+import sys
+from sqlalchemy import text
+from database import engine
+from migrations import ROLLUP_SOURCES
+
+# seconds between updates
+UPDATE_INTERVAL = 60
+
+# held while updating, so two updaters don't recompute the same minutes side by side
+LOCK_ID = 727275
+
+# recompute every dirty minute from the raw rows, replacing what was there
+MINUTE_SQL = """
+    INSERT INTO minute_stats (channel, minute, messages, chatters, commands, viewer_samples,
+                              viewers_total, peak_viewers, redemptions, points_spent)
+    SELECT d.channel, d.minute, c.messages, c.chatters, u.commands, v.samples, v.total, v.peak,
+           r.redemptions, r.points
+    FROM dirty_minutes d
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS messages, count(DISTINCT username) AS chatters
+        FROM chat_messages
+        WHERE channel = d.channel AND time >= d.minute AND time < d.minute + interval '1 minute'
+    ) c
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS commands
+        FROM command_use
+        WHERE channel = d.channel AND time >= d.minute AND time < d.minute + interval '1 minute'
+    ) u
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS samples, COALESCE(sum(viewer_count), 0) AS total, max(viewer_count) AS peak
+        FROM viewership
+        WHERE channel = d.channel AND time >= d.minute AND time < d.minute + interval '1 minute'
+            AND stream_id IS NOT NULL
+    ) v
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS redemptions, COALESCE(sum(cost), 0) AS points
+        FROM cp_rewards
+        WHERE channel = d.channel AND redeemed_at >= d.minute AND redeemed_at < d.minute + interval '1 minute'
+    ) r
+    ON CONFLICT (channel, minute) DO UPDATE SET
+        messages = excluded.messages,
+        chatters = excluded.chatters,
+        commands = excluded.commands,
+        viewer_samples = excluded.viewer_samples,
+        viewers_total = excluded.viewers_total,
+        peak_viewers = excluded.peak_viewers,
+        redemptions = excluded.redemptions,
+        points_spent = excluded.points_spent
+"""
+
+# a stream runs from its first viewership sample to a minute past its last
+# totals come from minute_stats; unique chatters need the raw rows since they don't add up
+STREAM_SQL = """
+    INSERT INTO stream_stats (stream_id, channel, started_at, ended_at, title, game_name,
+                              viewer_samples, avg_viewers, peak_viewers, messages, chatters,
+                              commands, redemptions, points_spent)
+    SELECT w.stream_id, w.channel, w.started_at, w.ended_at, w.title, w.game_name,
+           w.samples, w.avg_viewers, w.peak_viewers, m.messages, c.chatters, m.commands,
+           m.redemptions, m.points
+    FROM (
+        SELECT stream_id, min(channel) AS channel, min(time) AS started_at,
+               max(time) + interval '1 minute' AS ended_at,
+               (array_agg(title ORDER BY time DESC))[1] AS title,
+               (array_agg(game_name ORDER BY time DESC))[1] AS game_name,
+               count(*) AS samples, avg(viewer_count) AS avg_viewers, max(viewer_count) AS peak_viewers
+        FROM viewership
+        WHERE stream_id IN (SELECT stream_id FROM dirty_streams)
+        GROUP BY stream_id
+    ) w
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(sum(messages), 0) AS messages, COALESCE(sum(commands), 0) AS commands,
+               COALESCE(sum(redemptions), 0) AS redemptions, COALESCE(sum(points_spent), 0) AS points
+        FROM minute_stats
+        WHERE channel = w.channel AND minute >= date_trunc('minute', w.started_at) AND minute < w.ended_at
+    ) m
+    CROSS JOIN LATERAL (
+        SELECT count(DISTINCT username) AS chatters
+        FROM chat_messages
+        WHERE channel = w.channel AND time >= w.started_at AND time < w.ended_at
+    ) c
+    ON CONFLICT (stream_id) DO UPDATE SET
+        channel = excluded.channel,
+        started_at = excluded.started_at,
+        ended_at = excluded.ended_at,
+        title = excluded.title,
+        game_name = excluded.game_name,
+        viewer_samples = excluded.viewer_samples,
+        avg_viewers = excluded.avg_viewers,
+        peak_viewers = excluded.peak_viewers,
+        messages = excluded.messages,
+        chatters = excluded.chatters,
+        commands = excluded.commands,
+        redemptions = excluded.redemptions,
+        points_spent = excluded.points_spent
+"""
+
+
+# keeps minute_stats and stream_stats up to date with the raw tables
+class RollupEngine():
+    def __init__(self, engine=engine):
+        self.engine = engine
+
+        # counters for monitoring
+        self.updates = 0
+        self.minutes = 0
+        self.streams = 0
+
+
+    # fold rows committed since the last update into the rollups; blocking
+    # returns the number of (minutes, streams) recomputed
+    def update(self) -> tuple:
+        with self.engine.begin() as conn:
+            # one updater at a time; a second caller waits and then finds the queue empty
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+            conn.execute(text("""
+                CREATE TEMP TABLE dirty_minutes (channel TEXT, minute TIMESTAMPTZ, PRIMARY KEY (channel, minute))
+                ON COMMIT DROP
+            """))
+            conn.execute(text("CREATE TEMP TABLE dirty_streams (stream_id TEXT PRIMARY KEY) ON COMMIT DROP"))
+
+            # takes only what has committed; rows still being written are queued when they commit,
+            # and picked up by the next update
+            conn.execute(text("""
+                WITH taken AS (DELETE FROM rollup_dirty_minutes RETURNING channel, minute)
+                INSERT INTO dirty_minutes SELECT DISTINCT channel, minute FROM taken
+            """))
+            conn.execute(text("""
+                WITH taken AS (DELETE FROM rollup_dirty_streams RETURNING stream_id)
+                INSERT INTO dirty_streams SELECT DISTINCT stream_id FROM taken
+            """))
+
+            minutes = conn.execute(text(MINUTE_SQL)).rowcount
+
+            # streams whose window takes in a recomputed minute
+            conn.execute(text("""
+                INSERT INTO dirty_streams
+                SELECT DISTINCT s.stream_id
+                FROM stream_stats s
+                JOIN dirty_minutes d ON d.channel = s.channel
+                    AND d.minute >= date_trunc('minute', s.started_at) AND d.minute < s.ended_at
+                ON CONFLICT DO NOTHING
+            """))
+            streams = conn.execute(text(STREAM_SQL)).rowcount
+
+        self.updates += 1
+        self.minutes += minutes
+        self.streams += streams
+        return minutes, streams
+
+
+    # throw the rollups away and build them again from every raw row
+    def rebuild(self) -> tuple:
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID})
+            conn.execute(text("TRUNCATE minute_stats, stream_stats, rollup_dirty_minutes, rollup_dirty_streams"))
+            for source, column in ROLLUP_SOURCES.items():
+                conn.execute(text(f"""
+                    INSERT INTO rollup_dirty_minutes (channel, minute)
+                    SELECT DISTINCT channel, date_trunc('minute', {column}) FROM {source}
+                    WHERE channel IS NOT NULL AND {column} IS NOT NULL
+                """))
+            conn.execute(text("""
+                INSERT INTO rollup_dirty_streams (stream_id)
+                SELECT DISTINCT stream_id FROM viewership WHERE stream_id IS NOT NULL
+            """))
+        return self.update()
+
+
+# per-minute totals for a channel between start and end
+def minute_series(channel: str, start, end, engine=engine) -> list:
+    rows = engine.execute(text("""
+        SELECT minute, messages, chatters, commands,
+               CASE WHEN viewer_samples > 0 THEN viewers_total::float / viewer_samples END AS avg_viewers,
+               peak_viewers, redemptions, points_spent
+        FROM minute_stats
+        WHERE channel = :channel AND minute >= :start AND minute < :end
+        ORDER BY minute
+    """), {"channel": channel, "start": start, "end": end})
+    return [dict(row._mapping) for row in rows]
+
+
+# one row per stream of a channel that started between start and end, newest first
+def stream_report(channel: str, start=None, end=None, engine=engine) -> list:
+    rows = engine.execute(text("""
+        SELECT stream_id, started_at, ended_at, title, game_name, avg_viewers, peak_viewers,
+               messages, chatters, commands, redemptions, points_spent
+        FROM stream_stats
+        WHERE channel = :channel
+            AND (CAST(:start AS TIMESTAMPTZ) IS NULL OR started_at >= :start)
+            AND (CAST(:end AS TIMESTAMPTZ) IS NULL OR started_at < :end)
+        ORDER BY started_at DESC
+    """), {"channel": channel, "start": start, "end": end})
+    return [dict(row._mapping) for row in rows]
+
+
+# totals across every stream of a channel that started between start and end
+def channel_summary(channel: str, start=None, end=None, engine=engine) -> dict:
+    row = engine.execute(text("""
+        SELECT count(*) AS streams,
+               sum(extract(epoch FROM ended_at - started_at)) / 3600 AS hours,
+               sum(avg_viewers * viewer_samples) / NULLIF(sum(viewer_samples), 0) AS avg_viewers,
+               max(peak_viewers) AS peak_viewers,
+               sum(messages) AS messages,
+               sum(commands) AS commands,
+               sum(redemptions) AS redemptions,
+               sum(points_spent) AS points_spent
+        FROM stream_stats
+        WHERE channel = :channel
+            AND (CAST(:start AS TIMESTAMPTZ) IS NULL OR started_at >= :start)
+            AND (CAST(:end AS TIMESTAMPTZ) IS NULL OR started_at < :end)
+    """), {"channel": channel, "start": start, "end": end}).fetchone()
+    return dict(row._mapping)
+
+
+if __name__ == "__main__":
+    rollups = RollupEngine()
+    minutes, streams = rollups.rebuild() if "--rebuild" in sys.argv else rollups.update()
+    print(f"recomputed {minutes} minutes and {streams} streams")
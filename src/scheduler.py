@@ -0,0 +1,129 @@
+import time
+import random
+import asyncio
+import inspect
+
+# a job's runs start at most this many seconds late without being counted as missed
+LATE_SLACK = 1.0
+
+
+# a function run every interval seconds, with its timing for monitoring
+class Job():
+    def __init__(self, name: str, func, interval: float, jitter: float = 0.0, when=None):
+        self.name = name
+        # async function, or a blocking one that's run in a worker thread
+        self.func = func
+        self.interval = interval
+        # up to this many seconds are added to each wait, so jobs sharing an interval spread out
+        self.jitter = jitter
+        # runs are skipped while this returns False, e.g. while the stream is offline
+        self.when = when
+
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.missed = 0
+        self.last_duration = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_error = None
+
+
+    async def call(self):
+        if inspect.iscoroutinefunction(self.func):
+            return await self.func()
+        return await asyncio.to_thread(self.func)
+
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "missed": self.missed,
+            "running": self.running,
+            "last_duration": self.last_duration,
+            "avg_duration": self.total_duration / self.runs if self.runs else None,
+            "max_duration": self.max_duration,
+            "last_error": self.last_error,
+        }
+
+
+# runs periodic jobs inside the bot's event loop, so they share its engine, http session and tokens
+# a job never overlaps itself: a run that overshoots its interval pushes the next one back
+class Scheduler():
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.jobs = {}
+
+
+    def add(self, name: str, func, interval: float, jitter: float = 0.0, when=None) -> Job:
+        job = Job(name, func, interval, jitter, when)
+        self.jobs[name] = job
+        return job
+
+
+    # run a job once, recording how long it took
+    async def run_job(self, job: Job) -> None:
+        if job.running:
+            job.skipped += 1
+            return
+        if job.when is not None and not job.when():
+            job.skipped += 1
+            return
+
+        job.running = True
+        start = self.clock()
+        try:
+            await job.call()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = repr(e)
+            print(f"job {job.name} failed: {e}")
+        finally:
+            duration = self.clock() - start
+            job.running = False
+            job.runs += 1
+            job.last_duration = duration
+            job.total_duration += duration
+            job.max_duration = max(job.max_duration, duration)
+
+
+    # run a job forever at a fixed rate
+    async def run_forever(self, job: Job) -> None:
+        slot = self.clock()
+        while True:
+            delay = slot + random.uniform(0, job.jitter) - self.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.run_job(job)
+
+            # next slot, skipping any the run overshot
+            slot += job.interval
+            now = self.clock()
+            if now > slot + min(LATE_SLACK, job.interval):
+                job.missed += int((now - slot) // job.interval) + 1
+                slot = now
+
+
+    async def run(self) -> None:
+        await asyncio.gather(*(self.run_forever(job) for job in self.jobs.values()))
+
+
+    def stats(self) -> dict:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+
+    # one line per job, for logs
+    def report(self) -> str:
+        lines = []
+        for name, job in self.jobs.items():
+            avg = job.total_duration / job.runs if job.runs else 0.0
+            lines.append(
+                f"{name}: {job.runs} runs, {job.failures} failed, {job.skipped} skipped, "
+                f"{job.missed} missed, avg {avg * 1000:.1f} ms, max {job.max_duration * 1000:.1f} ms"
+            )
+        return "\n".join(lines)
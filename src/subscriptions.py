@@ -0,0 +1,257 @@
+# keeps the app's EventSub subscriptions matching the desired set stored in the subscriptions table
+# each pass lists Helix once and only creates or deletes what differs, so a restart with everything
+# already in place costs one listing
+# run from src/: python subscriptions.py, to print what a pass would change
+import asyncio
+from sqlalchemy import select, update, bindparam, func
+from sqlalchemy.dialects.postgresql import insert
+from database import engine
+from environment import env
+from helix import helix, HelixError
+from eventsub import check_secret
+from models import Subscriptions
+
+# creates or deletes in flight at once; helix still paces them against the rate limit
+CONCURRENCY = 10
+
+# statuses of a subscription that's delivering, or will be once its callback is verified
+ACTIVE_STATUSES = ("enabled", "webhook_callback_verification_pending")
+
+SUBSCRIPTIONS_PATH = "eventsub/subscriptions"
+
+
+# one desired subscription per type, for a broadcaster, all delivered to one callback
+def desired(types: list, callback: str, broadcaster_id: str, version:str = "1") -> list:
+    return [
+        {
+            "name": f"{t}:{broadcaster_id}",
+            "type": t,
+            "version": version,
+            "condition": {"broadcaster_user_id": str(broadcaster_id)},
+            "callback": callback
+        }
+        for t in types
+    ]
+
+
+def matches(spec: dict, sub: dict) -> bool:
+    condition = sub.get("condition") or {}
+    return (
+        sub["type"] == spec["type"]
+        and sub["version"] == spec["version"]
+        and all(condition.get(k) == v for k,v in spec["condition"].items())
+        and sub["transport"].get("callback") == spec["callback"]
+        and sub["status"] in ACTIVE_STATUSES
+    )
+
+
+# whether a callback is root or a path below it; a bare prefix would also take in https://example.com.other
+def under(callback: str, root: str) -> bool:
+    root = root.rstrip("/")
+    return callback == root or callback.startswith(root + "/")
+
+
+# diff desired specs against the subscriptions Helix lists
+# returns (name -> subscription kept, specs to create, subscriptions to delete)
+# only subscriptions pointing under root are deleted, so other deployments sharing the client id are left alone
+def plan(specs: list, actual: list, root: str) -> tuple:
+    # without a root every subscription on the client id would look like ours
+    if not root:
+        raise ValueError("no callback root to match subscriptions against; set CALLBACK_ADDRESS")
+
+    by_type = {}
+    for spec in specs:
+        by_type.setdefault(spec["type"], []).append(spec)
+
+    kept = {}
+    remove = []
+    for sub in actual:
+        spec = next((s for s in by_type.get(sub["type"], []) if s["name"] not in kept and matches(s, sub)), None)
+        if spec is not None:
+            kept[spec["name"]] = sub
+        elif under(sub["transport"].get("callback") or "", root):
+            remove.append(sub)
+
+    create = [s for s in specs if s["name"] not in kept]
+    return kept, create, remove
+
+
+# makes Helix match the subscriptions table: the table is the desired state, Helix the actual one
+class SubscriptionReconciler():
+    def __init__(self, secret:str = env.eventsub_secret, root:str = env.callback_address, client=helix,
+                engine=engine, concurrency:int = CONCURRENCY):
+        # every subscription is created with this secret; eventsub.EventSubServer checks it
+        self.secret = secret
+        # the callback address subscriptions we own are under; checked when planning,
+        # since the reconciler is created at import, before settings are known to be complete
+        self.root = root
+        self.client = client
+        self.engine = engine
+        self.concurrency = concurrency
+
+        # counters for monitoring
+        self.passes = 0
+        self.created = 0
+        self.deleted = 0
+        self.failed = 0
+
+        # created inside the running event loop
+        self.lock = None
+        self.wakeup = None
+
+
+    # replace the stored desired set; rows already known keep their sub_id
+    def declare(self, specs: list) -> None:
+        rows = [
+            {"sub_name": s["name"], "sub_type": s["type"], "version": s["version"],
+             "condition": s["condition"], "callback": s["callback"]}
+            for s in specs
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(Subscriptions.__table__.delete().where(
+                Subscriptions.sub_name.notin_([r["sub_name"] for r in rows])
+            ))
+            if rows:
+                stmt = insert(Subscriptions)
+                conn.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[Subscriptions.sub_name],
+                        set_={"sub_type": stmt.excluded.sub_type, "version": stmt.excluded.version,
+                              "condition": stmt.excluded.condition, "callback": stmt.excluded.callback}
+                    ),
+                    rows
+                )
+
+
+    def load(self) -> list:
+        t = Subscriptions
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(t.sub_name, t.sub_type, t.version, t.condition, t.callback))
+            return [
+                {"name": name, "type": type_, "version": version, "condition": condition, "callback": callback}
+                for name, type_, version, condition, callback in rows
+            ]
+
+
+    # record what Helix reported; names missing from states have no subscription right now
+    def store(self, states: dict) -> None:
+        rows = [{"b_name": name, "b_sub_id": sub_id, "b_status": status}
+                for name, (sub_id, status) in states.items()]
+        with self.engine.begin() as conn:
+            # ids are cleared first so one moving between rows can't trip the unique constraint
+            conn.execute(update(Subscriptions).values(sub_id=None, status=None, updated_at=func.now()))
+            if rows:
+                conn.execute(
+                    update(Subscriptions)
+                    .where(Subscriptions.sub_name == bindparam("b_name"))
+                    .values(sub_id=bindparam("b_sub_id"), status=bindparam("b_status")),
+                    rows
+                )
+
+
+    async def create(self, spec: dict) -> dict:
+        body = {
+            "type": spec["type"],
+            "version": spec["version"],
+            "condition": spec["condition"],
+            "transport": {"method": "webhook", "callback": spec["callback"], "secret": self.secret}
+        }
+        response = await self.client.request("POST", SUBSCRIPTIONS_PATH, json=body)
+        return response["data"][0]
+
+
+    async def delete(self, sub: dict) -> None:
+        try:
+            await self.client.request("DELETE", SUBSCRIPTIONS_PATH, params={"id": sub["id"]})
+        except HelixError as e:
+            # already gone
+            if e.status != 404:
+                raise
+
+
+    # run func over items, at most concurrency at a time; results, or the exception raised
+    async def gather(self, func, items: list) -> list:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(item):
+            async with semaphore:
+                return await func(item)
+
+        return await asyncio.gather(*(limited(i) for i in items), return_exceptions=True)
+
+
+    # one pass: list, diff, delete then create, and store the result; returns a summary
+    async def reconcile(self) -> dict:
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            # every subscription created would carry the secret
+            check_secret(self.secret)
+            specs = await asyncio.to_thread(self.load)
+            actual = await self.client.collect(SUBSCRIPTIONS_PATH)
+            kept, create, remove = plan(specs, actual, self.root)
+
+            # deletes go first, so a failed subscription is out of the way before it's replaced
+            deleted = 0
+            for sub, result in zip(remove, await self.gather(self.delete, remove)):
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    print(f"couldn't delete subscription {sub['type']} {sub['id']}: {result}")
+                else:
+                    deleted += 1
+
+            states = {name: (sub["id"], sub["status"]) for name, sub in kept.items()}
+            created = 0
+            for spec, result in zip(create, await self.gather(self.create, create)):
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    print(f"couldn't create subscription {spec['type']}: {result}")
+                else:
+                    created += 1
+                    states[spec["name"]] = (result["id"], result["status"])
+
+            await asyncio.to_thread(self.store, states)
+            self.passes += 1
+            self.created += created
+            self.deleted += deleted
+            return {"kept": len(kept), "created": created, "deleted": deleted,
+                    "failed": len(create) + len(remove) - created - deleted}
+
+
+    # ask for another pass, e.g. after a revocation; requests during a pass are merged into one more
+    def request(self, subscription: dict = None) -> None:
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+
+    # reconcile once, then again whenever requested
+    async def run(self) -> None:
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                summary = await self.reconcile()
+                print(f"subscriptions reconciled: {summary}")
+            except Exception as e:
+                print(f"subscription reconcile failed: {e}")
+
+
+reconciler = SubscriptionReconciler()
+
+
+async def main():
+    specs = await asyncio.to_thread(reconciler.load)
+    actual = await helix.collect(SUBSCRIPTIONS_PATH)
+    kept, create, remove = plan(specs, actual, reconciler.root)
+    print(f"{len(kept)} in place")
+    for spec in create:
+        print(f"would create {spec['type']} -> {spec['callback']}")
+    for sub in remove:
+        print(f"would delete {sub['type']} {sub['id']} ({sub['status']}) -> {sub['transport'].get('callback')}")
+    helix.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,212 @@
+import json
+import uuid
+import asyncio
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from database import engine
+from models import TextCommands
+
+# postgres channel used to tell other bot processes about changes
+NOTIFY_CHANNEL = "text_commands"
+
+# identifies this process in notifications so it can ignore its own
+ORIGIN = uuid.uuid4().hex
+
+# seconds to wait before listening again after the connection drops
+RECONNECT_DELAY = 5
+
+
+# in-memory copy of one twitch channel's rows in the text_commands table
+# reads never touch the database; writes update the table and the cache together
+class TextCommandCache():
+    def __init__(self, channel: str, engine=engine):
+        self.channel = channel
+        self.engine = engine
+        self.commands = {}
+
+        # bumped on every change so callers can tell when their view is stale
+        self.version = 0
+
+        # called with (op, command, message) after every change, local or remote
+        self.hooks = []
+
+
+    def __contains__(self, command: str) -> bool:
+        return command in self.commands
+
+
+    def __getitem__(self, command: str) -> str:
+        return self.commands[command]
+
+
+    def __iter__(self):
+        return iter(self.commands)
+
+
+    def __len__(self):
+        return len(self.commands)
+
+
+    def get(self, command: str, default: str = None) -> str:
+        return self.commands.get(command, default)
+
+
+    # read the channel's commands; only needed at startup
+    def load(self) -> None:
+        rows = self.engine.execute(
+            select(TextCommands.command, TextCommands.message)
+            .where(TextCommands.channel == self.channel)
+        )
+        self.commands = {k:v for k,v in rows}
+        self.version += 1
+
+
+    @property
+    def notify_enabled(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+
+    # apply a change to the in-memory dict
+    def apply(self, op: str, command: str, message: str = None) -> None:
+        if op == "delete":
+            self.commands.pop(command, None)
+        else:
+            self.commands[command] = message
+        self.version += 1
+
+        for hook in self.hooks:
+            hook(op, command, message)
+
+
+    # run the db statement and, on postgres, tell other processes in the same transaction
+    # returns False if it changed nothing, in which case nobody is told
+    def write(self, stmt, op: str, command: str, message: str = None) -> bool:
+        with self.engine.begin() as conn:
+            if conn.execute(stmt).rowcount == 0:
+                return False
+            if self.notify_enabled:
+                payload = json.dumps({
+                    "origin": ORIGIN,
+                    "channel": self.channel,
+                    "op": op,
+                    "command": command,
+                    "message": message
+                })
+                conn.execute(select(func.pg_notify(NOTIFY_CHANNEL, payload)))
+        return True
+
+
+    # False if the command already exists, e.g. because another process added it first;
+    # that process's notification brings its message into the cache
+    async def add(self, command: str, message: str) -> bool:
+        entry = {"channel": self.channel, "command": command, "message": message}
+        added = await asyncio.to_thread(
+            self.write,
+            insert(TextCommands).values(entry).on_conflict_do_nothing(
+                index_elements=[TextCommands.channel, TextCommands.command]
+            ),
+            "add", command, message
+        )
+        if added:
+            self.apply("add", command, message)
+        return added
+
+
+    # False if the command no longer exists, e.g. because another process deleted it;
+    # it's dropped from the cache too rather than brought back
+    async def edit(self, command: str, message: str) -> bool:
+        edited = await asyncio.to_thread(
+            self.write,
+            update(TextCommands)
+            .where(TextCommands.channel == self.channel)
+            .where(TextCommands.command == command)
+            .values(message=message),
+            "edit", command, message
+        )
+        if edited:
+            self.apply("edit", command, message)
+        elif command in self.commands:
+            self.apply("delete", command)
+        return edited
+
+
+    # False if the command was already gone; the cache is brought in line either way
+    async def delete(self, command: str) -> bool:
+        deleted = await asyncio.to_thread(
+            self.write,
+            delete(TextCommands)
+            .where(TextCommands.channel == self.channel)
+            .where(TextCommands.command == command),
+            "delete", command
+        )
+        if deleted or command in self.commands:
+            self.apply("delete", command)
+        return deleted
+
+
+    # add alias as a new command with the same message as command
+    async def clone(self, command: str, alias: str) -> bool:
+        return await self.add(alias, self.commands[command])
+
+
+# handle a notification from another bot process
+# caches maps channel name to that channel's TextCommandCache
+def receive(caches: dict, payload: str) -> None:
+    change = json.loads(payload)
+    cache = caches.get(change.get("channel"))
+    if change["origin"] == ORIGIN or cache is None:
+        return
+    cache.apply(change["op"], change["command"], change["message"])
+
+
+# dedicated connection, kept out of the pool since it's switched to autocommit
+def connect_listener(engine=engine):
+    raw = engine.raw_connection()
+    raw.detach()
+    raw.connection.autocommit = True
+    raw.connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL};")
+    return raw
+
+
+# LISTEN for changes made by other processes, one connection for every channel's cache
+# a dropped connection is reopened and the caches reloaded, since notifications sent meanwhile are lost
+# returns at once if not on postgres
+async def listen(caches: dict, engine=engine) -> None:
+    if engine.dialect.name != "postgresql":
+        return
+
+    loop = asyncio.get_running_loop()
+    while True:
+        raw = None
+        lost = asyncio.Event()
+        try:
+            raw = await asyncio.to_thread(connect_listener, engine)
+            conn = raw.connection
+
+            # catch anything changed while nobody was listening
+            for cache in list(caches.values()):
+                await asyncio.to_thread(cache.load)
+
+            def on_readable():
+                try:
+                    conn.poll()
+                except Exception as e:
+                    print(f"text command listener lost its connection: {e}")
+                    loop.remove_reader(conn.fileno())
+                    lost.set()
+                    return
+                while conn.notifies:
+                    receive(caches, conn.notifies.pop(0).payload)
+
+            loop.add_reader(conn.fileno(), on_readable)
+            try:
+                await lost.wait()
+            finally:
+                loop.remove_reader(conn.fileno())
+        except Exception as e:
+            print(f"couldn't listen for text command changes: {e}")
+        finally:
+            if raw is not None:
+                raw.close()
+
+        await asyncio.sleep(RECONNECT_DELAY)
@@ -0,0 +1,189 @@
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from database import engine
+from models import Tokens
+
+# refresh this many seconds before a token expires
+REFRESH_MARGIN = 300
+
+# seconds to wait before retrying a failed background refresh
+RETRY_DELAY = 30
+
+# a token and when it stops working, as a time.time() timestamp; None means unknown
+class CachedToken():
+    __slots__ = ("token", "expires")
+
+    def __init__(self, token: str, expires: float = None):
+        self.token = token
+        self.expires = expires
+
+
+    def fresh(self, margin: float = 0, clock=time.time) -> bool:
+        return self.expires is not None and self.expires - margin > clock()
+
+
+# tokens kept in memory, backed by the tokens table
+# reads are a dict lookup; refreshes are single-flight and written with an upsert
+class TokenManager():
+    def __init__(self, engine=engine, margin:float = REFRESH_MARGIN, clock=time.time):
+        self.engine = engine
+        self.margin = margin
+        self.clock = clock
+        self.cache = {}
+
+        # name -> callable returning (token, expires_in seconds or None)
+        self.refreshers = {}
+
+        # one lock per token so concurrent refreshes of it share one request
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+        # counters for monitoring
+        self.refreshes = 0
+        self.loads = 0
+
+        # set when a token is cached, so run() works out its deadline again; created inside the running event loop
+        self.changed = None
+        self.loop = None
+
+
+    def register(self, name: str, refresher) -> None:
+        self.refreshers[name] = refresher
+
+
+    def lock(self, name: str) -> threading.Lock:
+        with self.locks_lock:
+            return self.locks.setdefault(name, threading.Lock())
+
+
+    # the current token; only blocks when it isn't cached or has expired
+    def get(self, name: str) -> str:
+        cached = self.cache.get(name)
+        if cached is not None and (cached.expires is None or cached.expires > self.clock()):
+            return cached.token
+        return self.load_or_refresh(name)
+
+
+    # get() for the event loop: a cached token is returned straight away, anything else is fetched in a thread
+    async def get_async(self, name: str) -> str:
+        cached = self.cache.get(name)
+        if cached is not None and (cached.expires is None or cached.expires > self.clock()):
+            return cached.token
+        return await asyncio.to_thread(self.load_or_refresh, name)
+
+
+    def load_or_refresh(self, name: str) -> str:
+        with self.lock(name):
+            # another thread may have got it while this one waited
+            cached = self.cache.get(name)
+            if cached is None:
+                cached = self.load(name)
+            if name not in self.refreshers:
+                return None if cached is None else cached.token
+            if cached is not None and cached.fresh(clock=self.clock):
+                return cached.token
+            return self.refresh_locked(name)
+
+
+    # read one token from the database into the cache
+    def load(self, name: str) -> CachedToken:
+        self.loads += 1
+        row = self.engine.execute(
+            select(Tokens.token, Tokens.expires_at)
+            .where(Tokens.name == name)
+        ).fetchone()
+        if row is None:
+            return None
+
+        token, expires_at = row
+        cached = CachedToken(token, expires_at.timestamp() if expires_at else None)
+        self.cache_token(name, cached)
+        return cached
+
+
+    # safe to call from any thread
+    def cache_token(self, name: str, cached: CachedToken) -> None:
+        self.cache[name] = cached
+        if self.changed is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.changed.set)
+
+
+    # upsert a token and cache it; expires_in is in seconds
+    def set(self, name: str, token: str, expires_in: float = None) -> None:
+        expires = None if expires_in is None else self.clock() + expires_in
+        entry = {
+            "name": name,
+            "token": token,
+            "expires_at": None if expires is None else datetime.fromtimestamp(expires, timezone.utc)
+        }
+        stmt = insert(Tokens).values(entry)
+        self.engine.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Tokens.name],
+                set_={"token": stmt.excluded.token, "expires_at": stmt.excluded.expires_at}
+            )
+        )
+        self.cache_token(name, CachedToken(token, expires))
+
+
+    # get a new token now; callers arriving during a refresh wait for it instead of repeating it
+    def refresh(self, name: str) -> str:
+        started = self.cache.get(name)
+        with self.lock(name):
+            cached = self.cache.get(name)
+            if cached is not started and cached is not None and cached.fresh(self.margin, self.clock):
+                return cached.token
+            return self.refresh_locked(name)
+
+
+    def refresh_locked(self, name: str) -> str:
+        token, expires_in = self.refreshers[name]()
+        self.refreshes += 1
+        self.set(name, token, expires_in)
+        return token
+
+
+    # load every refreshable token, refreshing the missing and expiring ones; blocking
+    def ensure(self, names: list = None) -> None:
+        for name in names or list(self.refreshers):
+            with self.lock(name):
+                cached = self.cache.get(name) or self.load(name)
+                if cached is None or not cached.fresh(self.margin, self.clock):
+                    self.refresh_locked(name)
+
+
+    # seconds until the next token is due for a refresh; None while no cached token expires
+    def next_refresh(self) -> float:
+        due = [
+            self.cache[name].expires - self.margin
+            for name in self.refreshers
+            if name in self.cache and self.cache[name].expires is not None
+        ]
+        return max(0.0, min(due) - self.clock()) if due else None
+
+
+    # refresh tokens in the background shortly before they expire
+    # waits for the next deadline, or until a token is cached, since that can move the deadline
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+        while True:
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), self.next_refresh())
+                continue
+            except asyncio.TimeoutError:
+                pass
+            for name in list(self.refreshers):
+                cached = self.cache.get(name)
+                if cached is None or cached.expires is None or cached.fresh(self.margin, self.clock):
+                    continue
+                try:
+                    await asyncio.to_thread(self.refresh, name)
+                except Exception as e:
+                    print(f"{name} token refresh failed: {e}")
+                    await asyncio.sleep(RETRY_DELAY)
@@ -1,51 +1,177 @@
-import requests
-import json
-from sqlalchemy import insert, select
-from database import engine
+import asyncio
+import bootstrap
+from datetime import datetime, timezone
 from models import Viewership
 from environment import env
+from helix import helix, PAGE_SIZE
+from write_behind import WriteBehindQueue
+
+# seconds between samples
+SAMPLE_INTERVAL = 60
+
+# samples are written once this many rounds are waiting, so a batch covers several minutes
+FLUSH_EVERY = 5
+
+DATAPOINTS = [
+    "title",
+    "game_id",
+    "game_name",
+    "viewer_count"
+]
+
+
+# viewer counts of one stream so far, updated as samples come in
+class RunningStats():
+    __slots__ = ("stream_id", "channel", "started", "last", "samples", "total", "peak", "low",
+                 "title", "game_name")
+
+    def __init__(self, stream_id: str, channel: str, time: datetime):
+        self.stream_id = stream_id
+        self.channel = channel
+        self.started = time
+        self.last = time
+        self.samples = 0
+        self.total = 0
+        self.peak = 0
+        self.low = None
+        self.title = None
+        self.game_name = None
+
+
+    def add(self, time: datetime, viewers: int, title: str, game_name: str) -> None:
+        self.last = time
+        self.samples += 1
+        self.total += viewers
+        self.peak = max(self.peak, viewers)
+        self.low = viewers if self.low is None else min(self.low, viewers)
+        self.title = title
+        self.game_name = game_name
+
+
+    @property
+    def average(self) -> float:
+        return self.total / self.samples if self.samples else 0.0
+
+
+    def as_dict(self) -> dict:
+        return {
+            "stream_id": self.stream_id,
+            "channel": self.channel,
+            "started": self.started,
+            "last": self.last,
+            "samples": self.samples,
+            "avg_viewers": self.average,
+            "peak_viewers": self.peak,
+            "low_viewers": self.low,
+            "title": self.title,
+            "game_name": self.game_name,
+        }
+
+
+# get stream data from Twitch for every live channel, one request per 100 channels
+# Helix takes at most 100 user_login values, and first can't go above 100 either
+async def get_stream_data(channels: list, client=helix) -> dict:
+    chunks = [channels[i:i + PAGE_SIZE] for i in range(0, len(channels), PAGE_SIZE)]
+    responses = await asyncio.gather(*(
+        client.get("streams", {"user_login": chunk, "first": len(chunk)}) for chunk in chunks
+    ))
+    return {stream["user_login"].lower(): stream for response in responses for stream in response["data"]}
+
+
+# samples viewer counts for each channel every minute
+# rows are buffered and written in batches; a channel that's offline gets a row with no stream
+class ViewershipSampler():
+    def __init__(self, channels: list = None, client=helix, flush_every:int = FLUSH_EVERY):
+        self.channels = channels
+        self.client = client
+        # its own queue, flushed every flush_every rounds rather than on the chat writer's schedule
+        self.queue = WriteBehindQueue()
+        self.flush_every = flush_every
+        self.rounds = 0
+
+        # channels that were live at the last sample
+        self.live = set()
+
+        # stats for the stream each channel is running, and the last one each channel finished
+        self.streams = {}
+        self.finished = {}
+
+
+    def is_live(self) -> bool:
+        return bool(self.live)
+
+
+    def record(self, channel: str, time: datetime, data: dict = None) -> None:
+        # every row has the same keys, so a batch is one executemany
+        entry = {"channel": channel, "time": time, "stream_id": None, **dict.fromkeys(DATAPOINTS)}
+        if data is None:
+            entry["viewer_count"] = 0
+            self.queue.add(Viewership, entry)
+
+            # the stream ended since the last sample
+            stats = self.streams.pop(channel, None)
+            if stats is not None:
+                self.finished[channel] = stats
+            return
+
+        entry.update({k:data[k] for k in DATAPOINTS})
+        entry["stream_id"] = data["id"]
+        self.queue.add(Viewership, entry)
+
+        stats = self.streams.get(channel)
+        if stats is None or stats.stream_id != data["id"]:
+            if stats is not None:
+                self.finished[channel] = stats
+            stats = self.streams[channel] = RunningStats(data["id"], channel, time)
+        stats.add(time, data["viewer_count"], data["title"], data["game_name"])
+
+
+    # sample every channel once, writing the buffered rows when enough rounds are waiting
+    async def sample(self) -> set:
+        channels = [c.lower() for c in self.channels or env.channels]
+        streams = await get_stream_data(channels, self.client)
+
+        # the time of the sample, not of the insert, since rows wait in the buffer
+        now = datetime.now(timezone.utc)
+        for channel in channels:
+            self.record(channel, now, streams.get(channel))
+
+        self.live = set(streams)
+        self.rounds += 1
+        if self.rounds % self.flush_every == 0:
+            await self.queue.flush()
+        return self.live
+
+
+    # stats for the channel's current stream, or None while it's offline
+    def current(self, channel: str) -> dict:
+        stats = self.streams.get(channel.lower())
+        return stats.as_dict() if stats is not None else None
+
+
+    # write whatever is buffered; call on shutdown
+    async def close(self) -> None:
+        await self.queue.close()
+
+
+sampler = ViewershipSampler()
+
+
+def is_live() -> bool:
+    return sampler.is_live()
+
+
+# sample once; the bot samples every minute through its scheduler
+async def sample_once() -> set:
+    live = await sampler.sample()
+    await sampler.close()
+    return live
+
 
-# get stream data from Twitch
-def get_stream_data(env=env) -> dict:
-    url = "https://api.twitch.tv/helix/streams"
-    headers = {
-        "Authorization": f"Bearer {env.get_bearer()}",
-        "Client-Id": env.client_id
-    }
-    params = {"user_id": env.user_id}
-    response = requests.get(url=url, headers=headers, params=params).json()
-    data = response["data"][0]
-    return data
-
-
-# write stream data to db
-def write_stream_data(entry: dict) -> None:
-    engine.execute(
-        insert(Viewership)
-        .values(entry)
-    )
-    result = engine.execute(
-        select(Viewership)
-    ).fetchall()
-
-
-# once per minute
 def main():
-    # get data
-    data = get_stream_data()
-    datapoints = [
-        "title",
-        "game_id",
-        "game_name",
-        "viewer_count"
-    ]
-    entry = {k:data[k] for k in datapoints}
-    entry["stream_id"] = data["id"]
-    
-    # write data
-    write_stream_data(entry)
+    bootstrap.run()
+    asyncio.run(sample_once())
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,195 @@
+import asyncio
+from collections import deque
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, InterfaceError
+from database import engine
+
+# flush once this many rows are waiting
+FLUSH_SIZE = 500
+
+# or once this many seconds have passed
+FLUSH_INTERVAL = 2.0
+
+# rows held in memory before the oldest are dropped
+MAX_BACKLOG = 50000
+
+# rows the database refused, kept for inspection
+MAX_DEAD_LETTERS = 1000
+
+# flushes tried on shutdown while the database is unreachable, and the first wait between them in seconds
+CLOSE_ATTEMPTS = 4
+CLOSE_BACKOFF = 0.5
+
+
+# the database is down or the connection dropped; the same rows will go through later
+# anything else, like a constraint or type error, comes from the rows and fails the same way every time
+def is_transient(error: Exception) -> bool:
+    return isinstance(error, (OperationalError, InterfaceError)) or getattr(error, "connection_invalidated", False)
+
+
+# the driver's message, without sqlalchemy's dump of the statement and every row in the batch
+def describe(error: Exception) -> str:
+    return str(getattr(error, "orig", None) or error).strip()
+
+
+# buffers rows for insert-only tables and writes them in bulk
+# one executemany per table replaces a round-trip per chat line
+class WriteBehindQueue():
+    def __init__(self, engine=engine, flush_size:int = FLUSH_SIZE, flush_interval:float = FLUSH_INTERVAL,
+                max_backlog:int = MAX_BACKLOG):
+        self.engine = engine
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.backlog = deque(maxlen=max_backlog)
+
+        # (table, row, error) for rows the database refused
+        self.dead_letters = deque(maxlen=MAX_DEAD_LETTERS)
+
+        # counters for monitoring
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+
+        # created inside the running event loop
+        self.wakeup = None
+        self.lock = None
+
+
+    def __len__(self):
+        return len(self.backlog)
+
+
+    # queue a row for insertion into the model's table
+    def add(self, model, entry: dict) -> None:
+        if len(self.backlog) == self.backlog.maxlen:
+            self.dropped += 1
+        self.backlog.append((model, entry))
+
+        if len(self.backlog) >= self.flush_size and self.wakeup is not None:
+            self.wakeup.set()
+
+
+    # remove everything queued so far, grouped by model
+    def take(self) -> dict:
+        batches = {}
+        for _ in range(len(self.backlog)):
+            model, entry = self.backlog.popleft()
+            batches.setdefault(model, []).append(entry)
+        return batches
+
+
+    # write batches in one transaction; executemany per table
+    def write(self, batches: dict) -> None:
+        with self.engine.begin() as conn:
+            for model, rows in batches.items():
+                conn.execute(insert(model), rows)
+
+
+    # write each table's rows on their own, halving any batch that's refused until the rows at fault are found
+    # those are dead-lettered; returns (rows written, batches to retry if the database went away partway)
+    def write_isolated(self, batches: dict) -> tuple:
+        written = 0
+        retry = {}
+        for model, rows in batches.items():
+            # taken from the end; halves are pushed second half first so rows keep their order
+            pending = [rows]
+            while pending:
+                chunk = pending.pop()
+                if retry:
+                    retry.setdefault(model, []).extend(chunk)
+                    continue
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(insert(model), chunk)
+                    written += len(chunk)
+                except Exception as e:
+                    if is_transient(e):
+                        retry.setdefault(model, []).extend(chunk)
+                    elif len(chunk) == 1:
+                        self.dead_letter(model, chunk[0], e)
+                    else:
+                        middle = len(chunk) // 2
+                        pending += [chunk[middle:], chunk[:middle]]
+        return written, retry
+
+
+    def dead_letter(self, model, entry: dict, error: Exception) -> None:
+        self.rejected += 1
+        self.dead_letters.append((model.__tablename__, entry, describe(error)))
+        print(f"dropped a row the database refused for {model.__tablename__}: {entry}: {describe(error)}")
+
+
+    # put rows back at the front of the queue after a failed write
+    def requeue(self, batches: dict) -> None:
+        rows = [(model, entry) for model, entries in batches.items() for entry in entries]
+        room = self.backlog.maxlen - len(self.backlog)
+        self.dropped += max(len(rows) - room, 0)
+        for row in reversed(rows[:room]):
+            self.backlog.appendleft(row)
+
+
+    # held while flushing; readers that need the db and queue to agree can hold it too
+    def get_lock(self) -> asyncio.Lock:
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        return self.lock
+
+
+    async def flush(self) -> None:
+        async with self.get_lock():
+            await self.write_pending()
+
+
+    # write everything queued; the caller must hold the lock
+    # returns False if rows were put back for a later flush, True once nothing taken is left over
+    async def write_pending(self) -> bool:
+        batches = self.take()
+        if not batches:
+            return True
+
+        retry = None
+        try:
+            await asyncio.to_thread(self.write, batches)
+            written = sum(len(rows) for rows in batches.values())
+        except Exception as e:
+            if is_transient(e):
+                print(f"write-behind flush failed, retrying later: {describe(e)}")
+                self.requeue(batches)
+                return False
+
+            # one bad row would fail the whole batch on every retry, holding up everything behind it
+            print(f"write-behind flush refused, finding the rows at fault: {describe(e)}")
+            written, retry = await asyncio.to_thread(self.write_isolated, batches)
+            if retry:
+                self.requeue(retry)
+
+        self.flushes += 1
+        self.written += written
+        return not retry
+
+
+    # flush whenever the size or time threshold is reached
+    async def run(self) -> None:
+        self.wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+
+    # write whatever is left; call on shutdown
+    # retried while the database is unreachable, then whatever couldn't be written is reported
+    async def close(self, attempts:int = CLOSE_ATTEMPTS, backoff:float = CLOSE_BACKOFF) -> None:
+        for attempt in range(attempts):
+            async with self.get_lock():
+                if await self.write_pending():
+                    break
+            if attempt < attempts - 1:
+                await asyncio.sleep(backoff * 2 ** attempt)
+
+        if self.backlog or self.dropped:
+            print(f"write-behind closed with {len(self.backlog)} rows unwritten and {self.dropped} dropped")